@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_remove_singleusecode_created_by_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='email_delivery',
+            field=models.CharField(choices=[('I', 'Immediate'), ('D', 'Digest')], default='I', help_text='Receive an email per notification, or a periodic digest of all of them.', max_length=1, verbose_name='Email Notification Delivery'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:23
+
+from django.db import migrations, models
+
+from core.utils import normalize_label
+
+
+def fill_labels(apps, schema_editor):
+    User = apps.get_model("accounts", "User")
+
+    last_pk = 0
+    while users := list(User.objects.filter(pk__gt=last_pk).order_by("pk")[:1000]):
+        for user in users:
+            # `User.get_label()`
+            user.label = f"{user.first_name} {user.last_name}".strip() or user.email
+            user.normalized_label = normalize_label(user.label)
+        User.objects.bulk_update(users, ["label", "normalized_label"])
+        last_pk = users[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_user_email_delivery'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='label',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='normalized_label',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['normalized_label'], name='accounts_user_label_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(fill_labels, migrations.RunPython.noop),
+    ]
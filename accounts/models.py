@@ -1,12 +1,16 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
-from core.mixins import TimestampMixin
+from core.mixins import TimestampMixin, LabelMixin
 
 from .managers import UserManager
 
 
-class User(AbstractUser, TimestampMixin):
+class User(LabelMixin, AbstractUser, TimestampMixin):
+
+    class EmailDelivery(models.TextChoices):
+        IMMEDIATE = "I", "Immediate"
+        DIGEST = "D", "Digest"
 
     username = None
     email = models.EmailField(
@@ -16,15 +20,32 @@ class User(AbstractUser, TimestampMixin):
         error_messages={"unique": "A user with that email already exists."},
     )
     email_notification = models.BooleanField(verbose_name="Receive Email Notification", default=True)
+    email_delivery = models.CharField(
+        verbose_name="Email Notification Delivery",
+        max_length=1,
+        choices=EmailDelivery,
+        default=EmailDelivery.IMMEDIATE,
+        help_text="Receive an email per notification, or a periodic digest of all of them.",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
+    class Meta(AbstractUser.Meta):
+        # Typeahead of the user dropdown
+        indexes = [
+            models.Index(fields=["normalized_label"], name="accounts_user_label_idx", opclasses=["varchar_pattern_ops"])
+        ]
+
     def __str__(self):
         return self.full_name if self.full_name else self.email
 
+    def get_label(self):
+        # Users without a name are labelled by their email
+        return self.full_name.strip() or self.email
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
@@ -35,4 +56,8 @@ class User(AbstractUser, TimestampMixin):
             return self.first_name[0].upper() + self.last_name[0].upper()
         return "__"
 
+    @property
+    def receives_digest(self):
+        return self.email_notification and self.email_delivery == self.EmailDelivery.DIGEST
+
     objects = UserManager()
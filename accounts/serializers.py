@@ -29,6 +29,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 
 class UserDropdownSerializer(DropdownModelSerializer):
+    label_expression = "label"
 
     class Meta:
         model = User
@@ -37,7 +38,13 @@ class UserDropdownSerializer(DropdownModelSerializer):
 class CustomUserSerializer(DjoserUserSerializer):
 
     class Meta(DjoserUserSerializer.Meta):
-        fields = DjoserUserSerializer.Meta.fields + ("first_name", "last_name", "initials", "email_notification")
+        fields = DjoserUserSerializer.Meta.fields + (
+            "first_name",
+            "last_name",
+            "initials",
+            "email_notification",
+            "email_delivery",
+        )
 
 
 class CustomSendEmailResetSerializer(SendEmailResetSerializer):
@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.tokens import default_token_generator
+from django.apps import apps
 
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.viewsets import ReadOnlyModelViewSet, GenericViewSet
@@ -10,15 +11,20 @@ from rest_framework import status
 from djoser.serializers import UidAndTokenSerializer
 from djoser.utils import decode_uid
 
+from core.mixins import CachedListMixin, TypeaheadMixin
+
 from accounts.models import User
 from accounts.serializers import UserDropdownSerializer
 
 
-class UserDropdownViewSet(ReadOnlyModelViewSet):
+class UserDropdownViewSet(CachedListMixin, TypeaheadMixin, ReadOnlyModelViewSet):
 
-    queryset = User.objects.all()
+    queryset = User.objects.only("id", "label")
     serializer_class = UserDropdownSerializer
     permission_classes = [IsAuthenticated]
+    typeahead_filters = {"domain": "domain_membership"}
+    # Memberships invalidate the domains
+    cached_list_dependencies = (apps.get_model("pm", "domain"),)
 
 
 class TokenValidationViewSet(GenericViewSet):
@@ -0,0 +1,137 @@
+"""
+Helpers for Django's cache framework.
+
+Keys are grouped in namespaces, each with a version stored in the cache itself:
+`<namespace>:<version>:<key>`. Invalidating a namespace replaces its version,
+which makes all its keys unreachable at once, whatever the cache backend.
+Unreachable entries are evicted once they expire. Versions are the time of the
+invalidation in nanoseconds, so they also tell when a namespace last changed.
+
+Namespaces of models are invalidated whenever one of their instances is saved
+or deleted, see `invalidate_on_change()`. Bulk operations (`update()`,
+`bulk_create()`) do not send signals and must call `invalidate()` themselves.
+"""
+
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.core.cache import cache
+from django.db import transaction
+
+from datetime import datetime, timezone
+import time
+
+
+def get_model_namespace(model):
+    return model._meta.label_lower
+
+
+def get_version_key(namespace):
+    return f"{namespace}:version"
+
+
+def new_version():
+    return time.time_ns()
+
+
+def get_version(namespace):
+    # A missing version gets a new one, so that no stale entry can be read
+    return cache.get_or_set(get_version_key(namespace), new_version, timeout=None)
+
+
+def get_versions(*namespaces):
+    """
+    Return the versions of the given namespaces, keyed by namespace, in one round trip.
+    """
+    keys = {get_version_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(keys)
+
+    missing = {key: new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+
+    return {namespace: found[key] for key, namespace in keys.items()}
+
+
+def get_version_time(version):
+    """
+    Return the time a namespace was last invalidated, from its version.
+    """
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+
+
+def make_key(namespace, key):
+    return f"{namespace}:{get_version(namespace)}:{key}"
+
+
+def get(namespace, key, default=None):
+    return cache.get(make_key(namespace, key), default)
+
+
+def set(namespace, key, value, timeout=None):
+    """
+    Store `value` for `timeout` seconds, or for the default timeout of the cache.
+    """
+    if timeout is None:
+        cache.set(make_key(namespace, key), value)
+    else:
+        cache.set(make_key(namespace, key), value, timeout)
+
+
+def get_or_set(namespace, key, default, timeout=None):
+    """
+    Return the cached value, or store and return `default()` if there is none.
+    """
+    full_key = make_key(namespace, key)
+    value = cache.get(full_key)
+    if value is None:
+        value = default()
+        if timeout is None:
+            cache.set(full_key, value)
+        else:
+            cache.set(full_key, value, timeout)
+    return value
+
+
+def invalidate(*namespaces):
+    """
+    Discard all the keys of the given namespaces, now and once the current
+    transaction is committed, in case another request cached the data that was
+    about to change in the meantime.
+    """
+
+    def replace_versions():
+        cache.set_many({get_version_key(namespace): new_version() for namespace in namespaces}, timeout=None)
+
+    if namespaces:
+        replace_versions()
+        transaction.on_commit(replace_versions)
+
+
+def invalidate_model(sender, **kwargs):
+    invalidate(get_model_namespace(sender))
+
+
+def invalidate_on_change(*models, ignored_fields=()):
+    """
+    Invalidate the namespace of each model whenever one of its instances is
+    saved or deleted, or its many-to-many relations change. Saves limited to
+    `ignored_fields` (e.g. `last_login` on every login) keep the namespace.
+    """
+    ignored_fields = frozenset(ignored_fields)
+
+    def invalidate_saved(sender, update_fields=None, **kwargs):
+        if not update_fields or not ignored_fields.issuperset(update_fields):
+            invalidate_model(sender)
+
+    for model in models:
+        uid = f"core.cache:{get_model_namespace(model)}"
+        post_save.connect(invalidate_saved, sender=model, dispatch_uid=uid, weak=False)
+        post_delete.connect(invalidate_model, sender=model, dispatch_uid=uid)
+        for field in model._meta.local_many_to_many:
+            # `m2m_changed` passes the related model as `model`
+            m2m_changed.connect(
+                lambda sender, namespace=get_model_namespace(model), **kwargs: invalidate(namespace),
+                sender=field.remote_field.through,
+                dispatch_uid=f"{uid}:{field.name}",
+                weak=False,
+            )
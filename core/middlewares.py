@@ -1,3 +1,4 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpResponse
 
 
@@ -6,15 +7,32 @@ class HealthCheckMiddleware:
     Middleware to handle AWS EB health checks
     """
 
+    # Keep the middleware chain asynchronous under ASGI
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def is_health_check(self, request):
+        return request.method == "GET" and request.path == "/"
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
         # Return a simple OK response for the health check
-        if request.method == "GET" and request.path == "/":
+        if self.is_health_check(request):
             return HttpResponse("OK")
 
         # For all other requests, continue the normal process
         response = self.get_response(request)
 
         return response
+
+    async def __acall__(self, request):
+        if self.is_health_check(request):
+            return HttpResponse("OK")
+        return await self.get_response(request)
@@ -1,5 +1,19 @@
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils import timezone
+from django.db.models import Max, Count
 from django.db import models
+from django.conf import settings
+
+from rest_framework.exceptions import ValidationError
 from rest_framework import serializers
+from rest_framework.response import Response
+
+from core.utils import normalize_label
+from core import cache
+
+from datetime import datetime
+import hashlib
 
 
 class TimestampMixin(models.Model):
@@ -15,15 +29,72 @@ class TimestampMixin(models.Model):
         abstract = True
 
 
+class LabelMixin(models.Model):
+    """
+    Label of an instance in the dropdowns, stored along with its normalized form
+    matched by their typeahead, see `TypeaheadMixin`. Both are computed on save,
+    models override `get_label()` to change them.
+
+    Concrete models should index `normalized_label` for prefix lookups, with the
+    `varchar_pattern_ops` operator class on PostgreSQL.
+    """
+
+    label = models.CharField(max_length=255, editable=False, default="")
+    normalized_label = models.CharField(max_length=255, editable=False, default="")
+
+    class Meta:
+        abstract = True
+
+    def get_label(self):
+        return str(self)
+
+    def set_label(self):
+        """
+        Compute the labels, which `bulk_create()` does not.
+        """
+        self.label = self.get_label()[:255]
+        self.normalized_label = normalize_label(self.label)[:255]
+
+    def save(self, *args, **kwargs):
+        # Deferred labels are not read, and count as changed
+        previous = (self.__dict__.get("label"), self.__dict__.get("normalized_label"))
+        self.set_label()
+        # Partial saves (e.g. of `last_login`) only write the labels when they changed
+        if kwargs.get("update_fields") is not None and (self.label, self.normalized_label) != previous:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "label", "normalized_label"}
+        super().save(*args, **kwargs)
+
+
+class DropdownListSerializer(serializers.ListSerializer):
+    """
+    List of dropdown options. Querysets are read with `values_list()` when the
+    child serializer declares its `label_expression`, building the options from
+    the value and label columns without instantiating the models.
+    """
+
+    def to_representation(self, data):
+        label_expression = self.child.label_expression
+        if label_expression is None or not isinstance(data, models.QuerySet):
+            return super().to_representation(data)
+
+        rows = data.values_list(self.child.value_expression, label_expression)
+        return [{"value": value, "label": label} for value, label in rows]
+
+
 class DropdownModelSerializer(serializers.ModelSerializer):
     """
-    Base serializer for model-based dropdowns.
-    Automatically configures fields for dropdown usage.
-    Override `get_value` and `get_label` methods to customize dropdown options.
+    Base serializer for model-based dropdowns, returning `value` and `label`.
+
+    Lists of options are read with `values_list()` when `label_expression` is
+    set, a field name or a query expression computing the label in the database,
+    along with `value_expression`. Otherwise, override `get_value` and
+    `get_label` to customize the options built from the instances.
 
     For example:
     ```
     class UserDropdownSerializer(DropdownModelSerializer):
+        label_expression = Concat("name", Value(" ("), "email", Value(")"))
+
         class Meta:
             model = User
 
@@ -36,10 +107,17 @@ class DropdownModelSerializer(serializers.ModelSerializer):
     value = serializers.SerializerMethodField()
     label = serializers.SerializerMethodField()
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Override Meta fields to ensure only value and label are returned
-        self.Meta.fields = ("value", "label")
+    value_expression = "pk"
+    label_expression = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        # Subclasses declare their own `Meta`, without a `list_serializer_class`
+        return DropdownListSerializer(*args, child=cls(), **kwargs)
+
+    def get_field_names(self, declared_fields, info):
+        # Only value and label are returned, whatever the `Meta` of the subclass
+        return ("value", "label")
 
     def get_value(self, instance):
         """Return the value to be used when option is selected"""
@@ -47,4 +125,143 @@ class DropdownModelSerializer(serializers.ModelSerializer):
 
     def get_label(self, instance):
         """Return the label to be displayed in dropdown"""
+        if isinstance(instance, LabelMixin):
+            # Precomputed on save
+            return instance.label
         return str(instance)
+
+
+class CachedListMixin:
+    """
+    Cache the response of the `list` action of a viewset in the namespace of its
+    model, keyed by the full path of the request, for `LIST_CACHE_TIMEOUT` seconds.
+
+    The namespace is invalidated when an instance of the model is saved or deleted,
+    see `core.cache.invalidate_on_change()`. The cached response must not depend
+    on the current user. Responses also depending on other models, through their
+    filters, list them in `cached_list_dependencies`.
+    """
+
+    cached_list_dependencies = ()
+
+    def list(self, request, *args, **kwargs):
+        namespace = cache.get_model_namespace(self.queryset.model)
+        key = f"list:{request.get_full_path()}"
+        if self.cached_list_dependencies:
+            versions = cache.get_versions(*map(cache.get_model_namespace, self.cached_list_dependencies))
+            key += ":" + ":".join(str(version) for version in versions.values())
+
+        data = cache.get(namespace, key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            data = response.data
+            cache.set(namespace, key, data, settings.LIST_CACHE_TIMEOUT)
+
+        return Response(data)
+
+
+class TypeaheadMixin:
+    """
+    Typeahead mode of the dropdown lists of `LabelMixin` models: `q` keeps the
+    options whose normalized label starts with it, and `limit` the number of
+    options, `DEFAULT_TYPEAHEAD_LIMIT` when searching.
+
+    `typeahead_filters` maps query parameters to the lookups scoping the options
+    to a parent, e.g. `{"domain": "domain"}`.
+    """
+
+    typeahead_filters = {}
+    DEFAULT_TYPEAHEAD_LIMIT = 20
+    MAX_TYPEAHEAD_LIMIT = 100
+
+    def get_int_param(self, name, default=None):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({name: "A valid integer is required."})
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+
+        for param, lookup in self.typeahead_filters.items():
+            value = self.get_int_param(param)
+            if value is not None:
+                queryset = queryset.filter(**{lookup: value})
+
+        query = self.request.query_params.get("q")
+        limit = self.get_int_param("limit", self.DEFAULT_TYPEAHEAD_LIMIT if query else None)
+
+        if query:
+            queryset = queryset.filter(normalized_label__startswith=normalize_label(query))
+        if limit is not None:
+            queryset = queryset.order_by("normalized_label", "pk")[: min(max(limit, 1), self.MAX_TYPEAHEAD_LIMIT)]
+        return queryset
+
+
+class ConditionalListMixin:
+    """
+    Answer conditional requests (`If-None-Match`, `If-Modified-Since`) to the
+    `list` action of a viewset with 304 Not Modified, without serializing the rows.
+
+    The validators are derived from the filtered queryset with one aggregate
+    query (the latest `last_modified_field` and the number of rows), along with
+    the versions of the namespaces of `get_conditional_namespaces()` in
+    `core.cache`, for the changes of related rows and the deleted rows, which
+    only the number of rows would reflect otherwise. Lists whose rows depend on
+    the date (overdue items) change every day.
+    """
+
+    last_modified_field = "updated_at"
+    # Namespaces of `core.cache` invalidated by changes affecting the rows
+    conditional_namespaces = ()
+
+    def get_conditional_namespaces(self):
+        return self.conditional_namespaces
+
+    def get_validators(self, queryset):
+        """
+        Return the ETag and the last modification time of the response listing `queryset`.
+        """
+        stats = queryset.order_by().aggregate(last_modified=Max(self.last_modified_field), count=Count("pk"))
+        versions = cache.get_versions(*self.get_conditional_namespaces())
+
+        today = timezone.localdate()
+        start_of_today = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        times = [start_of_today] + [cache.get_version_time(version) for version in versions.values()]
+        if stats["last_modified"] is not None:
+            times.append(stats["last_modified"])
+
+        # The same URL lists different rows for each user
+        key = (self.request.user.pk, self.request.get_full_path(), stats, sorted(versions.items()), today)
+        etag = f'"{hashlib.md5(repr(key).encode()).hexdigest()}"'
+        return etag, max(times)
+
+    def get_conditional_list_response(self, queryset, get_response):
+        """
+        Return 304 Not Modified if the client has the current version of the list
+        of `queryset`, otherwise the response returned by `get_response()`.
+        """
+        if self.request.method not in ("GET", "HEAD"):
+            return get_response()
+
+        etag, last_modified = self.get_validators(queryset)
+        response = get_conditional_response(self.request, etag=etag, last_modified=int(last_modified.timestamp()))
+        if response is None:
+            response = get_response()
+            if response.status_code != 200:
+                return response
+
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+        patch_vary_headers(response, ["Authorization"])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        parent = super()
+        return self.get_conditional_list_response(queryset, lambda: parent.list(request, *args, **kwargs))
@@ -0,0 +1,102 @@
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+class FeedCursorPagination(CursorPagination):
+    """
+    Keyset pagination on `(created_at, id)`, newest first.
+
+    Pages are fetched with an indexed range scan, without counting the rows or
+    skipping over the previous pages, so they take the same time however long
+    the feed grows.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class FeedPageNumberPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "count": self.page.paginator.count,
+                "num_pages": self.page.paginator.num_pages,
+                "number": self.page.number,
+                "next": self.page.next_page_number() if self.page.has_next() else None,
+                "previous": self.page.previous_page_number() if self.page.has_previous() else None,
+                "results": data,
+            }
+        )
+
+
+class ItemPagination(FeedPageNumberPagination):
+    """
+    Page number pagination of the projects, tasks and subtasks lists.
+    """
+
+    page_size = 50
+    max_page_size = 200
+
+
+class FeedPagination(BasePagination):
+    """
+    Cursor pagination by default (`?cursor=`), or page number pagination when
+    the `page` query parameter is given (`?page=`), for the clients relying on
+    the page count.
+    """
+
+    cursor_class = FeedCursorPagination
+    page_number_class = FeedPageNumberPagination
+
+    def __init__(self):
+        self.paginator = self.cursor_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_number_class.page_query_param in request.query_params:
+            self.paginator = self.page_number_class()
+        else:
+            self.paginator = self.cursor_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return self.cursor_class().get_schema_operation_parameters(view) + [
+            parameter
+            for parameter in self.page_number_class().get_schema_operation_parameters(view)
+            if parameter["name"] == self.page_number_class.page_query_param
+        ]
+
+    @property
+    def display_page_controls(self):
+        return self.paginator.display_page_controls
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+
+class OptionalFeedPagination(FeedPagination):
+    """
+    `FeedPagination` only when a page is asked for, with `?cursor=`, `?page=`
+    or `?page_size=`, for the lists that were returned in full before.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = (
+            self.cursor_class.cursor_query_param,
+            self.cursor_class.page_size_query_param,
+            self.page_number_class.page_query_param,
+        )
+        if not any(param in request.query_params for param in params):
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -199,8 +199,49 @@ STATIC_ROOT = BASE_DIR / "static"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "pm",
+    }
+}
+
+# Seconds the responses of the read-mostly lists (`options/*`) are cached,
+# they are invalidated as soon as their rows change
+LIST_CACHE_TIMEOUT = 60 * 60 * 24
+
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "noreply@pm.com")
 
+# Notification emails are queued in an outbox and sent by the `send_queued_emails` command
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_WORKERS = 8
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+# Delay in seconds before retrying a failed email, doubled after each attempt
+EMAIL_OUTBOX_RETRY_DELAY = 60
+# Time in seconds a worker has to send a claimed email before another worker may claim it
+EMAIL_OUTBOX_LEASE = 300
+# Seconds between two digests for users receiving their notifications as a digest
+NOTIFICATION_DIGEST_WINDOW = 60 * 60
+# Seconds between two checks for the notifications created by other processes,
+# for the users connected to the notification events stream of this process
+NOTIFICATION_EVENTS_POLL_INTERVAL = 10
+# Seconds between two comments sent on an idle notification events stream
+NOTIFICATION_EVENTS_KEEPALIVE = 25
+# Seconds a ticket opening a notification events stream is valid for
+NOTIFICATION_EVENTS_TICKET_TIMEOUT = 30
+# Seconds of notifications read again by the streams, for the transactions committed late
+NOTIFICATION_EVENTS_OVERLAP = 60
+# Days viewed notifications are kept, see the `cleanup_notifications` command
+NOTIFICATION_RETENTION_DAYS = 90
+# Days activities stay in the table before the `archive_activities` command moves them to the storage
+ACTIVITY_ARCHIVE_DAYS = 365
+# Items created, updated or archived by a single request to the `bulk` endpoints of the tasks and subtasks
+BULK_MAX_ITEMS = 500
+
 UNFOLD = {
     "ENVIRONMENT": "core.utils.environment_callback",
 }
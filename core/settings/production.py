@@ -1,3 +1,5 @@
+from django.core.exceptions import ImproperlyConfigured
+
 from .base import *
 
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "").split(",")
@@ -29,6 +31,21 @@ DATABASES = {
     }
 }
 
+# Cache shared by all the instances, a Redis-compatible server at `CACHE_REDIS_URL`.
+# `core.cache.invalidate()` only reaches the instances sharing the backend, so a
+# per-instance cache would serve stale options, ETags and domain memberships.
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+if not os.getenv("CACHE_REDIS_URL"):
+    raise ImproperlyConfigured("CACHE_REDIS_URL must be set to a cache shared by all the instances.")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_REDIS_URL"),
+        "KEY_PREFIX": "pm",
+    }
+}
+
 # django-storages 1.14.2 documentation » Amazon S3
 # This backend implements the Django File Storage API for Amazon Web Services’s (AWS) Simple Storage Service (S3).
 
@@ -50,6 +67,11 @@ EMAIL_BACKEND = "notifications.email_backends.SesEmailBackend"
 AWS_SES_REGION_NAME = os.getenv("AWS_SES_REGION_NAME")
 AWS_SES_ACCESS_KEY = os.getenv("AWS_SES_ACCESS_KEY")
 AWS_SES_SECRET_KEY = os.getenv("AWS_SES_SECRET_KEY")
+# Number of threads sending a batch of emails concurrently
+AWS_SES_MAX_WORKERS = int(os.getenv("AWS_SES_MAX_WORKERS", 10))
+# Maximum number of emails sent per second by all the instances together, counted in the shared cache,
+# matching the SES account sending rate
+AWS_SES_MAX_SEND_RATE = float(os.getenv("AWS_SES_MAX_SEND_RATE", 14))
 
 
 # CORS headers allows resources to be accessed from other domains
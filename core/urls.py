@@ -25,9 +25,9 @@ from accounts.views import UserDropdownViewSet, TokenValidationViewSet
 from pm.views import ProjectViewSet, TaskViewSet, SubtaskViewSet
 from pm.views import CommentViewSet, AttachmentViewSet, ActivityViewSet
 from pm.views import DomainDropdownViewSet, ProjectDropdownViewSet, TaskDropdownViewSet
-from pm.views import PriorityDropdownViewSet, StatusDropdownViewSet
+from pm.views import PriorityDropdownViewSet, StatusDropdownViewSet, SyncViewSet, SearchViewSet
 
-from notifications.views import NotificationViewSet
+from notifications.views import NotificationViewSet, notification_events
 from todo.views import TodoViewSet
 
 admin.site.site_header = "PM Admin"
@@ -50,10 +50,14 @@ router.register(r"comments", CommentViewSet)
 router.register(r"attachments", AttachmentViewSet)
 router.register(r"activities", ActivityViewSet)
 router.register(r"notifications", NotificationViewSet)
+router.register(r"sync", SyncViewSet, basename="sync")
+router.register(r"search", SearchViewSet, basename="search")
 router.register(r"todos", TodoViewSet, basename="todo")
 
 
 urlpatterns = [
+    # Before the router, which would take "events" for a notification id
+    path("api/notifications/events/", notification_events, name="notification-events"),
     path("api/", include(router.urls)),
     path("api/auth/", include("djoser.urls")),
     path("api/auth/", include("djoser.urls.jwt")),
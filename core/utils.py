@@ -3,7 +3,11 @@ from django.utils.html import avoid_wrapping
 from django.utils import timezone, formats
 from django.conf import settings
 
+from collections import OrderedDict
+import unicodedata
+import threading
 import logging
+import time
 import os
 
 
@@ -68,3 +72,62 @@ def environment_callback(request):
     if settings.DEBUG:
         return [f"Development ({version})", "success"]
     return [f"Production ({version})", "danger"]
+
+
+def normalize_label(value):
+    """
+    Return `value` without case, accents and repeated spaces, as matched by the
+    typeahead of the dropdowns.
+    """
+    value = unicodedata.normalize("NFKD", value.casefold())
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(value.split())
+
+
+class LRUCache:
+    """
+    Small thread-safe in-process cache keeping the `maxsize` most recently used
+    entries, each for at most `timeout` seconds.
+    """
+
+    def __init__(self, maxsize=1024, timeout=300):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        """
+        Return a dict of the given keys found in the cache.
+        """
+        now = time.monotonic()
+        found = {}
+        with self.lock:
+            for key in keys:
+                entry = self.data.get(key)
+                if entry is None:
+                    continue
+                value, expires_at = entry
+                if expires_at < now:
+                    del self.data[key]
+                    continue
+                self.data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, items):
+        expires_at = time.monotonic() + self.timeout
+        with self.lock:
+            for key, value in items.items():
+                self.data[key] = (value, expires_at)
+                self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
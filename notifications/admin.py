@@ -1,7 +1,7 @@
 from django.contrib import admin
 from unfold.admin import ModelAdmin
 
-from notifications.models import Notification, Category, EmailLog
+from notifications.models import Notification, Category, EmailLog, OutboxEmail, UnreadCounter
 
 
 class ReadOnlyAdmin(ModelAdmin):
@@ -25,6 +25,17 @@ class EmailLogAdmin(ReadOnlyAdmin):
     list_display = ["email", "subject", "status", "description", "created_at"]
 
 
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(ReadOnlyAdmin):
+    list_display = ["email", "subject", "status", "attempts", "next_attempt_at", "sent_at"]
+    list_filter = ["status"]
+
+
+@admin.register(UnreadCounter)
+class UnreadCounterAdmin(ReadOnlyAdmin):
+    list_display = ["user", "count"]
+
+
 @admin.register(Category)
 class CategoryAdmin(ModelAdmin):
     list_display = ["content_type", "action"]
@@ -0,0 +1,117 @@
+"""
+Digest delivery of notification emails.
+
+Notifications of users who chose digest delivery are not emailed one by one.
+`queue_digests()` coalesces each user's pending notifications into a single
+outbox email, at most once per `NOTIFICATION_DIGEST_WINDOW` seconds. Users who
+switched back to immediate delivery get their pending notifications in a last
+digest, without waiting for the window.
+"""
+
+from django.contrib.auth import get_user_model
+from django.utils.html import escape
+from django.db.models import Q
+from django.db import transaction
+from django.conf import settings
+from django.utils import timezone
+
+from datetime import timedelta
+
+from .models import Notification, OutboxEmail
+from .outbox import render_notification_email
+
+
+User = get_user_model()
+
+# Number of users whose digests are built at once
+USER_BATCH_SIZE = 100
+
+
+def get_pending_notifications():
+    """
+    Return the notifications waiting for a digest, including the ones of users
+    no longer receiving digests.
+    """
+    return Notification.objects.filter(is_emailed=False, user__email_notification=True)
+
+
+def render_digest(notifications):
+    """
+    Render a single message from the notifications of a user, counting
+    identical messages (e.g. many updates to the same task) once.
+    """
+    counts = {}
+    for notification in notifications:
+        message = render_notification_email(notification)
+        key = (message["subject"], message["body"])
+        counts[key] = counts.get(key, 0) + 1
+
+    lines = []
+    items = []
+    for (subject, body), count in counts.items():
+        suffix = f" (x{count})" if count > 1 else ""
+        lines.append(f"- {body}{suffix}")
+        items.append(f"<li>{escape(body)}{suffix}</li>")
+
+    total = len(notifications)
+    return {
+        "subject": f"Notification Digest: {total} new notification{'s' if total > 1 else ''}",
+        "body": "\n".join(["Here is what happened since your last digest:", ""] + lines),
+        "body_html": f"<p>Here is what happened since your last digest:</p><ul>{''.join(items)}</ul>",
+    }
+
+
+def queue_digests(window=None, now=None):
+    """
+    Queue a digest email for every user with a notification pending for longer
+    than the digest window, or no longer receiving digests, and return the
+    number of digests queued.
+    """
+    now = now or timezone.now()
+    window = timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW if window is None else window)
+
+    # Users who turned email notifications off since will not get a digest
+    Notification.objects.filter(is_emailed=False, user__email_notification=False).update(is_emailed=True)
+
+    pending = get_pending_notifications().filter(created_at__lte=now)
+    # Users back on immediate delivery get their last digest without waiting for the window
+    due = pending.filter(
+        Q(user__email_delivery=User.EmailDelivery.DIGEST, created_at__lte=now - window)
+        | ~Q(user__email_delivery=User.EmailDelivery.DIGEST)
+    )
+    user_ids = list(due.order_by().values_list("user_id", flat=True).distinct())
+
+    queued = 0
+    for start in range(0, len(user_ids), USER_BATCH_SIZE):
+        with transaction.atomic():
+            # Lock the notifications, so that concurrent runs skip them instead of sending them twice
+            batch = list(
+                pending.filter(user_id__in=user_ids[start : start + USER_BATCH_SIZE])
+                .select_for_update(skip_locked=True, of=("self",))
+                .select_related("user")
+                .prefetch_related("content_object__content_object")
+                .order_by("user_id", "created_at")
+            )
+
+            notifications_by_user = {}
+            for notification in batch:
+                notifications_by_user.setdefault(notification.user, []).append(notification)
+
+            emails = []
+            for user, notifications in notifications_by_user.items():
+                message = render_digest(notifications)
+                emails.append(
+                    OutboxEmail(
+                        email=user.email,
+                        subject=message["subject"],
+                        body=message["body"],
+                        body_html=message["body_html"],
+                    )
+                )
+
+            OutboxEmail.objects.bulk_create(emails)
+            Notification.objects.filter(pk__in=[n.pk for n in batch]).update(is_emailed=True)
+
+        queued += len(emails)
+
+    return queued
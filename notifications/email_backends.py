@@ -1,19 +1,107 @@
 from django.core.mail.backends.base import BaseEmailBackend
+from django.core.cache import cache
 from django.conf import settings
 from notifications.models import EmailLog
 
 from botocore.exceptions import ClientError
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import boto3
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing calls evenly to at most `rate` calls per second.
+    A rate of `None` or `0` disables the limit.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_call = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SharedRateLimiter:
+    """
+    Limiter allowing at most `rate` calls per second across all the processes
+    sharing the cache, e.g. the instances each running `send_queued_emails`.
+
+    Calls are counted with the atomic `incr()` of the cache, in windows of one
+    second (or of one call for rates below one per second), and spaced evenly
+    within the process by a `RateLimiter`. A rate of `None` or `0` disables the limit.
+    """
+
+    def __init__(self, rate, key="notifications.send-rate"):
+        self.window = max(1, 1 / rate) if rate else 0
+        self.limit = max(1, int(rate * self.window)) if rate else 0
+        self.key = f"{key}:{rate}"
+        self.local = RateLimiter(rate)
+
+    def wait(self):
+        if not self.window:
+            return
+
+        self.local.wait()
+        while True:
+            now = time.time()
+            window = int(now // self.window)
+            key = f"{self.key}:{window}"
+            cache.add(key, 0, timeout=int(self.window) + 1)
+            try:
+                count = cache.incr(key)
+            except ValueError:
+                # The window expired in the meantime
+                continue
+            if count <= self.limit:
+                return
+            time.sleep((window + 1) * self.window - now)
+
+
+# Rate limiters shared by all the backend instances of the process, keyed by rate
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(rate):
+    with rate_limiters_lock:
+        if rate not in rate_limiters:
+            rate_limiters[rate] = SharedRateLimiter(rate)
+        return rate_limiters[rate]
 
 
 class SesEmailBackend(BaseEmailBackend):
     """
     Amazon Simple Email Service (SES) backend implementations.
+
+    Messages are sent concurrently by up to `AWS_SES_MAX_WORKERS` threads sharing
+    one client. All the processes sharing the cache together send at most
+    `AWS_SES_MAX_SEND_RATE` messages per second, see `SharedRateLimiter`.
     """
 
-    def __init__(self, *args, **kwargs):
+    # Every delivery attempt is recorded in `EmailLog` by `send_messages()`
+    logs_deliveries = True
+    # The error of each message, or `None`, is set as its `send_error` by `send_messages()`
+    reports_send_errors = True
+
+    def __init__(self, *args, max_workers=None, max_send_rate=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.client = None
+        self.max_workers = max_workers or getattr(settings, "AWS_SES_MAX_WORKERS", 1)
+        self.rate_limiter = get_rate_limiter(max_send_rate or getattr(settings, "AWS_SES_MAX_SEND_RATE", None))
 
     def setup_client(self):
         """
@@ -25,6 +113,8 @@ class SesEmailBackend(BaseEmailBackend):
                 region_name=settings.AWS_SES_REGION_NAME,
                 aws_access_key_id=settings.AWS_SES_ACCESS_KEY,
                 aws_secret_access_key=settings.AWS_SES_SECRET_KEY,
+                # One HTTP connection per sending thread
+                config=Config(max_pool_connections=max(self.max_workers, 10)),
             )
 
     def create_log_entry(self, email, subject, is_success, description):
@@ -38,6 +128,80 @@ class SesEmailBackend(BaseEmailBackend):
             description=description,
         )
 
+    def send_message(self, email_message):
+        """
+        Send a single EmailMessage and return whether it was sent,
+        along with a log entry for each recipient. The error is set as its `send_error`.
+        """
+
+        body_text = email_message.body
+        body_html = None
+
+        for content, mime in email_message.alternatives:
+            if mime == "text/html":
+                body_html = content
+                break
+
+        try:
+            # Prepare the email
+            message_data = {
+                "Destination": {"ToAddresses": email_message.to},
+                "Message": {
+                    "Subject": {"Data": email_message.subject, "Charset": "UTF-8"},
+                    "Body": {
+                        "Text": {"Data": body_text, "Charset": "UTF-8"},
+                    },
+                },
+                "Source": email_message.from_email,
+            }
+
+            # Add HTML content if present
+            if body_html:
+                message_data["Message"]["Body"]["Html"] = {"Data": body_html, "Charset": "UTF-8"}
+
+            # Send the email
+            self.rate_limiter.wait()
+            response = self.client.send_email(**message_data)
+            email_message.send_error = None
+
+            # Log success for each recipient
+            return True, [
+                self.create_log_entry(
+                    email=recipient,
+                    subject=email_message.subject,
+                    is_success=True,
+                    description=f"Message ID: { response['MessageId'] }",
+                )
+                for recipient in email_message.to
+            ]
+
+        except ClientError as e:
+            error_message = e.response["Error"]["Message"]
+            email_message.send_error = f"{e.__class__.__name__}: {error_message}"
+            # Log AWS-specific errors for each recipient
+            return False, [
+                self.create_log_entry(
+                    email=recipient,
+                    subject=email_message.subject,
+                    is_success=False,
+                    description=f"Client Error: {error_message}",
+                )
+                for recipient in email_message.to
+            ]
+
+        except Exception as e:
+            email_message.send_error = f"{e.__class__.__name__}: {e}"
+            # Log unexpected errors for each recipient
+            return False, [
+                self.create_log_entry(
+                    email=recipient,
+                    subject=email_message.subject,
+                    is_success=False,
+                    description=f"Unexpected Error: {str(e)}",
+                )
+                for recipient in email_message.to
+            ]
+
     def send_messages(self, email_messages):
         """
         Send one or more EmailMessage instances using Amazon SES
@@ -48,75 +212,20 @@ class SesEmailBackend(BaseEmailBackend):
             return 0
 
         self.setup_client()
-        log_objects = []
-        num_sent = 0
-
-        for email_message in email_messages:
 
-            body_text = email_message.body
-            body_html = None
+        # boto3 clients are thread-safe, so all threads share the same client
+        if self.max_workers > 1 and len(email_messages) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(email_messages))) as executor:
+                results = list(executor.map(self.send_message, email_messages))
+        else:
+            results = [self.send_message(email_message) for email_message in email_messages]
 
-            for content, mime in email_message.alternatives:
-                if mime == "text/html":
-                    body_html = content
-                    break
+        num_sent = 0
+        log_objects = []
 
-            try:
-                # Prepare the email
-                message_data = {
-                    "Destination": {"ToAddresses": email_message.to},
-                    "Message": {
-                        "Subject": {"Data": email_message.subject, "Charset": "UTF-8"},
-                        "Body": {
-                            "Text": {"Data": body_text, "Charset": "UTF-8"},
-                        },
-                    },
-                    "Source": email_message.from_email,
-                }
-
-                # Add HTML content if present
-                if body_html:
-                    message_data["Message"]["Body"]["Html"] = {"Data": body_html, "Charset": "UTF-8"}
-
-                # Send the email
-                response = self.client.send_email(**message_data)
-                num_sent += 1
-
-                # Log success for each recipient
-                for recipient in email_message.to:
-                    log_objects.append(
-                        self.create_log_entry(
-                            email=recipient,
-                            subject=email_message.subject,
-                            is_success=True,
-                            description=f"Message ID: { response['MessageId'] }",
-                        )
-                    )
-
-            except ClientError as e:
-                error_message = e.response["Error"]["Message"]
-                # Log AWS-specific errors for each recipient
-                for recipient in email_message.to:
-                    log_objects.append(
-                        self.create_log_entry(
-                            email=recipient,
-                            subject=email_message.subject,
-                            is_success=False,
-                            description=f"Client Error: {error_message}",
-                        )
-                    )
-
-            except Exception as e:
-                # Log unexpected errors for each recipient
-                for recipient in email_message.to:
-                    log_objects.append(
-                        self.create_log_entry(
-                            email=recipient,
-                            subject=email_message.subject,
-                            is_success=False,
-                            description=f"Unexpected Error: {str(e)}",
-                        )
-                    )
+        for is_sent, log_entries in results:
+            num_sent += is_sent
+            log_objects.extend(log_entries)
 
         EmailLog.objects.bulk_create(log_objects)
 
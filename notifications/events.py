@@ -0,0 +1,276 @@
+"""
+Server-Sent Events stream of the new notifications and unread count of a user.
+
+Each open stream waits on an `asyncio.Queue` registered with the process-wide
+`broker`, without touching the database while nothing happens. The notification
+write path calls `publish()` once its transaction is committed, which wakes up
+the streams of the notified users in the same process. Notifications created by
+other processes (other servers, management commands) are found by a single
+poller per process, which queries the new notifications of all the connected
+users at once every `NOTIFICATION_EVENTS_POLL_INTERVAL` seconds.
+
+Notifications are not found by increasing id: a transaction may commit after
+another one that inserted a greater id. Both the streams and the poller re-read
+the notifications created in the last `NOTIFICATION_EVENTS_OVERLAP` seconds,
+and skip the ones they already handled.
+
+Browsers cannot set headers on an `EventSource`, so streams are opened with a
+single-use ticket in the URL, from `create_ticket()`, rather than with an
+access token that would end up in the logs.
+
+Streams only run under ASGI, see `core/asgi.py` and the `Procfile`. Their
+queries run with `query()` in threads shared by all streams, which close their
+connection afterwards: an idle stream holds neither a thread nor a connection.
+"""
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.utils import timezone
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Notification, UnreadCounter
+from .serializers import NotificationSerializer
+
+from collections import defaultdict
+from datetime import timedelta
+import contextvars
+import threading
+import secrets
+import asyncio
+import json
+
+
+# Kinds of events
+NOTIFICATIONS = "notifications"
+UNREAD = "unread"
+
+
+def get_ticket_key(ticket):
+    return f"notifications.events-ticket:{ticket}"
+
+
+def create_ticket(user):
+    """
+    Return a ticket opening the events stream of the user once, within
+    `NOTIFICATION_EVENTS_TICKET_TIMEOUT` seconds.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(get_ticket_key(ticket), user.pk, settings.NOTIFICATION_EVENTS_TICKET_TIMEOUT)
+    return ticket
+
+
+def redeem_ticket(ticket):
+    """
+    Return the id of the user of the ticket, or `None` if it is unknown, expired or already used.
+    """
+    key = get_ticket_key(ticket)
+    user_id = cache.get(key)
+    # Only the first of concurrent redemptions deletes the key
+    if user_id is None or not cache.delete(key):
+        return None
+    return user_id
+
+
+class Broker:
+    """
+    Thread-safe in-process publish/subscribe of events, keyed by user id.
+    Subscribers are queues of the event loop they were created on.
+    """
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue()
+        with self.lock:
+            self.subscribers[user_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self.lock:
+            self.subscribers[user_id] = {(loop, q) for loop, q in self.subscribers[user_id] if q is not queue}
+            if not self.subscribers[user_id]:
+                del self.subscribers[user_id]
+
+    def get_user_ids(self):
+        with self.lock:
+            return list(self.subscribers)
+
+    def publish(self, user_ids, kind):
+        """
+        Send an event of the given kind to the subscribers of the given users,
+        from any thread.
+        """
+        with self.lock:
+            subscribers = [subscriber for user_id in user_ids for subscriber in self.subscribers.get(user_id, ())]
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, kind)
+            except RuntimeError:
+                # The event loop is closed
+                pass
+
+
+broker = Broker()
+
+
+def publish(user_ids, kind=NOTIFICATIONS):
+    """
+    Notify the streams of the given users once the current transaction is committed.
+    """
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: broker.publish(user_ids, kind))
+
+
+async def query(function, *args):
+    """
+    Run a function querying the database in a thread shared with the other
+    streams rather than in the thread of the request, and close its connection.
+    """
+
+    def run():
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+
+    return await sync_to_async(run, thread_sensitive=False)()
+
+
+class Window:
+    """
+    Ids of the notifications handled in the last `NOTIFICATION_EVENTS_OVERLAP`
+    seconds, which are read again in case some were committed late.
+    """
+
+    def __init__(self):
+        self.handled = {}
+
+    def get_start(self):
+        return timezone.now() - timedelta(seconds=settings.NOTIFICATION_EVENTS_OVERLAP)
+
+    def add(self, rows):
+        """
+        Record the `(id, created_at)` rows read, and return the ids not handled before.
+        """
+        start = self.get_start()
+        new = [id for id, created_at in rows if id not in self.handled]
+        self.handled.update(rows)
+        self.handled = {id: created_at for id, created_at in self.handled.items() if created_at >= start}
+        return new
+
+
+def get_recent_notifications(start, user_ids):
+    """
+    Return `(id, created_at, user id)` for the notifications created since `start`, among `user_ids`.
+    """
+    return list(
+        Notification.objects.filter(created_at__gte=start, user_id__in=user_ids).values_list(
+            "id", "created_at", "user_id"
+        )
+    )
+
+
+class Poller:
+    """
+    Find the notifications created by other processes for the connected users,
+    with one query per interval for all of them. Runs while there are subscribers.
+    """
+
+    def __init__(self):
+        self.task = None
+
+    def start(self):
+        if getattr(settings, "NOTIFICATION_EVENTS_POLL_INTERVAL", None) and (self.task is None or self.task.done()):
+            # Outside of the context of the stream starting it, which would pin its thread
+            self.task = asyncio.get_running_loop().create_task(self.run(), context=contextvars.Context())
+
+    async def run(self):
+        window = Window()
+        # The notifications created before the streams were opened are not events
+        rows = await query(get_recent_notifications, window.get_start(), broker.get_user_ids())
+        window.add([(id, created_at) for id, created_at, _ in rows])
+
+        while True:
+            await asyncio.sleep(settings.NOTIFICATION_EVENTS_POLL_INTERVAL)
+            user_ids = broker.get_user_ids()
+            if not user_ids:
+                return
+            rows = await query(get_recent_notifications, window.get_start(), user_ids)
+            new = set(window.add([(id, created_at) for id, created_at, _ in rows]))
+            broker.publish({user_id for id, _, user_id in rows if id in new}, NOTIFICATIONS)
+
+
+poller = Poller()
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def get_unread_count(user):
+    return UnreadCounter.objects.get_count(user)
+
+
+def get_new_notifications(user, window):
+    """
+    Return the serialized unread notifications of the user created in the
+    window and not handled yet, and record them in the window.
+    """
+    notifications = Notification.objects.filter(user=user, viewed=False, created_at__gte=window.get_start())
+    new = window.add(list(notifications.values_list("id", "created_at")))
+    if not new:
+        return []
+    notifications = (
+        Notification.objects.filter(id__in=new).order_by("id").prefetch_related("content_object__content_object")
+    )
+    return NotificationSerializer(notifications, many=True).data
+
+
+def get_window(user):
+    """
+    Return a window of the notifications of the user, with the ones already
+    created, which are not events.
+    """
+    window = Window()
+    notifications = Notification.objects.filter(user=user, created_at__gte=window.get_start())
+    window.add(list(notifications.values_list("id", "created_at")))
+    return window
+
+
+async def stream(user):
+    """
+    Yield the events of the user: the unread count when connecting and whenever
+    it changes, and each new notification. Comments are sent while idle, to keep
+    the connection open through proxies.
+    """
+    queue = broker.subscribe(user.id)
+    poller.start()
+
+    try:
+        window = await query(get_window, user)
+        yield format_event(UNREAD, {"count": await query(get_unread_count, user)})
+
+        while True:
+            try:
+                kind = await asyncio.wait_for(queue.get(), settings.NOTIFICATION_EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            # Coalesce the events received in the meantime
+            kinds = {kind}
+            while not queue.empty():
+                kinds.add(queue.get_nowait())
+
+            if NOTIFICATIONS in kinds:
+                for notification in await query(get_new_notifications, user, window):
+                    yield format_event("notification", notification)
+
+            yield format_event(UNREAD, {"count": await query(get_unread_count, user)})
+    finally:
+        broker.unsubscribe(user.id, queue)
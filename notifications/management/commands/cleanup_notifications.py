@@ -1,12 +1,15 @@
 from django.core.management.base import BaseCommand
-from django.contrib.contenttypes.models import ContentType
-from django.core.exceptions import ObjectDoesNotExist
 
+from notifications.retention import CHUNK_SIZE, get_cutoff, get_orphans, delete_in_chunks
+from notifications.retention import get_expired_notifications, get_orphan_activities, get_sent_emails
 from notifications.models import Notification
 
 
 class Command(BaseCommand):
-    help = "Cleans up notifications with invalid generic relations"
+    help = (
+        "Deletes notifications with invalid generic relations, old viewed notifications, "
+        "their orphan activities and old sent emails"
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -14,57 +17,73 @@ class Command(BaseCommand):
             action="store_true",
             help="Force deletion without confirmation",
         )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the number of rows that would be deleted",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Age in days of the viewed notifications, orphan activities and sent emails purged "
+            "(default: NOTIFICATION_RETENTION_DAYS, 0 keeps them)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Number of rows deleted per transaction",
+        )
 
-    def handle(self, *args, **options):
-        # Get total count of notifications
-        total_notifications = Notification.objects.count()
+    def get_targets(self, days):
+        """
+        Return `(description, queryset)` for each set of rows to delete.
+        """
+        targets = [
+            (f"notifications with missing {content_type.name}", queryset)
+            for content_type, queryset in get_orphans(Notification.objects.all())
+        ]
 
-        # Get all valid content types
-        valid_content_types = ContentType.objects.values_list("id", flat=True)
+        if days != 0:
+            cutoff = get_cutoff(days)
+            targets.append((f"viewed notifications older than {cutoff:%Y-%m-%d}", get_expired_notifications(cutoff)))
+            targets += [
+                (f"activities of deleted {content_type.name}", queryset)
+                for content_type, queryset in get_orphan_activities(cutoff)
+            ]
+            targets.append((f"sent emails older than {cutoff:%Y-%m-%d}", get_sent_emails(cutoff)))
 
-        # Find notifications with invalid content types
-        invalid_ct_notifications = Notification.objects.exclude(content_type_id__in=valid_content_types)
-        invalid_ct_count = invalid_ct_notifications.count()
+        return targets
 
-        # Find notifications with missing objects
-        remaining = Notification.objects.filter(content_type_id__in=valid_content_types)
-        invalid_obj_notifications = []
+    def handle(self, *args, **options):
+        targets = [(description, queryset.count()) for description, queryset in self.get_targets(options["days"])]
+        targets = [(description, count) for description, count in targets if count]
 
-        for notification in remaining:
-            try:
-                if notification.content_object is None:
-                    invalid_obj_notifications.append(notification.id)
-            except (ObjectDoesNotExist, AttributeError):
-                invalid_obj_notifications.append(notification.id)
+        if not targets:
+            self.stdout.write(self.style.SUCCESS("No notifications to delete."))
+            return
 
-        invalid_obj_count = len(invalid_obj_notifications)
-        total_invalid = invalid_ct_count + invalid_obj_count
+        self.stdout.write("\nFound:")
+        for description, count in targets:
+            self.stdout.write(f" - {count} {description}")
 
-        if total_invalid == 0:
-            self.stdout.write(self.style.SUCCESS("No invalid notifications found."))
+        if options["dry_run"]:
             return
 
-        # Show summary and ask for confirmation
-        self.stdout.write(
-            f"\nFound {total_invalid} invalid notifications out of {total_notifications} total:"
-            f"\n - {invalid_ct_count} notifications with invalid content types"
-            f"\n - {invalid_obj_count} notifications with missing objects"
-        )
-
         if not options["force"]:
             confirm = input("\nDo you want to proceed with deletion? [y/N]: ")
             if confirm.lower() != "y":
                 self.stdout.write(self.style.WARNING("Operation cancelled."))
                 return
 
-        # Perform deletion
-        deleted_ct = invalid_ct_notifications.delete()[0]
-        deleted_obj = Notification.objects.filter(id__in=invalid_obj_notifications).delete()[0]
+        # Looked up again, so that the activities of the notifications just deleted are included
+        for description, queryset in self.get_targets(options["days"]):
+            deleted = 0
+            for count in delete_in_chunks(queryset, options["chunk_size"]):
+                deleted += count
+                self.stdout.write(f"\r - {deleted} {description} deleted", ending="")
+                self.stdout.flush()
+            if deleted:
+                self.stdout.write("")
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                f"\nSuccessfully cleaned up:"
-                f"\n - {deleted_ct} notifications with invalid content types"
-                f"\n - {deleted_obj} notifications with missing objects"
-            )
-        )
+        self.stdout.write(self.style.SUCCESS("\nCleanup completed."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from notifications.models import UnreadCounter
+
+
+class Command(BaseCommand):
+    help = "Recomputes the unread notification counters from the notifications"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="users",
+            help="Id of a user whose counter is recomputed, may be repeated (default: all users)",
+        )
+
+    def handle(self, *args, **options):
+        fixed = UnreadCounter.objects.reconcile(options["users"])
+        self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} unread counters."))
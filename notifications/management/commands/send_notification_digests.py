@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from notifications.digest import queue_digests
+
+
+class Command(BaseCommand):
+    help = "Queues a digest email for users with notifications pending for longer than the digest window"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--window",
+            type=int,
+            help="Seconds a notification waits before it is sent in a digest (default: NOTIFICATION_DIGEST_WINDOW)",
+        )
+
+    def handle(self, *args, **options):
+        queued = queue_digests(window=options["window"])
+        self.stdout.write(self.style.SUCCESS(f"Queued {queued} notification digests."))
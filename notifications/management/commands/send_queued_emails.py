@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import OutboxWorker
+
+import time
+
+
+class Command(BaseCommand):
+    help = "Sends the notification emails queued in the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Number of emails claimed at once (default: EMAIL_OUTBOX_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Number of threads sending emails (default: EMAIL_OUTBOX_MAX_WORKERS)",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting once it is drained",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds between polls when running with --loop",
+        )
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options["batch_size"], max_workers=options["workers"])
+
+        while True:
+            processed = worker.drain()
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f"Processed {processed} queued emails."))
+
+            if not options["loop"]:
+                break
+
+            time.sleep(options["interval"])
@@ -0,0 +1,99 @@
+from django.db.models.functions import Greatest
+from django.db import models, transaction
+from django.apps import apps
+from django.db.models import F, Count
+
+
+class NotificationManager(models.Manager):
+
+    def notify(self, users, content_object):
+        """
+        Create a notification for each user about `content_object` with a single
+        INSERT, then send the `notifications_created` signal once for the batch.
+        Receivers run in the same transaction as the INSERT.
+        """
+        return self.notify_many([(users, content_object)])
+
+    def notify_many(self, recipients):
+        """
+        Same as `notify()` for several objects at once, given as `(users, content_object)`
+        pairs: a single INSERT and a single signal for all of them.
+        """
+        from .signals import notifications_created
+
+        with transaction.atomic():
+            notifications = self.bulk_create(
+                [
+                    # Only the notifications left for a digest wait to be emailed
+                    self.model(user=user, content_object=content_object, is_emailed=not user.receives_digest)
+                    for users, content_object in recipients
+                    for user in users
+                    if user is not None
+                ]
+            )
+
+            if notifications:
+                notifications_created.send(sender=self.model, notifications=notifications)
+
+        return notifications
+
+
+class UnreadCounterManager(models.Manager):
+
+    def get_count(self, user):
+        """
+        Return the number of unread notifications of the user.
+        """
+        return self.filter(user=user).values_list("count", flat=True).first() or 0
+
+    def add(self, counts):
+        """
+        Increment the counters by the given amounts, keyed by user id, with one
+        UPDATE per distinct amount. Missing counters are created first.
+        """
+        counts = {user_id: amount for user_id, amount in counts.items() if amount}
+        if not counts:
+            return
+
+        with transaction.atomic():
+            self.bulk_create([self.model(user_id=user_id) for user_id in counts], ignore_conflicts=True)
+
+            by_amount = {}
+            for user_id, amount in counts.items():
+                by_amount.setdefault(amount, []).append(user_id)
+
+            for amount, user_ids in by_amount.items():
+                # Concurrent updates are serialized by the row locks, and never go below zero
+                self.filter(user_id__in=user_ids).update(count=Greatest(F("count") + amount, 0))
+
+    def reconcile(self, user_ids=None):
+        """
+        Recompute the counters from the notifications table, for the given users
+        or for all of them, and return the number of counters that were wrong.
+        """
+        Notification = apps.get_model("notifications", "notification")
+
+        unread = Notification.objects.filter(viewed=False)
+        counters = self.all()
+        if user_ids is not None:
+            unread = unread.filter(user_id__in=user_ids)
+            counters = counters.filter(user_id__in=user_ids)
+
+        actual = dict(unread.order_by().values("user_id").annotate(count=Count("id")).values_list("user_id", "count"))
+        stored = dict(counters.values_list("user_id", "count"))
+
+        wrong = {
+            user_id: actual.get(user_id, 0)
+            for user_id in actual.keys() | stored.keys()
+            if actual.get(user_id, 0) != stored.get(user_id)
+        }
+
+        with transaction.atomic():
+            self.bulk_create(
+                [self.model(user_id=user_id, count=count) for user_id, count in wrong.items()],
+                update_conflicts=True,
+                unique_fields=["user"],
+                update_fields=["count"],
+            )
+
+        return len(wrong)
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0003_outboxemail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Existing notifications have already been emailed, keep them out of digests
+        migrations.AddField(
+            model_name='notification',
+            name='is_emailed',
+            field=models.BooleanField(default=True, verbose_name='Has been emailed'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='is_emailed',
+            field=models.BooleanField(default=False, verbose_name='Has been emailed'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_emailed', False)), fields=['user', 'created_at'], name='notification_pending_email_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0004_notification_is_emailed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'viewed', 'created_at'], name='notificatio_user_id_acff3d_idx'),
+        ),
+    ]
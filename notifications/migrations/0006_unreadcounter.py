@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def create_counters(apps, schema_editor):
+    Notification = apps.get_model("notifications", "Notification")
+    UnreadCounter = apps.get_model("notifications", "UnreadCounter")
+
+    counts = Notification.objects.filter(viewed=False).order_by().values("user_id").annotate(count=Count("id"))
+    UnreadCounter.objects.bulk_create(
+        [UnreadCounter(user_id=row["user_id"], count=row["count"]) for row in counts], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_user_email_delivery'),
+        ('notifications', '0005_notification_notificatio_user_id_acff3d_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Unread Counter',
+                'verbose_name_plural': 'Unread Counters',
+            },
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
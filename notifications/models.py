@@ -1,25 +1,37 @@
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.core.mail import EmailMultiAlternatives
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 from core.mixins import TimestampMixin
 from core.utils import get_timesince
 
 from .mixins import NotificationMixin
+from .managers import NotificationManager, UnreadCounterManager
 
 
 class Notification(TimestampMixin):
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="%(class)s", on_delete=models.CASCADE)
     viewed = models.BooleanField(verbose_name="Has been viewed", default=False)
+    is_emailed = models.BooleanField(verbose_name="Has been emailed", default=False)
     object_id = models.PositiveIntegerField()
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     content_object = GenericForeignKey("content_type", "object_id")
 
+    objects = NotificationManager()
+
     def __str__(self):
         return f"{self.content_type} Notification for {self.user}"
 
+    def save(self, *args, **kwargs):
+        # Only the notifications left for a digest wait to be emailed
+        if self._state.adding and not self.is_emailed:
+            self.is_emailed = not self.user.receives_digest
+        super().save(*args, **kwargs)
+
     def time_since_creation(self):
         return get_timesince(self.created_at)
 
@@ -38,10 +50,41 @@ class Notification(TimestampMixin):
         return None
 
     class Meta:
-        indexes = [models.Index(fields=["content_type", "object_id"])]
+        indexes = [
+            models.Index(fields=["content_type", "object_id"]),
+            # Keyset pagination of the unread notifications of a user
+            models.Index(fields=["user", "viewed", "created_at"]),
+            # Notifications waiting for the next digest
+            models.Index(
+                fields=["user", "created_at"],
+                condition=models.Q(is_emailed=False),
+                name="notification_pending_email_idx",
+            ),
+        ]
         ordering = ["-created_at"]
 
 
+class UnreadCounter(models.Model):
+    """
+    Number of unread notifications of a user, maintained as notifications are
+    created and viewed. `reconcile_unread_counts` recomputes it from the table.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, primary_key=True, related_name="unread_counter", on_delete=models.CASCADE
+    )
+    count = models.PositiveIntegerField(default=0)
+
+    objects = UnreadCounterManager()
+
+    class Meta:
+        verbose_name = "Unread Counter"
+        verbose_name_plural = "Unread Counters"
+
+    def __str__(self):
+        return f"{self.count} unread for {self.user}"
+
+
 class Category(models.Model):
 
     action = models.CharField(max_length=1, choices=NotificationMixin.Action_Choices)
@@ -71,3 +114,47 @@ class EmailLog(models.Model):
     status = models.PositiveSmallIntegerField(choices=Status, default=Status.FAIL)
     description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+
+
+class OutboxEmail(TimestampMixin):
+    """
+    Email waiting to be sent by the `send_queued_emails` command.
+    """
+
+    class Status(models.IntegerChoices):
+        PENDING = 0, "Pending"
+        SENT = 1, "Sent"
+        FAILED = 2, "Failed"
+
+    notification = models.ForeignKey(
+        Notification, blank=True, null=True, related_name="emails", on_delete=models.SET_NULL
+    )
+    email = models.CharField(max_length=100)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    body_html = models.TextField(blank=True)
+    status = models.PositiveSmallIntegerField(choices=Status, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Outbox Email"
+        verbose_name_plural = "Outbox Emails"
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+        ordering = ["next_attempt_at"]
+
+    def __str__(self):
+        return f"{self.subject} to {self.email}"
+
+    def to_message(self, connection=None):
+        alternatives = [(self.body_html, "text/html")] if self.body_html else None
+        return EmailMultiAlternatives(
+            subject=self.subject,
+            body=self.body,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[self.email],
+            alternatives=alternatives,
+            connection=connection,
+        )
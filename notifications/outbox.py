@@ -0,0 +1,216 @@
+"""
+Durable outbox for notification emails.
+
+Notifications queue their email as an `OutboxEmail` row in the same transaction,
+and the `send_queued_emails` command sends the queued rows in batches, outside
+of any HTTP request.
+
+Backends reporting the error of each message (`reports_send_errors`, e.g. SES)
+are given each claimed batch in a single `send_messages()` call, which they send
+with their own concurrency. Other backends are given one message per call from
+a pool of threads, since their number of messages sent does not tell which ones
+failed.
+"""
+
+from django.core.mail import get_connection
+from django.db import connections, transaction
+from django.conf import settings
+from django.utils import timezone
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import threading
+import logging
+
+from .models import OutboxEmail, EmailLog
+
+
+logger = logging.getLogger(__name__)
+
+
+def render_notification_email(notification):
+    """
+    Return the subject, body and HTML body of the email for a notification.
+    """
+    # Get the related object (e.g., Activity)
+    related_object = notification.content_object
+
+    # Check if the related object has a render_notification method
+    if hasattr(related_object, "render_notification"):
+        return related_object.render_notification()
+
+    # Fallback message if the related object doesn't have a render_notification method
+    return {
+        "subject": "Notification",
+        "body": f"You have a new notification related to {related_object}.",
+        "body_html": f"<p>You have a new notification related to {related_object}.</p>",
+    }
+
+
+def queue_notification_emails(notifications):
+    """
+    Queue the emails of the given notifications in the outbox with a single INSERT.
+    Notifications of users receiving digests are left for `send_notification_digests`,
+    the others are already inserted with `is_emailed` set.
+    """
+
+    # TODO: Implement finer control based on the notification category to
+    # allow for specific behavior and preferences per category.
+
+    emails = []
+    for notification in notifications:
+        user = notification.user
+
+        # Check user preferences for email notifications
+        if not user.email_notification or user.receives_digest:
+            continue
+
+        message = render_notification_email(notification)
+        emails.append(
+            OutboxEmail(
+                notification=notification,
+                email=notification.user.email,
+                subject=message["subject"][:255],
+                body=message["body"],
+                body_html=message["body_html"],
+            )
+        )
+
+    return OutboxEmail.objects.bulk_create(emails)
+
+
+def get_retry_delay(attempts):
+    """
+    Return the delay before the next attempt, doubled after each failed attempt.
+    """
+    return timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_batch(batch_size):
+    """
+    Return the next due emails and lease them, so that concurrent workers skip them.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.Status.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        lease = now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in batch]).update(next_attempt_at=lease)
+
+    return batch
+
+
+def format_error(exception):
+    return f"{exception.__class__.__name__}: {exception}"
+
+
+class OutboxWorker:
+    """
+    Send queued emails by batches, retrying failed emails with an exponential backoff.
+    """
+
+    def __init__(self, batch_size=None, max_workers=None, max_attempts=None):
+        self.batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+        self.max_workers = max_workers or settings.EMAIL_OUTBOX_MAX_WORKERS
+        self.max_attempts = max_attempts or settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+        self.local = threading.local()
+
+        # Some backends (e.g. SES) already log every delivery attempt, and report the error of each message
+        connection = get_connection()
+        self.logs_deliveries = getattr(connection, "logs_deliveries", False)
+        self.reports_send_errors = getattr(connection, "reports_send_errors", False)
+
+    def get_connection(self):
+        # Email backends are not guaranteed to be thread-safe, so use one per thread
+        if not hasattr(self.local, "connection"):
+            self.local.connection = get_connection()
+        return self.local.connection
+
+    def send(self, email):
+        """
+        Send an email and return an error message, or `None` on success.
+        """
+        try:
+            connection = self.get_connection()
+            if connection.send_messages([email.to_message(connection)]):
+                return None
+            return "The email backend did not send the message."
+        except Exception as e:
+            return format_error(e)
+        finally:
+            # Backends that log deliveries use a database connection from this thread
+            connections.close_all()
+
+    def send_batch(self, emails):
+        """
+        Send the emails with a single `send_messages()` call of a backend reporting
+        the error of each message, and return the error of each email, or `None`.
+        """
+        try:
+            connection = get_connection()
+            messages = [email.to_message(connection) for email in emails]
+            connection.send_messages(messages)
+        except Exception as e:
+            return [format_error(e)] * len(emails)
+        return [getattr(message, "send_error", "The email backend did not send the message.") for message in messages]
+
+    def process_batch(self):
+        """
+        Send the next batch of due emails and return the number of emails processed.
+        """
+        batch = claim_batch(self.batch_size)
+        if not batch:
+            return 0
+
+        if self.reports_send_errors:
+            errors = self.send_batch(batch)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                errors = list(executor.map(self.send, batch))
+
+        now = timezone.now()
+        log_objects = []
+
+        for email, error in zip(batch, errors):
+            email.attempts += 1
+            email.last_error = error or ""
+            email.updated_at = now
+
+            if error is None:
+                email.status = OutboxEmail.Status.SENT
+                email.sent_at = now
+            elif email.attempts >= self.max_attempts:
+                email.status = OutboxEmail.Status.FAILED
+            else:
+                email.next_attempt_at = now + get_retry_delay(email.attempts)
+
+            log_objects.append(
+                EmailLog(
+                    email=email.email[:100],
+                    subject=email.subject[:100],
+                    status=EmailLog.Status.FAIL if error else EmailLog.Status.SUCCESS,
+                    description=f"Outbox Error (attempt {email.attempts}): {error}" if error else "Sent from outbox",
+                )
+            )
+
+        OutboxEmail.objects.bulk_update(
+            batch, ["status", "attempts", "last_error", "next_attempt_at", "sent_at", "updated_at"]
+        )
+
+        if not self.logs_deliveries:
+            EmailLog.objects.bulk_create(log_objects)
+
+        return len(batch)
+
+    def drain(self):
+        """
+        Process batches until no email is due and return the number of emails processed.
+        """
+        total = 0
+        while processed := self.process_batch():
+            total += processed
+        return total
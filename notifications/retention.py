@@ -0,0 +1,98 @@
+"""
+Set-based purge of notifications and activities.
+
+Orphans are rows whose generic relation points to a deleted object. They are
+found with one anti-join (`NOT EXISTS`) per content type instead of loading each
+`content_object`. Retention purges the viewed notifications older than
+`NOTIFICATION_RETENTION_DAYS`, then the activities of deleted items that no
+notification refers to anymore, and the outbox emails sent before the same
+cutoff. The history of existing items is kept.
+
+Rows are deleted by chunks of primary keys, each in its own transaction, so
+that no long transaction locks the tables.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Exists, OuterRef
+from django.db import transaction
+from django.conf import settings
+from django.utils import timezone
+
+from pm.models import Activity
+
+from .models import Notification, OutboxEmail, UnreadCounter
+
+from collections import Counter
+from datetime import timedelta
+
+
+CHUNK_SIZE = 1000
+
+
+def get_cutoff(days=None):
+    if days is None:
+        days = settings.NOTIFICATION_RETENTION_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def get_orphans(queryset):
+    """
+    Return `(content type, queryset)` for each content type referred to by the
+    rows of `queryset`, limited to the rows whose object no longer exists.
+    """
+    model = queryset.model
+    content_type_ids = model._base_manager.order_by().values_list("content_type_id", flat=True).distinct()
+
+    orphans = []
+    for content_type in ContentType.objects.filter(id__in=content_type_ids).order_by("id"):
+        rows = queryset.filter(content_type=content_type)
+        target = content_type.model_class()
+        if target is not None:
+            rows = rows.filter(~Exists(target._base_manager.filter(pk=OuterRef("object_id"))))
+        orphans.append((content_type, rows))
+    return orphans
+
+
+def get_expired_notifications(cutoff):
+    return Notification.objects.filter(viewed=True, created_at__lt=cutoff)
+
+
+def get_sent_emails(cutoff):
+    return OutboxEmail.objects.filter(status=OutboxEmail.Status.SENT, sent_at__lt=cutoff)
+
+
+def get_orphan_activities(cutoff):
+    """
+    Return `(content type, queryset)` for the activities older than `cutoff` of
+    deleted items, which no notification refers to.
+    """
+    notified = Notification.objects.filter(
+        content_type=ContentType.objects.get_for_model(Activity), object_id=OuterRef("pk")
+    )
+    activities = Activity.objects.filter(created_at__lt=cutoff).filter(~Exists(notified))
+    return get_orphans(activities)
+
+
+def delete_in_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Delete the rows of `queryset` by chunks of `chunk_size` primary keys, each
+    in its own transaction, yielding the number of rows deleted by each chunk.
+    The unread counters of deleted notifications are decremented.
+    """
+    model = queryset.model
+    last_pk = 0
+
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            return
+
+        with transaction.atomic():
+            chunk = model._base_manager.filter(pk__in=pks)
+            if model is Notification:
+                unread = Counter(chunk.filter(viewed=False).values_list("user_id", flat=True))
+                UnreadCounter.objects.add({user_id: -count for user_id, count in unread.items()})
+            chunk.delete()
+
+        last_pk = pks[-1]
+        yield len(pks)
@@ -1,7 +1,22 @@
+from django.db import models
+
 from rest_framework import serializers
 
-from notifications.models import *
-from pm.utils import get_activity_description
+from notifications.models import Notification
+from pm.utils import get_activity_description, get_object_labels
+
+
+class NotificationListSerializer(serializers.ListSerializer):
+    """
+    Resolve the objects referenced by the activities of all the notifications
+    at once, instead of once per notification.
+    """
+
+    def to_representation(self, data):
+        notifications = data.all() if isinstance(data, models.manager.BaseManager) else data
+        activities = [notification.content_object for notification in notifications]
+        self.context["object_labels"] = get_object_labels(activity for activity in activities if activity)
+        return super().to_representation(notifications)
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -18,13 +33,14 @@ class NotificationSerializer(serializers.ModelSerializer):
         return obj.content_object.get_action_display()
 
     def get_description(self, obj):
-        return get_activity_description(obj.content_object)
+        return get_activity_description(obj.content_object, self.context.get("object_labels"))
 
     def get_url(self, obj):
         return obj.get_related_url()
 
     class Meta:
         model = Notification
+        list_serializer_class = NotificationListSerializer
         fields = [
             "id",
             "content_type",
@@ -1,55 +1,33 @@
-from django.core.mail import EmailMultiAlternatives
 from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.conf import settings
+from django.dispatch import receiver, Signal
 
-from .models import Notification
+from .models import Notification, UnreadCounter
+from .outbox import queue_notification_emails
+from . import events
 
-import logging
+from collections import Counter
 
-logger = logging.getLogger(__name__)
+
+# Sent once for a batch of notifications created with `Notification.objects.notify()`,
+# which bypasses `post_save`.
+notifications_created = Signal()
 
 
 @receiver(post_save, sender=Notification)
 def send_notification_email(sender, instance, created, **kwargs):
     if created:
-
-        # TODO: Implement finer control based on the notification category to
-        # allow for specific behavior and preferences per category.
-
-        # Check user preferences for email notifications
-        if not instance.user.email_notification:
-            return
-
-        # Get the related object (e.g., Activity)
-        related_object = instance.content_object
-
-        # Check if the related object has a render_notification method
-        if hasattr(related_object, "render_notification"):
-            message = related_object.render_notification()
-        else:
-            # Fallback message if the related object doesn't have a render_notification method
-            message = {
-                "subject": "Notification",
-                "body": f"You have a new notification related to {related_object}.",
-                "body_html": f"<p>You have a new notification related to {related_object}.</p>",
-            }
-
-        subject = message["subject"]
-        body = message["body"]
-        body_html = message["body_html"]
-        from_email = settings.DEFAULT_FROM_EMAIL
-        recipient_list = [instance.user.email]
-
-        try:
-            email = EmailMultiAlternatives(
-                subject=subject,
-                body=body,
-                from_email=from_email,
-                to=recipient_list,
-                alternatives=[(body_html, "text/html")],
-            )
-            email.send()
-        except Exception as e:
-            # Log the error
-            logger.warning(f"Failed to send email: {e}")
+        if not instance.viewed:
+            UnreadCounter.objects.add({instance.user_id: 1})
+        queue_notification_emails([instance])
+        events.publish([instance.user_id], events.NOTIFICATIONS)
+    else:
+        # The notification may have been marked as viewed
+        events.publish([instance.user_id], events.UNREAD)
+
+
+@receiver(notifications_created, sender=Notification)
+def send_notification_emails(sender, notifications, **kwargs):
+    unread = Counter(notification.user_id for notification in notifications if not notification.viewed)
+    UnreadCounter.objects.add(unread)
+    queue_notification_emails(notifications)
+    events.publish([notification.user_id for notification in notifications], events.NOTIFICATIONS)
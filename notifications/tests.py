@@ -1,3 +1,474 @@
-from django.test import TestCase
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail import EmailMultiAlternatives
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connection
+from django.utils import timezone
+from django.core import mail
 
-# Create your tests here.
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from asgiref.sync import sync_to_async
+
+from accounts.models import User
+from pm.models import Domain, Project, Activity
+
+from .models import Notification, OutboxEmail, EmailLog, UnreadCounter
+from .email_backends import SesEmailBackend, SharedRateLimiter
+from .outbox import OutboxWorker
+from .views import NotificationViewSet
+from .digest import queue_digests
+from . import events
+
+from botocore.exceptions import ClientError
+from unittest import mock
+from io import StringIO
+import threading
+import asyncio
+import time
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError("SES is unavailable")
+
+
+class NotificationFanOutTestCase(APITestCase):
+    def setUp(self):
+
+        self.user = User.objects.create_user(email="owner@test.com", password="12345")
+        self.assignees = [
+            User.objects.create_user(email=f"assignee_{i}@test.com", password="12345") for i in range(3)
+        ]
+        self.assignees[0].email_notification = False
+        self.assignees[0].save()
+
+        domain = Domain.objects.create(title="fan-out domain")
+        domain.members.add(self.user)
+        self.project = Project.objects.create(domain=domain, title="fan-out project", created_by=self.user)
+
+        self.client.force_authenticate(self.user)
+
+    def create_task(self):
+        data = {
+            "title": "fan-out task",
+            "project": self.project.id,
+            "assigned_to": [user.id for user in self.assignees],
+        }
+        return self.client.post("/api/tasks/", data)
+
+    def test_bulk_fan_out(self):
+        """Notifications of an activity are inserted at once and their emails queued"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.create_task()
+
+        self.assertEqual(response.status_code, 201)
+
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "notifications_notification"')]
+        self.assertEqual(len(inserts), 1)
+
+        # The notifications are inserted as emailed, without a second write
+        updates = [q for q in queries if q["sql"].startswith('UPDATE "notifications_notification"')]
+        self.assertEqual(updates, [])
+        self.assertFalse(Notification.objects.filter(is_emailed=False).exists())
+
+        self.assertEqual(Notification.objects.filter(user__in=self.assignees + [self.user]).count(), 4)
+
+        # Emails are queued, not sent, during the request
+        self.assertEqual(len(mail.outbox), 0)
+
+        # The assignee who opted out of email notifications receives none
+        recipients = sorted(OutboxEmail.objects.values_list("email", flat=True))
+        self.assertEqual(recipients, ["assignee_1@test.com", "assignee_2@test.com", "owner@test.com"])
+
+    def test_send_queued_emails(self):
+        """The outbox worker sends queued emails and logs them"""
+        self.create_task()
+        call_command("send_queued_emails", stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn("Task", mail.outbox[0].subject)
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.Status.SENT).exists())
+        self.assertEqual(EmailLog.objects.filter(status=EmailLog.Status.SUCCESS).count(), 3)
+
+    @override_settings(EMAIL_BACKEND="notifications.tests.FailingEmailBackend", EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_retry_failed_emails(self):
+        """Failed emails are retried later and given up after the last attempt"""
+        self.create_task()
+        call_command("send_queued_emails", stdout=StringIO())
+
+        email = OutboxEmail.objects.first()
+        self.assertEqual(email.status, OutboxEmail.Status.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(email.last_error, "ConnectionError: SES is unavailable")
+        self.assertEqual(EmailLog.objects.filter(status=EmailLog.Status.FAIL).count(), 3)
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        call_command("send_queued_emails", stdout=StringIO())
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.Status.FAILED).count(), 3)
+
+
+class StubSesClient:
+    """
+    Stand-in for the botocore SES client, failing for addresses starting with `bounce`.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def send_email(self, **kwargs):
+        address = kwargs["Destination"]["ToAddresses"][0]
+        if address.startswith("bounce"):
+            raise ClientError({"Error": {"Code": "MessageRejected", "Message": "Address blacklisted"}}, "SendEmail")
+        with self.lock:
+            self.calls.append(address)
+        return {"MessageId": f"id-{address}"}
+
+
+class StubSesEmailBackend(SesEmailBackend):
+    clients = []
+
+    def setup_client(self):
+        if self.client is None:
+            self.client = StubSesClient()
+            self.clients.append(self.client)
+
+
+class SesEmailBackendTestCase(TestCase):
+    def get_messages(self, recipients):
+        return [EmailMultiAlternatives(subject="Hello", body="Hi", to=[recipient]) for recipient in recipients]
+
+    def test_concurrent_send(self):
+        """Concurrent sending keeps the per-recipient log entries"""
+        backend = SesEmailBackend(max_workers=4)
+        backend.client = StubSesClient()
+
+        recipients = [f"user_{i}@test.com" for i in range(10)] + ["bounce@test.com"]
+        self.assertEqual(backend.send_messages(self.get_messages(recipients)), 10)
+
+        self.assertEqual(sorted(backend.client.calls), sorted(recipients[:-1]))
+        self.assertEqual(EmailLog.objects.filter(status=EmailLog.Status.SUCCESS).count(), 10)
+        failure = EmailLog.objects.get(status=EmailLog.Status.FAIL)
+        self.assertEqual(failure.email, "bounce@test.com")
+        self.assertEqual(failure.description, "Client Error: Address blacklisted")
+
+    @override_settings(EMAIL_BACKEND="notifications.tests.StubSesEmailBackend")
+    def test_outbox_batch(self):
+        """The outbox sends each batch with one backend call and keeps the error of each email"""
+        fields = {"subject": "Hello", "body": "Hi"}
+        OutboxEmail.objects.bulk_create(
+            [OutboxEmail(email=f"user_{i}@test.com", **fields) for i in range(5)]
+            + [OutboxEmail(email="bounce@test.com", **fields)]
+        )
+        StubSesEmailBackend.clients.clear()
+        OutboxWorker().process_batch()
+
+        self.assertEqual(len(StubSesEmailBackend.clients), 1)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.Status.SENT).count(), 5)
+        failed = OutboxEmail.objects.get(email="bounce@test.com")
+        self.assertEqual(failed.status, OutboxEmail.Status.PENDING)
+        self.assertEqual(failed.last_error, "ClientError: Address blacklisted")
+        # Logged by the backend only
+        self.assertEqual(EmailLog.objects.count(), 6)
+
+    def test_send_rate(self):
+        """The send rate cap spaces out the messages"""
+        backend = SesEmailBackend(max_workers=4, max_send_rate=50)
+        backend.client = StubSesClient()
+
+        start = time.monotonic()
+        backend.send_messages(self.get_messages([f"user_{i}@test.com" for i in range(6)]))
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_shared_send_rate(self):
+        """Messages sent by other instances count towards the send rate cap"""
+        limiter = SharedRateLimiter(50)
+        # Another instance sent its 50 messages in the current second
+        window = int(time.time())
+        cache.set(f"{limiter.key}:{window}", 50, 2)
+
+        limiter.wait()
+        self.assertGreaterEqual(time.time(), window + 1)
+
+
+class NotificationDigestTestCase(APITestCase):
+    def setUp(self):
+
+        self.user = User.objects.create_user(email="editor@test.com", password="12345")
+        self.reader = User.objects.create_user(
+            email="reader@test.com", password="12345", email_delivery=User.EmailDelivery.DIGEST
+        )
+
+        domain = Domain.objects.create(title="digest domain")
+        domain.members.add(self.user)
+        project = Project.objects.create(domain=domain, title="digest project", description="", created_by=self.user)
+        project.assigned_to.add(self.reader)
+
+        self.client.force_authenticate(self.user)
+        for i in range(5):
+            self.client.patch(f"/api/projects/{project.id}/", {"description": f"edit {i}"})
+
+    def test_digest_is_not_sent_immediately(self):
+        """Notifications of digest users are not queued one by one"""
+        self.assertEqual(Notification.objects.filter(user=self.reader).count(), 5)
+        self.assertFalse(OutboxEmail.objects.filter(email=self.reader.email).exists())
+
+        # The digest window has not elapsed yet
+        self.assertEqual(queue_digests(), 0)
+
+    def test_switch_to_immediate_delivery(self):
+        """Pending notifications of users back on immediate delivery are sent without waiting for the window"""
+        self.reader.email_delivery = User.EmailDelivery.IMMEDIATE
+        self.reader.save()
+
+        self.assertEqual(queue_digests(), 1)
+        email = OutboxEmail.objects.get(email=self.reader.email)
+        self.assertEqual(email.subject, "Notification Digest: 5 new notifications")
+        self.assertFalse(Notification.objects.filter(is_emailed=False).exists())
+
+    def test_digest_coalesces_notifications(self):
+        """Pending notifications are sent as a single email per user"""
+        self.assertEqual(queue_digests(window=0), 1)
+        self.assertEqual(queue_digests(window=0), 0)
+
+        email = OutboxEmail.objects.get(email=self.reader.email)
+        self.assertEqual(email.subject, "Notification Digest: 5 new notifications")
+        self.assertIn("Your project has been updated. (x5)", email.body)
+        self.assertFalse(Notification.objects.filter(is_emailed=False).exists())
+
+
+class UnreadCounterTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="reader@test.com", password="12345")
+        project = Project.objects.create(domain=Domain.objects.create(title="counter domain"), title="counter project")
+        self.activity = Activity.objects.create(content_object=project, content=[])
+        self.client.force_authenticate(self.user)
+
+    def get_count(self):
+        response = self.client.get("/api/notifications/unread_count/")
+        self.assertEqual(response.status_code, 200)
+        return response.data["count"]
+
+    def test_counter(self):
+        """The counter follows the notifications created and viewed"""
+        Notification.objects.notify([self.user, self.user], self.activity)
+        notification = Notification.objects.create(user=self.user, content_object=self.activity)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_count(), 3)
+
+        response = self.client.patch(f"/api/notifications/{notification.id}/", {"viewed": True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_count(), 2)
+
+        self.client.post("/api/notifications/mark_all_as_viewed/")
+        self.assertEqual(self.get_count(), 0)
+
+    def test_concurrent_view(self):
+        """A notification viewed by concurrent requests is uncounted once"""
+        Notification.objects.notify([self.user], self.activity)
+        notification = Notification.objects.create(user=self.user, content_object=self.activity)
+        # Loaded by a request before another one marks it as viewed
+        stale = Notification.objects.get(pk=notification.pk)
+
+        self.client.patch(f"/api/notifications/{notification.id}/", {"viewed": True})
+        with mock.patch.object(NotificationViewSet, "get_object", return_value=stale):
+            response = self.client.patch(f"/api/notifications/{notification.id}/", {"viewed": True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_count(), 1)
+
+    def test_reconcile(self):
+        """The reconciliation command recomputes drifted counters"""
+        Notification.objects.notify([self.user], self.activity)
+        UnreadCounter.objects.filter(user=self.user).update(count=5)
+        other = User.objects.create_user(email="other@test.com", password="12345")
+        Notification.objects.bulk_create([Notification(user=other, content_object=self.activity)])
+
+        out = StringIO()
+        call_command("reconcile_unread_counts", stdout=out)
+        self.assertIn("Fixed 2 unread counters", out.getvalue())
+        self.assertEqual(UnreadCounter.objects.get_count(self.user), 1)
+        self.assertEqual(UnreadCounter.objects.get_count(other), 1)
+
+
+class NotificationListTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="reader@test.com", password="12345")
+        project = Project.objects.create(domain=Domain.objects.create(title="list domain"), title="list project")
+        Notification.objects.notify([self.user] * 3, Activity.objects.create(content_object=project, content=[]))
+        self.client.force_authenticate(self.user)
+
+    def test_optional_pagination(self):
+        """The list is returned in full, unless a page is asked for"""
+        self.assertEqual(len(self.client.get("/api/notifications/").data), 3)
+
+        response = self.client.get("/api/notifications/", {"page_size": 2})
+        self.assertEqual(len(response.data["results"]), 2)
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 1)
+
+        response = self.client.get("/api/notifications/", {"page": 2, "page_size": 2})
+        self.assertEqual(response.data["count"], 3)
+
+
+class CleanupNotificationsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="cleaner@test.com", password="12345")
+        domain = Domain.objects.create(title="cleanup domain")
+        self.project = Project.objects.create(domain=domain, title="kept project")
+        deleted = Project.objects.create(domain=domain, title="deleted project")
+
+        self.activity = Activity.objects.create(content_object=self.project, content=[])
+        self.old_activity = Activity.objects.create(content_object=deleted, content=[])
+        dangling = Activity.objects.create(content_object=deleted, content=[])
+
+        self.kept = Notification.objects.create(user=self.user, content_object=self.activity)
+        Notification.objects.create(user=self.user, content_object=dangling)
+        self.expired = Notification.objects.create(user=self.user, content_object=self.old_activity, viewed=True)
+
+        old = timezone.now() - timezone.timedelta(days=100)
+        Notification.objects.filter(pk=self.expired.pk).update(created_at=old)
+        Activity.objects.filter(pk__in=[self.activity.pk, self.old_activity.pk]).update(created_at=old)
+
+        dangling.delete()
+        # `delete()` archives the items
+        Project.objects.filter(pk=deleted.pk).delete()
+
+        fields = {"email": "cleaner@test.com", "subject": "s", "body": "b"}
+        self.old_email = OutboxEmail.objects.create(status=OutboxEmail.Status.SENT, sent_at=old, **fields)
+        self.recent_email = OutboxEmail.objects.create(status=OutboxEmail.Status.SENT, sent_at=timezone.now(), **fields)
+        self.pending_email = OutboxEmail.objects.create(**fields)
+
+    def cleanup(self, *args):
+        out = StringIO()
+        call_command("cleanup_notifications", "--force", "--chunk-size=1", *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run(self):
+        out = self.cleanup("--dry-run")
+        self.assertIn("1 notifications with missing activity", out)
+        self.assertIn("1 viewed notifications older than", out)
+        self.assertIn("1 sent emails older than", out)
+        self.assertEqual(Notification.objects.count(), 3)
+
+    def test_cleanup(self):
+        """Orphans, expired notifications and the activities of deleted items are purged"""
+        self.assertEqual(UnreadCounter.objects.get_count(self.user), 2)
+        self.cleanup()
+
+        self.assertEqual(list(Notification.objects.all()), [self.kept])
+        # The history of the project that still exists is kept
+        self.assertFalse(Activity.objects.filter(pk=self.old_activity.pk).exists())
+        self.assertTrue(Activity.objects.filter(pk=self.activity.pk).exists())
+        self.assertEqual(UnreadCounter.objects.get_count(self.user), 1)
+        # Only the emails sent before the cutoff are purged
+        self.assertFalse(OutboxEmail.objects.filter(pk=self.old_email.pk).exists())
+        self.assertEqual(OutboxEmail.objects.filter(pk__in=[self.recent_email.pk, self.pending_email.pk]).count(), 2)
+
+    def test_retention_disabled(self):
+        self.cleanup("--days=0")
+        self.assertTrue(Notification.objects.filter(pk=self.expired.pk).exists())
+
+
+# Notifications are published in process. Streams query from other threads, which
+# only see committed rows.
+@override_settings(NOTIFICATION_EVENTS_POLL_INTERVAL=None)
+class NotificationEventsTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="listener@test.com", password="12345")
+        project = Project.objects.create(domain=Domain.objects.create(title="events domain"), title="events project")
+        self.activity = Activity.objects.create(content_object=project, content=[])
+        self.url = f"/api/notifications/events/?ticket={self.get_ticket()}"
+
+    def get_ticket(self):
+        response = self.client.post("/api/notifications/events_ticket/", HTTP_AUTHORIZATION=self.authorization)
+        self.assertEqual(response.status_code, 200)
+        return response.data["ticket"]
+
+    @property
+    def authorization(self):
+        return f"Bearer {AccessToken.for_user(self.user)}"
+
+    def notify(self):
+        return Notification.objects.notify([self.user], self.activity)
+
+    async def test_stream(self):
+        """New notifications and unread counts are pushed to the stream"""
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        content = aiter(response.streaming_content)
+        try:
+            self.assertEqual(await anext(content), b'event: unread\ndata: {"count": 0}\n\n')
+
+            await sync_to_async(self.notify)()
+            event = await asyncio.wait_for(anext(content), 5)
+            self.assertTrue(event.startswith(b"event: notification\n"))
+            self.assertEqual(await asyncio.wait_for(anext(content), 5), b'event: unread\ndata: {"count": 1}\n\n')
+        finally:
+            await content.aclose()
+
+    async def test_idle_stream_holds_no_connection(self):
+        """Streams query from shared threads, not the thread of the request, and close their connection"""
+        closing_threads = []
+        with mock.patch.object(
+            events, "close_old_connections", side_effect=lambda: closing_threads.append(threading.get_ident())
+        ):
+            response = await self.async_client.get(self.url)
+            content = aiter(response.streaming_content)
+            try:
+                await anext(content)
+                # The window and the unread count
+                self.assertEqual(len(closing_threads), 2)
+                self.assertNotIn(threading.main_thread().ident, closing_threads)
+                self.assertNotIn(threading.get_ident(), closing_threads)
+            finally:
+                await content.aclose()
+
+    async def test_late_commit(self):
+        """Notifications committed after a newer one are still pushed"""
+        # The id of a notification whose transaction commits late
+        late = await Notification.objects.acreate(user=self.user, content_object=self.activity)
+        late_id = late.id
+        await late.adelete()
+
+        response = await self.async_client.get(self.url)
+        content = aiter(response.streaming_content)
+        try:
+            await anext(content)
+            await sync_to_async(self.notify)()
+            self.assertTrue((await asyncio.wait_for(anext(content), 5)).startswith(b"event: notification\n"))
+            await asyncio.wait_for(anext(content), 5)
+
+            await Notification.objects.acreate(id=late_id, user=self.user, content_object=self.activity)
+            events.broker.publish([self.user.id], events.NOTIFICATIONS)
+            event = await asyncio.wait_for(anext(content), 5)
+            self.assertIn(f'"id": {late_id},'.encode(), event)
+        finally:
+            await content.aclose()
+
+    async def test_single_use_ticket(self):
+        """Tickets open a single stream, and access tokens are not accepted in the URL"""
+        response = await self.async_client.get(self.url)
+        await response.streaming_content.aclose()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 401)
+
+        token = AccessToken.for_user(self.user)
+        self.assertEqual((await self.async_client.get(f"/api/notifications/events/?token={token}")).status_code, 401)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = await self.async_client.get("/api/notifications/events/", headers=headers)
+        await response.streaming_content.aclose()
+        self.assertEqual(response.status_code, 200)
+
+    async def test_unauthenticated(self):
+        response = await self.async_client.get("/api/notifications/events/?ticket=invalid")
+        self.assertEqual(response.status_code, 401)
+
+    def test_wsgi(self):
+        """Streams are refused under WSGI"""
+        self.assertEqual(self.client.get(self.url).status_code, 501)
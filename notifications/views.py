@@ -1,3 +1,9 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db import transaction
+
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.mixins import UpdateModelMixin
@@ -5,11 +11,18 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
 
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+from core.pagination import OptionalFeedPagination
+from core.mixins import ConditionalListMixin
+
 from .serializers import NotificationSerializer
-from .models import Notification
+from .models import Notification, UnreadCounter
+from . import events
 
 
-class NotificationViewSet(UpdateModelMixin, ReadOnlyModelViewSet):
+class NotificationViewSet(ConditionalListMixin, UpdateModelMixin, ReadOnlyModelViewSet):
     """
     A viewset that provides `list`, `retrieve`, and `update` actions
     for notifications belonging to the current user.
@@ -18,12 +31,82 @@ class NotificationViewSet(UpdateModelMixin, ReadOnlyModelViewSet):
     queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalFeedPagination
 
     def get_queryset(self):
         current_user = self.request.user
-        return Notification.objects.filter(user=current_user, viewed=False)
+        # Load the activities and the items they refer to with one query per content type
+        return Notification.objects.filter(user=current_user, viewed=False).prefetch_related(
+            "content_object__content_object"
+        )
+
+    def perform_update(self, serializer):
+        notification = serializer.instance
+        viewed = serializer.validated_data.get("viewed", notification.viewed)
+        with transaction.atomic():
+            # Only the request that flips the flag changes the counter, even if concurrent ones loaded the same row
+            flipped = Notification.objects.filter(pk=notification.pk, viewed=not viewed).update(viewed=viewed)
+            serializer.save()
+            if flipped:
+                UnreadCounter.objects.add({notification.user_id: -1 if viewed else 1})
+
+    @action(detail=False, methods=["GET"])
+    def unread_count(self, request):
+        """
+        Return the number of unread notifications from the counter of the user,
+        without counting the notifications.
+        """
+        return Response({"count": UnreadCounter.objects.get_count(request.user)})
+
+    @action(detail=False, methods=["POST"])
+    def events_ticket(self, request):
+        """
+        Return a single-use ticket opening the events stream, `/api/notifications/events/?ticket=`.
+        """
+        return Response({"ticket": events.create_ticket(request.user)})
 
     @action(detail=False, methods=["POST"])
     def mark_all_as_viewed(self, request):
-        self.get_queryset().update(viewed=True)
+        with transaction.atomic():
+            viewed = Notification.objects.filter(user=request.user, viewed=False).update(viewed=True)
+            UnreadCounter.objects.add({request.user.id: -viewed})
+        events.publish([request.user.id], events.UNREAD)
         return Response({"message": "All notifications marked as viewed."}, status=status.HTTP_200_OK)
+
+
+def get_stream_user(request):
+    """
+    Return the user of the `ticket` query parameter, since browsers cannot set
+    headers on an `EventSource`, or the user authenticated by the Authorization header.
+    """
+    ticket = request.GET.get("ticket")
+    if ticket:
+        user_id = events.redeem_ticket(ticket)
+        return get_user_model().objects.filter(pk=user_id, is_active=True).first() if user_id else None
+
+    authentication = JWTAuthentication()
+    try:
+        result = authentication.authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return result[0] if result else None
+
+
+async def notification_events(request):
+    """
+    Stream the new notifications and the unread count of the current user as
+    Server-Sent Events, see `notifications.events`.
+    """
+    if not isinstance(request, ASGIRequest):
+        # A stream would hold a WSGI worker for as long as it is open
+        return JsonResponse({"detail": "Notification events are only served over ASGI."}, status=501)
+
+    user = await sync_to_async(get_stream_user)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    response = StreamingHttpResponse(events.stream(user), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Disable the buffering of nginx
+    response["X-Accel-Buffering"] = "no"
+    return response
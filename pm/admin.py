@@ -38,6 +38,17 @@ class ActivityAdmin(ModelAdmin):
         return False
 
 
+@admin.register(ActivityArchive)
+class ActivityArchiveAdmin(ModelAdmin):
+    list_display = ("file", "count", "oldest", "newest", "created_at")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Domain)
 class DomainAdmin(ModelAdmin):
     list_display = ("title", "members_count", "created_at", "created_by")
@@ -0,0 +1,166 @@
+"""
+Cold archive of old activities.
+
+`archive_activities()` moves the activities older than a cutoff to gzipped
+NDJSON files saved with the default storage, at most `FILE_SIZE` activities per
+file. Each file is recorded as an `ActivityArchive` with one `ActivityArchiveEntry`
+per item, then its activities are deleted from `pm_activity` by chunks.
+Activities still referred to by a notification are kept.
+
+`get_archived_activities()` reads back the archived history of a single item.
+An interrupted run may leave activities both archived and in the table, so the
+archived ones still in the table are skipped.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+from django.db.models import Exists, OuterRef
+from django.core.files import File
+from django.db import transaction
+from django.conf import settings
+from django.utils import timezone
+
+from core import cache
+
+from notifications.retention import delete_in_chunks
+from notifications.models import Notification
+
+from .models import Activity, ActivityArchive, ActivityArchiveEntry
+
+from collections import Counter
+from datetime import timedelta
+import tempfile
+import gzip
+import json
+
+
+FILE_SIZE = 100_000
+CHUNK_SIZE = 1000
+
+FIELDS = ("id", "content_type_id", "object_id", "action", "content", "created_by_id", "created_at")
+
+
+def get_cutoff(days=None):
+    if days is None:
+        days = settings.ACTIVITY_ARCHIVE_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def get_archivable(cutoff):
+    """
+    Return the activities older than `cutoff` that no notification refers to.
+    """
+    notified = Notification.objects.filter(
+        content_type=ContentType.objects.get_for_model(Activity), object_id=OuterRef("pk")
+    )
+    return Activity.objects.filter(created_at__lt=cutoff).filter(~Exists(notified))
+
+
+def write_archive(activities):
+    """
+    Save the activities to a new archive file and record it, or return `None`
+    if there are none.
+    """
+    entries = Counter()
+    count, oldest, newest, first_id = 0, None, None, None
+
+    with tempfile.TemporaryFile() as buffer:
+        with gzip.GzipFile(fileobj=buffer, mode="wb") as output:
+            for row in activities.order_by("pk").values(*FIELDS).iterator(chunk_size=CHUNK_SIZE):
+                output.write(json.dumps(row, cls=DjangoJSONEncoder).encode() + b"\n")
+                entries[row["content_type_id"], row["object_id"]] += 1
+                count += 1
+                oldest = min(oldest or row["created_at"], row["created_at"])
+                newest = max(newest or row["created_at"], row["created_at"])
+                first_id = first_id or row["id"]
+                last_id = row["id"]
+
+        if not count:
+            return None
+
+        buffer.seek(0)
+        with transaction.atomic():
+            archive = ActivityArchive(count=count, oldest=oldest, newest=newest)
+            archive.file.save(f"activities-{first_id}-{last_id}.ndjson.gz", File(buffer), save=False)
+            archive.save()
+            ActivityArchiveEntry.objects.bulk_create(
+                [
+                    ActivityArchiveEntry(archive=archive, content_type_id=content_type_id, object_id=object_id, count=n)
+                    for (content_type_id, object_id), n in entries.items()
+                ],
+                batch_size=CHUNK_SIZE,
+            )
+
+    return archive
+
+
+def archive_activities(cutoff, file_size=FILE_SIZE, chunk_size=CHUNK_SIZE):
+    """
+    Archive the activities older than `cutoff`, yielding each archive once its
+    activities are deleted.
+    """
+    activities = get_archivable(cutoff)
+    last_pk = 0
+
+    while True:
+        pks = list(activities.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:file_size])
+        if not pks:
+            return
+
+        batch = activities.filter(pk__gt=last_pk, pk__lte=pks[-1])
+        archive = write_archive(batch)
+        if archive is not None:
+            for _ in delete_in_chunks(batch, chunk_size):
+                pass
+            yield archive
+
+        last_pk = pks[-1]
+
+
+def read_archive(archive, content_type_id, object_id):
+    """
+    Return the activities of an item found in an archive file.
+    """
+    activities = []
+    with archive.file.open("rb") as file, gzip.GzipFile(fileobj=file) as lines:
+        for line in lines:
+            row = json.loads(line)
+            if row["content_type_id"] == content_type_id and row["object_id"] == object_id:
+                row["created_at"] = parse_datetime(row["created_at"])
+                activities.append(Activity(**row))
+    return activities
+
+
+def get_archived_activities(content_type_id, object_id):
+    """
+    Return the archived activities of an item, newest first. Archives never
+    change once written, so the activities read from them are cached until a
+    new archive is recorded.
+    """
+
+    def read_archives():
+        archives = ActivityArchive.objects.filter(
+            entries__content_type_id=content_type_id, entries__object_id=object_id
+        ).distinct()
+        activities = {
+            activity.pk: activity
+            for archive in archives
+            for activity in read_archive(archive, content_type_id, object_id)
+        }
+        return sorted(activities.values(), key=lambda activity: (activity.created_at, activity.pk), reverse=True)
+
+    activities = cache.get_or_set(
+        cache.get_model_namespace(ActivityArchive),
+        f"activities:{content_type_id}:{object_id}",
+        read_archives,
+        settings.LIST_CACHE_TIMEOUT,
+    )
+
+    if not activities:
+        return []
+
+    # Left in the table by an interrupted run
+    pks = [activity.pk for activity in activities]
+    in_table = set(Activity.objects.filter(pk__in=pks).values_list("pk", flat=True))
+    return [activity for activity in activities if activity.pk not in in_table]
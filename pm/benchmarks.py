@@ -0,0 +1,406 @@
+"""
+Query-count and latency benchmarks for the API endpoints.
+
+`generate_dataset()` seeds a realistic dataset and `run_benchmarks()` requests
+every GET route registered on the API router twice, recording the number of
+queries, the wall time and the peak memory of the warm request, along with the
+queries and wall time of the first, cold one.
+
+Used by the `benchmark_endpoints` management command and by `pm.tests`.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.conf import settings
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from notifications.models import Notification, UnreadCounter
+from core.utils import get_version
+from core import cache
+
+from .models import Domain, Priority, Status, Project, Task, Subtask
+from .models import Comment, Attachment, Activity
+from .membership import invalidate_domain_ids
+from . import counters, search
+
+from datetime import timedelta
+import tracemalloc
+import random
+import time
+import json
+
+
+User = get_user_model()
+
+
+# Number of rows generated for each model
+SCALES = {
+    "small": {
+        "users": 5,
+        "domains": 2,
+        "projects": 6,
+        "tasks": 30,
+        "subtasks": 30,
+        "comments": 60,
+        "attachments": 20,
+        "activities": 100,
+        "notifications": 100,
+    },
+    "medium": {
+        "users": 50,
+        "domains": 10,
+        "projects": 500,
+        "tasks": 5_000,
+        "subtasks": 5_000,
+        "comments": 10_000,
+        "attachments": 2_000,
+        "activities": 25_000,
+        "notifications": 25_000,
+    },
+    "large": {
+        "users": 200,
+        "domains": 50,
+        "projects": 5_000,
+        "tasks": 50_000,
+        "subtasks": 50_000,
+        "comments": 100_000,
+        "attachments": 20_000,
+        "activities": 250_000,
+        "notifications": 250_000,
+    },
+}
+
+# Maximum number of queries per endpoint, keyed by endpoint name
+DEFAULT_QUERY_BUDGETS = {
+    "default": 15,
+}
+
+BATCH_SIZE = 5000
+
+
+def get_query_budgets():
+    """
+    Return the query budgets, updated with the `BENCHMARK_QUERY_BUDGETS` setting.
+    """
+    budgets = dict(DEFAULT_QUERY_BUDGETS)
+    budgets.update(getattr(settings, "BENCHMARK_QUERY_BUDGETS", {}))
+    return budgets
+
+
+def with_labels(instances):
+    # `bulk_create()` does not compute the labels of the dropdowns
+    instances = list(instances)
+    for instance in instances:
+        instance.set_label()
+    return instances
+
+
+def generate_dataset(scale="small", seed=0):
+    """
+    Populate the database with generated rows for the given scale and return
+    the user the benchmarks run as, along with a sample task.
+    """
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    today = timezone.localdate()
+
+    statuses = [Status.objects.get_or_create(title=title)[0] for title in ("Done", "Ready", "On Track", "Off Track")]
+    priorities = [Priority.objects.get_or_create(title=title)[0] for title in ("Low", "Medium", "High")]
+
+    users = User.objects.bulk_create(
+        with_labels(
+            User(email=f"bench_{i}@example.com", first_name=f"First{i}", last_name=f"Last{i}")
+            for i in range(sizes["users"])
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    user = users[0]
+
+    domains = Domain.objects.bulk_create(
+        with_labels(Domain(title=f"bench domain {i}") for i in range(sizes["domains"])), batch_size=BATCH_SIZE
+    )
+
+    # The benchmark user is a member of a tenth of the domains, like a typical user
+    Membership = Domain.members.through
+    memberships = [Membership(domain_id=domain.id, user_id=user.id) for domain in domains[: max(1, len(domains) // 10)]]
+    memberships += [Membership(domain_id=rng.choice(domains).id, user_id=other.id) for other in users[1:]]
+    Membership.objects.bulk_create(memberships, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    def item_fields(i):
+        return {
+            "title": f"item {i}",
+            "description": f"generated description {i}",
+            "start_date": today - timedelta(days=rng.randint(0, 60)),
+            "end_date": today + timedelta(days=rng.randint(-30, 60)),
+            "status": rng.choice(statuses),
+            "priority": rng.choice(priorities),
+            "created_by": rng.choice(users),
+        }
+
+    projects = Project.objects.bulk_create(
+        with_labels(Project(domain=domains[i % len(domains)], **item_fields(i)) for i in range(sizes["projects"])),
+        batch_size=BATCH_SIZE,
+    )
+    tasks = Task.objects.bulk_create(
+        with_labels(Task(project=projects[i % len(projects)], **item_fields(i)) for i in range(sizes["tasks"])),
+        batch_size=BATCH_SIZE,
+    )
+    subtasks = Subtask.objects.bulk_create(
+        with_labels(Subtask(task=tasks[i % len(tasks)], **item_fields(i)) for i in range(sizes["subtasks"])),
+        batch_size=BATCH_SIZE,
+    )
+
+    for model, items in ((Project, projects), (Task, tasks), (Subtask, subtasks)):
+        Assignment = model.assigned_to.through
+        field_name = f"{model._meta.model_name}_id"
+        Assignment.objects.bulk_create(
+            [Assignment(**{field_name: item.id, "user_id": rng.choice(users).id}) for item in items],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    targets = [
+        (ContentType.objects.get_for_model(model), items)
+        for model, items in ((Project, projects), (Task, tasks), (Subtask, subtasks))
+    ]
+
+    def random_target():
+        content_type, items = rng.choice(targets)
+        return {"content_type": content_type, "object_id": rng.choice(items).id}
+
+    Comment.objects.bulk_create(
+        [
+            Comment(text=f"generated comment {i}", created_by=rng.choice(users), **random_target())
+            for i in range(sizes["comments"])
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    Attachment.objects.bulk_create(
+        [
+            Attachment(
+                file=f"generated/{i}.pdf",
+                file_name=f"{i}.pdf",
+                file_size=1024,
+                created_by=rng.choice(users),
+                **random_target(),
+            )
+            for i in range(sizes["attachments"])
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    def activity_content():
+        if rng.random() < 0.5:
+            return [
+                {
+                    "field": "assigned_to",
+                    "verbose_name": "assigned to",
+                    "old_value": [rng.choice(users).id],
+                    "new_value": [rng.choice(users).id],
+                    "model": "accounts.user",
+                }
+            ]
+        return [{"field": "title", "verbose_name": "title", "old_value": "old", "new_value": "new"}]
+
+    activities = Activity.objects.bulk_create(
+        [
+            Activity(
+                action=Activity.Action_Choices.UPDATE,
+                content=activity_content(),
+                created_by=rng.choice(users),
+                **random_target(),
+            )
+            for _ in range(sizes["activities"])
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    # Most notifications go to the benchmark user, so that their feed is realistic
+    activity_type = ContentType.objects.get_for_model(Activity)
+    Notification.objects.bulk_create(
+        [
+            Notification(
+                user=user if rng.random() < 0.5 else rng.choice(users),
+                content_type=activity_type,
+                object_id=rng.choice(activities).id,
+                viewed=rng.random() < 0.5,
+            )
+            for _ in range(sizes["notifications"])
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    # Bulk inserts do not send the signals invalidating the cached lists
+    cache.invalidate(*[cache.get_model_namespace(model) for model in (User, Domain, Project, Task, Subtask)])
+    invalidate_domain_ids(other.id for other in users)
+    # nor maintain the counters and the search index
+    for model in (Project, Task, Subtask):
+        for _ in counters.rebuild(model):
+            pass
+    for _ in search.rebuild():
+        pass
+    UnreadCounter.objects.reconcile([other.id for other in users])
+
+    task = Task.objects.filter(project__domain__members=user).order_by("pk").first()
+    task.assigned_to.add(user)
+
+    return {"user": user, "task": task}
+
+
+def get_endpoints(dataset):
+    """
+    Return `(name, url, params)` for every GET route registered on the API router.
+
+    Detail routes are resolved later, from the first row of the matching list.
+    """
+    from core.urls import router
+
+    task = dataset["task"]
+    item_params = {"content_type": task.content_type, "object_id": task.id}
+
+    endpoints = []
+    for prefix, viewset, basename in router.registry:
+        name = basename or prefix
+        params = item_params if prefix in ("comments", "attachments") else {}
+        if prefix == "search":
+            params = {"q": task.title.split()[0]}
+
+        if hasattr(viewset, "list"):
+            endpoints.append((f"{name}-list", f"/api/{prefix}/", params))
+            if prefix == "activities":
+                endpoints.append((f"{name}-list-item", f"/api/{prefix}/", item_params))
+            if prefix == "notifications":
+                # Paginated only when a page is asked for
+                endpoints.append((f"{name}-list-page", f"/api/{prefix}/", {"page_size": 10}))
+
+        if hasattr(viewset, "retrieve"):
+            endpoints.append((f"{name}-detail", f"/api/{prefix}/{{pk}}/", {}))
+
+        for extra_action in viewset.get_extra_actions():
+            if "get" not in extra_action.mapping:
+                continue
+            if extra_action.detail:
+                url = f"/api/{prefix}/{{pk}}/{extra_action.url_path}/"
+            else:
+                url = f"/api/{prefix}/{extra_action.url_path}/"
+            # The archived history of an item
+            action_params = item_params if prefix == "activities" else {}
+            endpoints.append((f"{name}-{extra_action.url_name}", url, action_params))
+
+    return endpoints
+
+
+def get_first_pk(data):
+    """
+    Return the id of the first row of a list response, paginated or not.
+    """
+    if isinstance(data, dict):
+        data = data.get("results", [])
+    if not data:
+        return None
+    row = data[0]
+    return row.get("id", row.get("value"))
+
+
+def measure(client, url, params):
+    """
+    Request `url` and return its status code, query count, wall time and peak memory.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, params)
+        if response.streaming:
+            # The rows of the exports are read as they are streamed
+            b"".join(response.streaming_content)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return response, {
+        "status_code": response.status_code,
+        "queries": len(queries),
+        "time_ms": round(elapsed * 1000, 2),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(dataset, budgets=None):
+    """
+    Request every endpoint as the dataset user and return the results, keyed by
+    endpoint name, along with whether each one stayed within its query budget.
+    """
+    budgets = budgets or get_query_budgets()
+
+    client = APIClient()
+    client.force_authenticate(dataset["user"])
+
+    # Primary keys taken from list responses, keyed by URL prefix
+    sample_pks = {}
+    results = {}
+
+    for name, url, params in get_endpoints(dataset):
+        prefix = url.split("{pk}")[0]
+
+        if "{pk}" in url:
+            if sample_pks.get(prefix) is None:
+                continue
+            url = url.format(pk=sample_pks[prefix])
+
+        # The first request runs with cold caches, the second one measures the steady state
+        _, cold = measure(client, url, params)
+        response, result = measure(client, url, params)
+        result.update({"cold_queries": cold["queries"], "cold_time_ms": cold["time_ms"]})
+
+        if url == prefix and response.status_code == 200 and not response.streaming:
+            sample_pks[prefix] = get_first_pk(response.data)
+
+        budget = budgets.get(name, budgets["default"])
+        # Both the cold and the warm requests must stay within the budget
+        within_budget = max(result["queries"], result["cold_queries"]) <= budget
+        result.update({"url": url, "params": params, "budget": budget, "within_budget": within_budget})
+        results[name] = result
+
+    return results
+
+
+def build_report(results, scale):
+    """
+    Return a JSON-serializable report that can be compared with `compare_reports()`.
+    """
+    return {
+        "version": get_version(),
+        "created_at": timezone.now().isoformat(),
+        "database": connection.vendor,
+        "scale": scale,
+        "sizes": SCALES[scale],
+        "endpoints": results,
+    }
+
+
+def compare_reports(baseline, report):
+    """
+    Return the change in queries and wall time of every endpoint present in both reports.
+    """
+    changes = {}
+    for name, result in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if before is None:
+            continue
+        changes[name] = {
+            "queries": result["queries"] - before["queries"],
+            "time_ms": round(result["time_ms"] - before["time_ms"], 2),
+        }
+        # Reports written before the cold requests were measured have no cold counts
+        if "cold_queries" in before:
+            changes[name]["cold_queries"] = result["cold_queries"] - before["cold_queries"]
+    return changes
+
+
+def write_report(report, path):
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
@@ -0,0 +1,369 @@
+"""
+Bulk creation, update and archiving of tasks and subtasks.
+
+The `bulk` endpoints of `BulkItemMixin` validate a whole list of items before
+writing any of them, loading the related rows with one query per field, then
+write them with `bulk_create()`/`bulk_update()` in a single transaction.
+
+These bypass `save()` and the signals, so the functions below maintain what
+they otherwise would: the labels, `updated_at`, the counters of the parents
+(`pm.counters`), the search index (`pm.search`) and the cache namespaces. They
+record one activity per item, and create the notifications of the whole batch
+with a single INSERT.
+"""
+
+from django.forms.models import model_to_dict
+from django.db import transaction
+from django.conf import settings
+from django.utils import timezone
+from django.apps import apps
+
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework import status
+
+from core import cache
+
+from notifications.models import Notification
+
+from .membership import get_domain_ids, invalidate_domains
+from .models import Activity
+from .utils import get_change_message
+from . import counters, search
+
+
+CHUNK_SIZE = 1000
+
+
+def get_parent_field(model):
+    return counters.CHILD_COUNTERS[model._meta.model_name][0]
+
+
+def get_children(model):
+    """
+    Return `(child model, parent field, counter)` for the items directly under
+    the items of `model`.
+    """
+    children = []
+    for name, (parent_field, counter) in counters.CHILD_COUNTERS.items():
+        child = apps.get_model("pm", name)
+        if child._meta.get_field(parent_field).related_model is model:
+            children.append((child, parent_field, counter))
+    return children
+
+
+def get_for_indexing(model, pks):
+    """
+    Return the items with the parents walked to find their domain, the
+    many-to-many relations and the creator loaded.
+    """
+    parents = model.objects.get_queryset().domain_field.split("__")[:-1]
+    return (
+        model._base_manager.filter(pk__in=pks)
+        .select_related("created_by", *(["__".join(parents)] if parents else []))
+        .prefetch_related(*[field.name for field in model._meta.many_to_many])
+        .order_by("pk")
+    )
+
+
+def set_many_to_many(model, items, relations, replace=False):
+    """
+    Set the many-to-many relations given for each item, with one INSERT per
+    field, after deleting their previous ones if `replace`.
+    """
+    for field in model._meta.many_to_many:
+        changed = [(item, relation[field.name]) for item, relation in zip(items, relations) if field.name in relation]
+        if not changed:
+            continue
+
+        through = field.remote_field.through
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+        if replace:
+            through.objects.filter(**{f"{source}_id__in": [item.pk for item, _ in changed]}).delete()
+        through.objects.bulk_create(
+            [through(**{f"{source}_id": item.pk, f"{target}_id": row.pk}) for item, rows in changed for row in rows],
+            batch_size=CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def log(user, items, activity_action, contents):
+    """
+    Create one activity per item with a single INSERT.
+    """
+    return Activity.objects.bulk_create(
+        [
+            Activity(action=activity_action, content=content, content_object=item, created_by=user)
+            for item, content in zip(items, contents)
+        ],
+        batch_size=CHUNK_SIZE,
+    )
+
+
+def invalidate(user, *models):
+    cache.invalidate(*[cache.get_model_namespace(model) for model in models])
+    # The items and their parents are all in the user's domains
+    invalidate_domains(get_domain_ids(user))
+
+
+def create_items(model, user, rows):
+    """
+    Create the items of `model` from the validated data of each row, created
+    by `user`, and return them.
+    """
+    many_to_many = [field.name for field in model._meta.many_to_many]
+    parent_field = get_parent_field(model)
+
+    items, relations = [], []
+    for data in rows:
+        data = dict(data)
+        relations.append({name: data.pop(name) for name in many_to_many if name in data})
+        item = model(created_by=user, **data)
+        item.set_label()
+        items.append(item)
+
+    with transaction.atomic():
+        model.objects.bulk_create(items, batch_size=CHUNK_SIZE)
+        set_many_to_many(model, items, relations)
+        counters.add_to_parents(model, [getattr(item, f"{parent_field}_id") for item in items], 1)
+        search.index_items(model, items)
+
+        activities = log(user, items, Activity.Action_Choices.CREATE, [[] for _ in items])
+        # The assignees and the creator
+        Notification.objects.notify_many(
+            [({*relation.get("assigned_to", []), user}, activity) for relation, activity in zip(relations, activities)]
+        )
+        invalidate(user, model)
+
+    return items
+
+
+def update_items(model, user, changes):
+    """
+    Update items of `model` given as `(instance, validated data)` pairs, the
+    instances with their many-to-many relations prefetched, and return the
+    instances.
+    """
+    many_to_many = [field.name for field in model._meta.many_to_many]
+    parent_field = get_parent_field(model)
+    now = timezone.now()
+
+    before, fields, relations = {}, {"updated_at", "label", "normalized_label"}, []
+    old_parents, new_parents = [], []
+    for instance, data in changes:
+        before[instance.pk] = model_to_dict(instance)
+        old_parent = getattr(instance, f"{parent_field}_id")
+
+        for name, value in data.items():
+            if name not in many_to_many:
+                setattr(instance, name, value)
+                fields.add(name)
+        instance.updated_at = now
+        instance.set_label()
+        relations.append({name: data[name] for name in many_to_many if name in data})
+
+        if getattr(instance, f"{parent_field}_id") != old_parent:
+            old_parents.append(old_parent)
+            new_parents.append(getattr(instance, f"{parent_field}_id"))
+
+    instances = [instance for instance, _ in changes]
+    with transaction.atomic():
+        model._base_manager.bulk_update(instances, sorted(fields), batch_size=CHUNK_SIZE)
+        set_many_to_many(model, instances, relations, replace=True)
+        counters.add_to_parents(model, old_parents, -1)
+        counters.add_to_parents(model, new_parents, 1)
+
+        items = list(get_for_indexing(model, before))
+        search.index_items(model, items)
+
+        changed = [(item, get_change_message(item, before[item.pk])) for item in items]
+        changed = [(item, message) for item, message in changed if message]
+        activities = log(user, [item for item, _ in changed], Activity.Action_Choices.UPDATE, [m for _, m in changed])
+        # The assignees and the creator
+        Notification.objects.notify_many(
+            [({*item.assigned_to.all(), item.created_by}, activity) for (item, _), activity in zip(changed, activities)]
+        )
+        invalidate(user, model)
+
+    return instances
+
+
+def archive_items(model, user, items):
+    """
+    Archive the given items of `model` along with the items under them.
+    """
+    pks = [item.pk for item in items]
+    parent_field = get_parent_field(model)
+    children = get_children(model)
+    now = timezone.now()
+
+    with transaction.atomic():
+        # `update()` does not set `updated_at`, which the sync endpoint relies on
+        model._base_manager.filter(pk__in=pks).update(
+            is_archived=True, updated_at=now, **{counter: 0 for _, _, counter in children}
+        )
+        for child, child_parent_field, _ in children:
+            child._base_manager.filter(**{f"{child_parent_field}__in": pks}).update(is_archived=True, updated_at=now)
+
+        counters.add_to_parents(model, [getattr(item, f"{parent_field}_id") for item in items], -1)
+        search.unindex(model, pks)
+        log(user, items, Activity.Action_Choices.DELETE, [[] for _ in items])
+        invalidate(user, model, *[child for child, _, _ in children])
+
+
+class BulkItemMixin:
+    """
+    Bulk endpoints of the task and subtask viewsets:
+
+    - `POST bulk/` creates the items of a list,
+    - `PATCH bulk/` updates the items of a list, identified by their `id`,
+    - `POST bulk/archive/` archives the items whose ids are given in `ids`.
+
+    Each request handles at most `BULK_MAX_ITEMS` items, all or none of them.
+    The parents must belong to the current user's domains. Errors are returned
+    as a list with an entry for each item.
+    """
+
+    def get_bulk_rows(self, request):
+        rows = request.data
+        if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+            raise ValidationError({"detail": "Expected a non-empty list of items."})
+        if len(rows) > settings.BULK_MAX_ITEMS:
+            raise ValidationError({"detail": f"Expected at most {settings.BULK_MAX_ITEMS} items."})
+        return rows
+
+    def get_bulk_instances(self, ids):
+        """
+        Return the items with the given ids, in the same order.
+        """
+        if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids) or len(set(ids)) != len(ids):
+            raise ValidationError({"detail": "Expected distinct integer ids."})
+
+        instances = self.get_queryset().in_bulk(ids)
+        missing = [pk for pk in ids if pk not in instances]
+        if missing:
+            raise ValidationError({"detail": f"Items not found: {', '.join(map(str, missing))}."})
+        return [instances[pk] for pk in ids]
+
+    def get_bulk_context(self, rows):
+        """
+        Return the serializer context with the related rows referred to by
+        `rows`, loaded with one query per field.
+        """
+        model = self.get_serializer_class().Meta.model
+        parent_field = get_parent_field(model)
+
+        related_objects = {}
+        for name, field in self.get_serializer().fields.items():
+            relation = getattr(field, "child_relation", field)
+            if field.read_only or not isinstance(relation, PrimaryKeyRelatedField):
+                continue
+
+            pks = set()
+            for row in rows:
+                values = row.get(name) if isinstance(row.get(name), list) else [row.get(name)]
+                pks.update(int(value) for value in values if str(value).isdigit())
+
+            queryset = relation.get_queryset()
+            if name == parent_field:
+                # Along with the parents walked to find their domain
+                parent_model = queryset.model
+                parents = parent_model.objects.get_queryset().domain_field.split("__")[:-1]
+                queryset = parent_model.objects.for_user(self.request.user).select_related(*parents)
+            related_objects[name] = queryset.in_bulk(pks)
+
+        return {**self.get_serializer_context(), "related_objects": related_objects}
+
+    def check_unique_titles(self, model, values):
+        """
+        Check that the titles are unique among the children of each parent, given
+        `(instance or None, parent id, title)` for each item.
+        """
+        parent_field = get_parent_field(model)
+        pks = {instance.pk for instance, _, _ in values if instance is not None}
+        existing = set(
+            model._base_manager.filter(
+                **{f"{parent_field}__in": {parent_id for _, parent_id, _ in values}},
+                title__in={title for _, _, title in values},
+            )
+            .exclude(pk__in=pks)
+            .values_list(f"{parent_field}_id", "title")
+        )
+
+        errors, seen = [], set()
+        for _, parent_id, title in values:
+            duplicate = (parent_id, title) in existing or (parent_id, title) in seen
+            message = f"The {parent_field} already has a {model._meta.verbose_name} with this title."
+            errors.append({"title": [message]} if duplicate else {})
+            seen.add((parent_id, title))
+
+        if any(errors):
+            raise ValidationError(errors)
+
+    def get_bulk_response(self, items, status_code=status.HTTP_200_OK):
+        # Serialized in the order of the request
+        pks = [item.pk for item in items]
+        rows = self.get_queryset().in_bulk(pks)
+        return Response(self.get_serializer([rows[pk] for pk in pks], many=True).data, status=status_code)
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        rows = self.get_bulk_rows(request)
+        serializer = self.get_serializer(data=rows, many=True, context=self.get_bulk_context(rows))
+        serializer.is_valid(raise_exception=True)
+
+        model = serializer.child.Meta.model
+        parent_field = get_parent_field(model)
+        self.check_unique_titles(
+            model, [(None, data[parent_field].pk, data["title"]) for data in serializer.validated_data]
+        )
+
+        items = create_items(model, request.user, serializer.validated_data)
+        return self.get_bulk_response(items, status.HTTP_201_CREATED)
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        rows = self.get_bulk_rows(request)
+        instances = self.get_bulk_instances([row.get("id") for row in rows])
+
+        context = self.get_bulk_context(rows)
+        serializers = [
+            self.get_serializer_class()(instance, data=row, partial=True, context=context)
+            for instance, row in zip(instances, rows)
+        ]
+        errors = [{} if serializer.is_valid() else serializer.errors for serializer in serializers]
+        if any(errors):
+            raise ValidationError(errors)
+
+        model = self.get_serializer_class().Meta.model
+        parent_field = get_parent_field(model)
+        self.check_unique_titles(
+            model,
+            [
+                (
+                    serializer.instance,
+                    serializer.validated_data[parent_field].pk
+                    if parent_field in serializer.validated_data
+                    else getattr(serializer.instance, f"{parent_field}_id"),
+                    serializer.validated_data.get("title", serializer.instance.title),
+                )
+                for serializer in serializers
+            ],
+        )
+
+        items = update_items(
+            model, request.user, [(serializer.instance, serializer.validated_data) for serializer in serializers]
+        )
+        return self.get_bulk_response(items)
+
+    @action(detail=False, methods=["post"], url_path="bulk/archive")
+    def bulk_archive(self, request):
+        ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids or len(ids) > settings.BULK_MAX_ITEMS:
+            raise ValidationError({"ids": f"Expected a non-empty list of at most {settings.BULK_MAX_ITEMS} ids."})
+
+        instances = self.get_bulk_instances(ids)
+        archive_items(self.get_serializer_class().Meta.model, request.user, instances)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,149 @@
+"""
+Counters of the comments, attachments and non-archived children of each item,
+stored on the items so that the lists read plain columns.
+
+`pm.signals` maintains them as comments, attachments, tasks and subtasks are
+created and deleted, and `BaseItemMixin.archive()` as items are archived, with
+`UPDATE ... SET count = count + n` statements in the same transaction as the
+change. `rebuild()` recomputes them from the tables.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.functions import Greatest
+from django.db.models import F
+from django.apps import apps
+
+from .managers import count_subquery
+
+from collections import Counter
+
+
+# Counter of the parent of a child item: child model name -> (parent field, counter)
+CHILD_COUNTERS = {
+    "task": ("project", "task_count"),
+    "subtask": ("task", "subtask_count"),
+}
+
+# Counter of the item of a comment or attachment: model name -> counter
+GENERIC_COUNTERS = {
+    "comment": "comment_count",
+    "attachment": "attachment_count",
+}
+
+COUNTER_FIELDS = (*GENERIC_COUNTERS.values(), *(counter for _, counter in CHILD_COUNTERS.values()))
+
+CHUNK_SIZE = 1000
+
+
+def add(model, pk, counter, amount):
+    """
+    Add `amount` to the counter of an item, never going below zero.
+    """
+    model._base_manager.filter(pk=pk).update(**{counter: Greatest(F(counter) + amount, 0)})
+
+
+def add_to_parent(item, amount):
+    """
+    Add `amount` to the counter of the parent of a task or subtask.
+    """
+    if item._meta.model_name not in CHILD_COUNTERS:
+        return
+    parent_field, counter = CHILD_COUNTERS[item._meta.model_name]
+    add(item._meta.get_field(parent_field).related_model, getattr(item, f"{parent_field}_id"), counter, amount)
+
+
+def get_counted_parent(item):
+    """
+    Return the id of the parent whose counter includes the stored row of a task
+    or subtask, `None` if it is archived, not stored or not a child item.
+    """
+    if item._meta.model_name not in CHILD_COUNTERS or item.pk is None:
+        return None
+    parent_field, _ = CHILD_COUNTERS[item._meta.model_name]
+    row = item.__class__._base_manager.filter(pk=item.pk).values_list(f"{parent_field}_id", "is_archived").first()
+    if row is None or row[1]:
+        return None
+    return row[0]
+
+
+def move_in_parents(item, counted_parent_id):
+    """
+    Update the counters of the parents of a saved task or subtask, counted in
+    `counted_parent_id` before the save: it may have moved to another parent,
+    been archived or been restored.
+    """
+    if item._meta.model_name not in CHILD_COUNTERS:
+        return
+    parent_field, counter = CHILD_COUNTERS[item._meta.model_name]
+    parent_id = None if item.is_archived else getattr(item, f"{parent_field}_id")
+    if parent_id == counted_parent_id:
+        return
+
+    parent_model = item._meta.get_field(parent_field).related_model
+    if counted_parent_id is not None:
+        add(parent_model, counted_parent_id, counter, -1)
+    if parent_id is not None:
+        add(parent_model, parent_id, counter, 1)
+
+
+def add_to_parents(model, parent_ids, amount):
+    """
+    Add `amount` to the counters of the parents of tasks or subtasks of `model`,
+    once per occurrence of their id in `parent_ids`, with one UPDATE per
+    distinct total.
+    """
+    if model._meta.model_name not in CHILD_COUNTERS:
+        return
+    parent_field, counter = CHILD_COUNTERS[model._meta.model_name]
+
+    by_total = {}
+    for parent_id, occurrences in Counter(parent_ids).items():
+        by_total.setdefault(occurrences * amount, []).append(parent_id)
+
+    parent_model = model._meta.get_field(parent_field).related_model
+    for total, pks in by_total.items():
+        parent_model._base_manager.filter(pk__in=pks).update(**{counter: Greatest(F(counter) + total, 0)})
+
+
+def add_to_item(instance, amount):
+    """
+    Add `amount` to the counter of the item of a comment or attachment.
+    """
+    model = ContentType.objects.get_for_id(instance.content_type_id).model_class()
+    counter = GENERIC_COUNTERS[instance._meta.model_name]
+    if model is not None and hasattr(model, counter):
+        add(model, instance.object_id, counter, amount)
+
+
+def get_counts(model):
+    """
+    Return the expressions computing the counters of `model` from the tables.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    counts = {
+        counter: count_subquery(apps.get_model("pm", name).objects.filter(content_type=content_type), "object_id")
+        for name, counter in GENERIC_COUNTERS.items()
+    }
+    for name, (parent_field, counter) in CHILD_COUNTERS.items():
+        child = apps.get_model("pm", name)
+        if child._meta.get_field(parent_field).related_model is model:
+            # The default manager leaves the archived items out
+            counts[counter] = count_subquery(child.objects.all(), parent_field)
+    return counts
+
+
+def rebuild(model, chunk_size=CHUNK_SIZE):
+    """
+    Recompute the counters of all the items of `model`, by chunks of primary
+    keys, yielding the number of items updated by each chunk.
+    """
+    items = model._base_manager.order_by("pk")
+    counts = get_counts(model)
+    last_pk = 0
+
+    while True:
+        pks = list(items.filter(pk__gt=last_pk).values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield model._base_manager.filter(pk__gte=pks[0], pk__lte=pks[-1]).update(**counts)
+        last_pk = pks[-1]
@@ -0,0 +1,201 @@
+"""
+Streaming exports of the items and of the activity history, as CSV or NDJSON.
+
+Rows are read with `values_list()` over `iterator(chunk_size=...)`, a server-side
+cursor on PostgreSQL, and written out as they are read, so that the memory used
+does not depend on the number of rows. The labels of the status, priority,
+parents and domain are read through joins, and the assignees of each chunk of
+items with a single query.
+"""
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action
+
+from .models import Project, Task, Subtask, Activity
+
+from itertools import islice
+from datetime import date
+import json
+import csv
+
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+CHUNK_SIZE = 2000
+
+# Exported columns: name -> field path
+ITEM_COLUMNS = {
+    "id": "id",
+    "uuid": "uuid",
+    "title": "title",
+    "description": "description",
+    "status": "status__title",
+    "priority": "priority__title",
+    "start_date": "start_date",
+    "end_date": "end_date",
+    "is_archived": "is_archived",
+    "created_by": "created_by__label",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+    "comment_count": "comment_count",
+    "attachment_count": "attachment_count",
+}
+
+COLUMNS = {
+    Project: {
+        **ITEM_COLUMNS,
+        "domain": "domain__title",
+        "task_count": "task_count",
+    },
+    Task: {
+        **ITEM_COLUMNS,
+        "domain": "project__domain__title",
+        "project": "project__title",
+        "subtask_count": "subtask_count",
+    },
+    Subtask: {
+        **ITEM_COLUMNS,
+        "domain": "task__project__domain__title",
+        "project": "task__project__title",
+        "task": "task__title",
+    },
+    Activity: {
+        "id": "id",
+        "created_at": "created_at",
+        "action": "action",
+        "type": "content_type__model",
+        "object_id": "object_id",
+        "created_by": "created_by__label",
+        "content": "content",
+    },
+}
+
+# Column listing the labels of the assignees of the items
+ASSIGNED_TO = "assigned_to"
+
+# Start of the CSV cells that spreadsheets would evaluate as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def get_column_names(model):
+    names = list(COLUMNS[model])
+    if hasattr(model, ASSIGNED_TO):
+        names.append(ASSIGNED_TO)
+    return names
+
+
+def get_assignees(model, pks):
+    """
+    Return the labels of the assignees of the given items, keyed by item id.
+    """
+    field = model._meta.get_field(ASSIGNED_TO)
+    source = field.m2m_field_name()
+    rows = (
+        field.remote_field.through.objects.filter(**{f"{source}_id__in": pks})
+        .order_by(f"{field.m2m_reverse_field_name()}__label")
+        .values_list(f"{source}_id", f"{field.m2m_reverse_field_name()}__label")
+    )
+
+    assignees = {pk: [] for pk in pks}
+    for pk, label in rows:
+        assignees[pk].append(label)
+    return assignees
+
+
+def get_rows(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yield the exported rows of `queryset` as dicts, reading `chunk_size` rows at a time.
+    """
+    model = queryset.model
+    columns = COLUMNS[model]
+    actions = dict(Activity.Action_Choices.choices)
+
+    # Prefetching is not possible, nor needed, with `values_list()`
+    rows = queryset.prefetch_related(None).values_list(*columns.values()).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = [dict(zip(columns, row)) for row in islice(rows, chunk_size)]
+        if not chunk:
+            return
+
+        if hasattr(model, ASSIGNED_TO):
+            assignees = get_assignees(model, [row["id"] for row in chunk])
+            for row in chunk:
+                row[ASSIGNED_TO] = assignees[row["id"]]
+        if model is Activity:
+            for row in chunk:
+                row["action"] = actions.get(row["action"], row["action"])
+
+        yield from chunk
+
+
+class Echo:
+    """
+    File-like object returning what is written to it, for `csv.writer()`.
+    """
+
+    def write(self, value):
+        return value
+
+
+def format_csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Not evaluated as a formula by spreadsheets
+        return f"'{value}"
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return format_csv_value("; ".join(value))
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def stream_csv(queryset, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(get_column_names(queryset.model))
+    for row in get_rows(queryset, chunk_size):
+        yield writer.writerow([format_csv_value(value) for value in row.values()])
+
+
+def stream_ndjson(queryset, chunk_size=CHUNK_SIZE):
+    for row in get_rows(queryset, chunk_size):
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+def stream(queryset, output, chunk_size=CHUNK_SIZE):
+    """
+    Return an iterator over the lines of the export of `queryset` in the `output` format.
+    """
+    streams = {"csv": stream_csv, "ndjson": stream_ndjson}
+    return streams[output](queryset, chunk_size)
+
+
+class ExportMixin:
+    """
+    `export` action of a viewset, streaming its filtered list as CSV, or as
+    NDJSON with `?output=ndjson`. Viewsets whose list is not scoped to the
+    user's domains override `get_export_queryset()`.
+    """
+
+    def get_export_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        output = request.query_params.get("output", "csv")
+        if output not in FORMATS:
+            raise ValidationError({"output": f"Expected one of {', '.join(FORMATS)}."})
+
+        queryset = self.get_export_queryset()
+        response = StreamingHttpResponse(stream(queryset, output), content_type=FORMATS[output])
+        filename = f"{queryset.model._meta.verbose_name_plural}.{output}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
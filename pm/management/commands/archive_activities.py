@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from pm.archive import FILE_SIZE, CHUNK_SIZE, get_cutoff, get_archivable, archive_activities
+
+
+class Command(BaseCommand):
+    help = "Moves old activities to compressed archive files in the default storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Age in days of the activities archived (default: ACTIVITY_ARCHIVE_DAYS)",
+        )
+        parser.add_argument(
+            "--file-size",
+            type=int,
+            default=FILE_SIZE,
+            help="Maximum number of activities per archive file",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Number of activities deleted per transaction",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the number of activities that would be archived",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = get_cutoff(options["days"])
+        total = get_archivable(cutoff).count()
+        self.stdout.write(f"Found {total} activities older than {cutoff:%Y-%m-%d}.")
+        if options["dry_run"] or not total:
+            return
+
+        archived = 0
+        for archive in archive_activities(cutoff, options["file_size"], options["chunk_size"]):
+            archived += archive.count
+            self.stdout.write(f" - {archive.file.name}: {archive.count} activities ({archived}/{total})")
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} activities."))
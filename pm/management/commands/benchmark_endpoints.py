@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.db import connection
+
+from pm.benchmarks import SCALES, generate_dataset, run_benchmarks, get_query_budgets
+from pm.benchmarks import build_report, compare_reports, write_report
+
+import json
+
+
+class Command(BaseCommand):
+    help = "Seeds a generated dataset in a test database and benchmarks every API endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            choices=SCALES.keys(),
+            default="small",
+            help="Size of the generated dataset",
+        )
+        parser.add_argument(
+            "--output",
+            default="benchmark.json",
+            help="Path of the JSON report",
+        )
+        parser.add_argument(
+            "--compare",
+            metavar="REPORT",
+            help="Path of a previous JSON report to compare the results with",
+        )
+        parser.add_argument(
+            "--budgets",
+            metavar="FILE",
+            help="Path of a JSON file mapping endpoint names to query budgets",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the benchmark database between runs",
+        )
+
+    def handle(self, *args, **options):
+        budgets = get_query_budgets()
+        if options["budgets"]:
+            with open(options["budgets"]) as file:
+                budgets.update(json.load(file))
+
+        # Never seed the configured database, use a throwaway test database instead
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            self.stdout.write(f"Generating the {options['scale']} dataset...")
+            dataset = generate_dataset(options["scale"])
+
+            self.stdout.write("Running benchmarks...")
+            results = run_benchmarks(dataset, budgets)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        report = build_report(results, options["scale"])
+        write_report(report, options["output"])
+
+        changes = {}
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                changes = compare_reports(json.load(file), report)
+
+        for name, result in results.items():
+            line = (
+                f"{name:<40} {result['status_code']} {result['cold_queries']:>5} cold {result['queries']:>5} queries "
+                f"{result['time_ms']:>9} ms {result['peak_memory_kb']:>9} KB"
+            )
+            if name in changes:
+                change = changes[name]
+                details = [f"{change['queries']:+} queries", f"{change['time_ms']:+} ms"]
+                if "cold_queries" in change:
+                    details.insert(0, f"{change['cold_queries']:+} cold")
+                line += f"  ({', '.join(details)})"
+            style = self.style.SUCCESS if result["within_budget"] else self.style.ERROR
+            self.stdout.write(style(line))
+
+        self.stdout.write(f"\nReport written to {options['output']}")
+
+        over_budget = [name for name, result in results.items() if not result["within_budget"]]
+        if over_budget:
+            raise CommandError(f"Query budget exceeded by: {', '.join(over_budget)}")
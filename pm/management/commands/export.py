@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+
+from pm.export import CHUNK_SIZE, COLUMNS, FORMATS, stream
+from pm.membership import filter_by_item_domains
+from pm.views import ProjectFilter, TaskFilter
+from pm.models import Project, Task
+
+
+# Filters accepted by `--filter`, the same as the API lists
+FILTERSETS = {Project: ProjectFilter, Task: TaskFilter}
+
+
+class Command(BaseCommand):
+    help = "Streams the projects, tasks, subtasks or activities as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "model",
+            choices=[model._meta.model_name for model in COLUMNS],
+            help="Rows exported",
+        )
+        parser.add_argument(
+            "--output",
+            choices=list(FORMATS),
+            default="csv",
+            help="Format of the export (default: csv)",
+        )
+        parser.add_argument(
+            "--file",
+            help="File written (default: standard output)",
+        )
+        parser.add_argument(
+            "--user",
+            help="Email of a user, to only export the items of their domains",
+        )
+        parser.add_argument(
+            "--filter",
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="Filter of the projects or tasks, as accepted by their API list, e.g. status=2",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Number of rows read at a time",
+        )
+
+    def get_queryset(self, model, options):
+        if hasattr(model.objects, "with_archived"):
+            queryset = model.objects.with_archived().order_by("pk")
+        else:
+            queryset = model.objects.order_by("pk")
+
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(email=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user with the email {options['user']}.")
+            if hasattr(queryset, "for_user"):
+                queryset = queryset.for_user(user)
+            else:
+                queryset = filter_by_item_domains(queryset, user)
+
+        if options["filter"]:
+            if model not in FILTERSETS:
+                raise CommandError(f"--filter does not apply to {model._meta.verbose_name_plural}.")
+            try:
+                data = dict(value.split("=", 1) for value in options["filter"])
+            except ValueError:
+                raise CommandError("Filters are expected as NAME=VALUE.")
+            filterset = FILTERSETS[model](data, queryset=queryset)
+            if not filterset.is_valid():
+                raise CommandError(f"Invalid filters: {filterset.errors.as_json()}")
+            queryset = filterset.qs
+
+        return queryset
+
+    def handle(self, *args, **options):
+        model = next(model for model in COLUMNS if model._meta.model_name == options["model"])
+        lines = stream(self.get_queryset(model, options), options["output"], options["chunk_size"])
+
+        if not options["file"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        count = -1 if options["output"] == "csv" else 0
+        with open(options["file"], "w", newline="") as file:
+            for line in lines:
+                file.write(line)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} {model._meta.verbose_name_plural}."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from pm.counters import CHUNK_SIZE, rebuild
+from pm.models import Project, Task, Subtask
+
+
+class Command(BaseCommand):
+    help = "Recomputes the comment, attachment, task and subtask counters of the items"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Number of items updated per query",
+        )
+
+    def handle(self, *args, **options):
+        for model in (Project, Task, Subtask):
+            updated = 0
+            for count in rebuild(model, options["chunk_size"]):
+                updated += count
+                self.stdout.write(f"\r - {updated} {model._meta.verbose_name_plural} updated", ending="")
+                self.stdout.flush()
+            self.stdout.write("")
+
+        self.stdout.write(self.style.SUCCESS("Counters rebuilt."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from pm.search import CHUNK_SIZE, rebuild
+
+
+class Command(BaseCommand):
+    help = "Recreates the full-text search index of the projects, tasks, subtasks and comments"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Number of rows indexed per query",
+        )
+
+    def handle(self, *args, **options):
+        indexed = {}
+        for model, count in rebuild(options["chunk_size"]):
+            if indexed and model not in indexed:
+                self.stdout.write("")
+            indexed[model] = indexed.get(model, 0) + count
+            self.stdout.write(f"\r - {indexed[model]} {model._meta.verbose_name_plural} indexed", ending="")
+            self.stdout.flush()
+
+        self.stdout.write(self.style.SUCCESS(f"\nIndexed {sum(indexed.values())} rows."))
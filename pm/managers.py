@@ -1,18 +1,90 @@
 from django.db import models
 from django.apps import apps
-from django.db.models import Q, Count
+from django.db.models import Q, Count, OuterRef, Subquery, Case, When, Value, BooleanField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
+from core import cache
 
-class BaseItemManager(models.Manager):
+
+def count_subquery(queryset, field_name):
+    """
+    Return an expression counting the rows of `queryset` whose `field_name`
+    matches the primary key of the outer query row.
+    """
+    counts = (
+        queryset.filter(**{field_name: OuterRef("pk")})
+        .order_by()
+        .values(field_name)
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+class BaseItemQuerySet(models.QuerySet):
+
+    # Foreign keys read by the item serializers
+    related_fields = ("status", "priority")
+    # Lookup path from the item to its domain
+    domain_field = None
+
+    def for_user(self, user):
+        """
+        Return the items of the domains the user is a member of.
+        """
+        from .membership import filter_by_domains
+
+        return filter_by_domains(self, user, self.domain_field)
+
+    def with_overdue(self):
+        """
+        Annotate each item with `overdue`, computed in the database the same way
+        as `BaseItemMixin.is_overdue`.
+        """
+        Status = apps.get_model("pm", "status")
+        done = Status.objects.get_done()
+
+        if done is None:
+            return self.annotate(overdue=Value(None, output_field=BooleanField()))
+
+        return self.annotate(
+            overdue=Case(
+                When(Q(status_id=done.id) | Q(end_date__isnull=True), then=Value(False)),
+                When(end_date__lt=timezone.localdate(), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            )
+        )
+
+    def for_serializer(self):
+        """
+        Load everything the item serializers read in a fixed number of queries,
+        regardless of the number of rows. Counts are columns, see `pm.counters`.
+        """
+        return self.select_related(*self.related_fields).prefetch_related("assigned_to").with_overdue()
+
+
+class BaseItemManager(models.Manager.from_queryset(BaseItemQuerySet)):
     def get_queryset(self):
-        return super().get_queryset().filter(is_archived=False)
+        return self.with_archived().filter(is_archived=False)
 
+    def with_archived(self):
+        """
+        Return all the items, including the archived ones.
+        """
+        return super().get_queryset()
 
-class ProjectManager(BaseItemManager):
-    pass
+
+class ProjectQuerySet(BaseItemQuerySet):
+
+    related_fields = ("domain", "status", "priority")
+    domain_field = "domain"
 
 
-class TaskManager(BaseItemManager):
+class TaskQuerySet(BaseItemQuerySet):
+
+    domain_field = "project__domain"
 
     # TODO: This method needs improvements
     def assigned_to_user(self, user_id):
@@ -21,14 +93,15 @@ class TaskManager(BaseItemManager):
         +
         Get tasks with subtasks assigned to the user and not done
         """
-        # Try to get DONE status ID, fallback to None if table is empty
-        try:
-            Status = apps.get_model("pm", "status")
-            done_status_id = Status.objects.get(title="DONE").id
-        except Status.DoesNotExist:
-            # If status table is empty, return all tasks for the user
+        Status = apps.get_model("pm", "status")
+        done = Status.objects.get_done()
+
+        if done is None:
+            # If there is no done status, return all tasks for the user
             return self.filter(Q(assigned_to__id=user_id) | Q(subtasks__assigned_to__id=user_id)).distinct()
 
+        done_status_id = done.id
+
         # If we have a done_status_id, proceed with the full query
         return (
             self.filter(Q(assigned_to__id=user_id) | Q(subtasks__assigned_to__id=user_id))
@@ -38,5 +111,58 @@ class TaskManager(BaseItemManager):
         )
 
 
-class SubtaskManager(BaseItemManager):
+class SubtaskQuerySet(BaseItemQuerySet):
+
+    domain_field = "task__project__domain"
+
+
+class ProjectManager(BaseItemManager.from_queryset(ProjectQuerySet)):
     pass
+
+
+class TaskManager(BaseItemManager.from_queryset(TaskQuerySet)):
+    pass
+
+
+class SubtaskManager(BaseItemManager.from_queryset(SubtaskQuerySet)):
+    pass
+
+
+class LookupManager(models.Manager):
+    """
+    Manager for the small lookup tables (Status and Priority).
+
+    Rows are looked up by title, case-insensitively, from the model namespace
+    of `core.cache`, shared by all the processes. The namespace is invalidated
+    whenever a row is saved or deleted, see `pm.signals`.
+    """
+
+    def _get_rows(self):
+        def get_from_database():
+            return {obj.title.lower(): obj for obj in self.all()}
+
+        namespace = cache.get_model_namespace(self.model)
+        return cache.get_or_set(namespace, f"lookup-rows:{self.db}", get_from_database)
+
+    def get_by_title(self, title):
+        """
+        Return the row with the given title, or `None` if there is none.
+        """
+        return self._get_rows().get(title.lower())
+
+    def clear_cache(self):
+        """
+        Clear out the cached rows of this model, in every process.
+        """
+        cache.invalidate(cache.get_model_namespace(self.model))
+
+
+class StatusManager(LookupManager):
+
+    DONE = "Done"
+
+    def get_done(self):
+        """
+        Return the status that marks an item as done, or `None` if it does not exist.
+        """
+        return self.get_by_title(self.DONE)
@@ -0,0 +1,157 @@
+"""
+Ids of the domains each user is a member of, used by every domain scoping
+and permission check.
+
+The ids are memoized on the user instance for the duration of a request and
+stored in a per-user namespace of `core.cache`, so that scoped queries use a
+plain `IN (...)` on a short list of ids instead of joining the membership table.
+`pm.signals` invalidates the namespace of the affected users whenever a
+membership changes. The permission checks and the requests changing data read
+the ids from the database instead, so that a revoked membership never grants
+them access, even while a stale copy is cached.
+
+Each domain also has a namespace whose version changes whenever one of its
+items, or their comments and attachments, changes. It validates the
+conditional requests to the item lists of the members of the domain only.
+"""
+
+from django.db.models import Q
+from django.apps import apps
+
+from core import cache
+
+
+CACHE_TIMEOUT = 60 * 60
+
+# Attributes followed to find the domain of an object
+PARENT_FIELDS = ("task", "project", "content_object")
+
+
+def get_namespace(user_id):
+    return f"pm.domain-membership:{user_id}"
+
+
+def get_domain_ids(user, fresh=False):
+    """
+    Return the ids of the domains the user is a member of, as a frozenset.
+    With `fresh`, the ids are read from the database, once per request, and
+    used by the later lookups of the request.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    try:
+        return user._fresh_domain_ids if fresh else user._domain_ids
+    except AttributeError:
+        pass
+
+    def get_from_database():
+        Membership = apps.get_model("pm", "domain").members.through
+        return frozenset(Membership.objects.filter(user_id=user.pk).values_list("domain_id", flat=True))
+
+    if fresh:
+        user._domain_ids = user._fresh_domain_ids = get_from_database()
+        cache.set(get_namespace(user.pk), "ids", user._domain_ids, CACHE_TIMEOUT)
+    else:
+        user._domain_ids = cache.get_or_set(get_namespace(user.pk), "ids", get_from_database, CACHE_TIMEOUT)
+    return user._domain_ids
+
+
+def invalidate_domain_ids(user_ids):
+    """
+    Discard the cached domain ids of the given users.
+    """
+    cache.invalidate(*[get_namespace(user_id) for user_id in user_ids])
+
+
+def get_domain_namespace(domain_id):
+    return f"pm.domain-items:{domain_id}"
+
+
+def invalidate_domains(domain_ids):
+    """
+    Change the versions of the items of the given domains.
+    """
+    cache.invalidate(*[get_domain_namespace(domain_id) for domain_id in set(domain_ids) if domain_id is not None])
+
+
+def get_stored_domain_ids(model, pks):
+    """
+    Return the ids of the domains of the stored items of `model` with the given pks, with one query.
+    """
+    domain_field = model.objects.get_queryset().domain_field
+    return set(model._base_manager.filter(pk__in=pks).values_list(domain_field, flat=True))
+
+
+def get_item_domain_id(obj):
+    """
+    Return the id of the domain of an item, comment or attachment from its
+    parent, so that it is found after the object is deleted too.
+    """
+    if hasattr(obj, "domain_id"):
+        return obj.domain_id
+
+    if hasattr(obj, "content_type_id"):
+        ContentType = apps.get_model("contenttypes", "contenttype")
+        model, pk = ContentType.objects.get_for_id(obj.content_type_id).model_class(), obj.object_id
+    else:
+        field = next(obj._meta.get_field(name) for name in PARENT_FIELDS if hasattr(obj, f"{name}_id"))
+        model, pk = field.related_model, getattr(obj, field.attname)
+
+    if not hasattr(model.objects, "for_user"):
+        return None
+    return next(iter(get_stored_domain_ids(model, [pk])), None)
+
+
+def filter_by_domains(queryset, user, domain_field="domain"):
+    """
+    Return the rows of `queryset` whose `domain_field` is one of the user's domains.
+    """
+    return queryset.filter(**{f"{domain_field}__in": get_domain_ids(user)})
+
+
+def filter_by_item_domains(queryset, user):
+    """
+    Return the rows of `queryset`, with a generic `content_object`, whose item
+    (project, task or subtask, archived or not) is in one of the user's domains.
+    """
+    ContentType = apps.get_model("contenttypes", "contenttype")
+    items = [apps.get_model("pm", name) for name in ("project", "task", "subtask")]
+
+    condition = Q(pk__in=[])
+    for model, content_type in ContentType.objects.get_for_models(*items).items():
+        pks = model.objects.with_archived().for_user(user).values("pk")
+        condition |= Q(content_type=content_type, object_id__in=pks)
+    return queryset.filter(condition)
+
+
+def has_item(user, content_type_id, object_id):
+    """
+    Return whether the item (project, task or subtask, archived or not) of the
+    given content type and id is in one of the user's domains.
+    """
+    ContentType = apps.get_model("contenttypes", "contenttype")
+    try:
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+    except ContentType.DoesNotExist:
+        return False
+    if model is None or not hasattr(model.objects, "with_archived"):
+        return False
+    return model.objects.with_archived().for_user(user).filter(pk=object_id).exists()
+
+
+def get_domain_id(obj):
+    """
+    Return the id of the domain `obj` belongs to, following its parent items,
+    or `None` if it does not belong to any.
+    """
+    Domain = apps.get_model("pm", "domain")
+
+    while obj is not None:
+        if isinstance(obj, Domain):
+            return obj.pk
+        if hasattr(obj, "domain_id"):
+            return obj.domain_id
+        obj = next((getattr(obj, field) for field in PARENT_FIELDS if hasattr(obj, field)), None)
+
+    return None
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('pm', '0003_alter_project_options_alter_subtask_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='pm_activity_content_0e7340_idx',
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['created_at', 'id'], name='pm_activity_created_1cd21d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['content_type', 'object_id', 'created_at'], name='pm_activity_content_23563a_idx'),
+        ),
+    ]
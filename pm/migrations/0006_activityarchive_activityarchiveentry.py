@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('pm', '0005_attachment_pm_attachment_updated_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='activity-archives/')),
+                ('count', models.PositiveIntegerField()),
+                ('oldest', models.DateTimeField()),
+                ('newest', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'activity archive',
+                'verbose_name_plural': 'activity archives',
+                'ordering': ['-newest'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ActivityArchiveEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='pm.activityarchive')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['content_type', 'object_id'], name='pm_activity_content_402373_idx')],
+            },
+        ),
+    ]
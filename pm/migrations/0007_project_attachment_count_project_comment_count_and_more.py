@@ -0,0 +1,92 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(queryset, field_name):
+    counts = (
+        queryset.filter(**{field_name: OuterRef("pk")})
+        .order_by()
+        .values(field_name)
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def fill_counters(apps, schema_editor):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    Comment = apps.get_model("pm", "Comment")
+    Attachment = apps.get_model("pm", "Attachment")
+    Project = apps.get_model("pm", "Project")
+    Task = apps.get_model("pm", "Task")
+    Subtask = apps.get_model("pm", "Subtask")
+
+    children = {
+        Project: {"task_count": count(Task.objects.filter(is_archived=False), "project")},
+        Task: {"subtask_count": count(Subtask.objects.filter(is_archived=False), "task")},
+        Subtask: {},
+    }
+    for model, counts in children.items():
+        content_type = ContentType.objects.filter(app_label="pm", model=model._meta.model_name).first()
+        if content_type is None:
+            # Fresh database, without any row
+            continue
+        model.objects.update(
+            comment_count=count(Comment.objects.filter(content_type=content_type), "object_id"),
+            attachment_count=count(Attachment.objects.filter(content_type=content_type), "object_id"),
+            **counts,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pm', '0006_activityarchive_activityarchiveentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='attachment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='attachment count'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='comment count'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='task_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='task count'),
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='attachment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='attachment count'),
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='comment count'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='attachment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='attachment count'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='comment count'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtask_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='subtask count'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,171 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+POSTGRESQL = {
+    "forward": [
+        """
+        ALTER TABLE pm_searchindex ADD COLUMN document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+        ) STORED
+        """,
+        "CREATE INDEX pm_searchindex_document_idx ON pm_searchindex USING GIN (document)",
+    ],
+    "backward": [
+        "DROP INDEX IF EXISTS pm_searchindex_document_idx",
+        "ALTER TABLE pm_searchindex DROP COLUMN IF EXISTS document",
+    ],
+}
+
+SQLITE = {
+    "forward": [
+        """
+        CREATE VIRTUAL TABLE pm_searchindex_fts USING fts5(
+            title, body, content='pm_searchindex', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        """
+        CREATE TRIGGER pm_searchindex_fts_insert AFTER INSERT ON pm_searchindex BEGIN
+            INSERT INTO pm_searchindex_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+        END
+        """,
+        """
+        CREATE TRIGGER pm_searchindex_fts_delete AFTER DELETE ON pm_searchindex BEGIN
+            INSERT INTO pm_searchindex_fts (pm_searchindex_fts, rowid, title, body)
+            VALUES ('delete', old.id, old.title, old.body);
+        END
+        """,
+        """
+        CREATE TRIGGER pm_searchindex_fts_update AFTER UPDATE ON pm_searchindex BEGIN
+            INSERT INTO pm_searchindex_fts (pm_searchindex_fts, rowid, title, body)
+            VALUES ('delete', old.id, old.title, old.body);
+            INSERT INTO pm_searchindex_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+        END
+        """,
+    ],
+    "backward": [
+        "DROP TRIGGER IF EXISTS pm_searchindex_fts_update",
+        "DROP TRIGGER IF EXISTS pm_searchindex_fts_delete",
+        "DROP TRIGGER IF EXISTS pm_searchindex_fts_insert",
+        "DROP TABLE IF EXISTS pm_searchindex_fts",
+    ],
+}
+
+
+def run_statements(direction):
+    """
+    Create or drop the full-text index of the database in use, see `pm.search`.
+    """
+
+    def run(apps, schema_editor):
+        statements = {"postgresql": POSTGRESQL, "sqlite": SQLITE}.get(schema_editor.connection.vendor)
+        for statement in (statements or {}).get(direction, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+# Searchable items: model name -> path to their domain id
+ITEM_DOMAINS = {
+    "project": "domain_id",
+    "task": "project__domain_id",
+    "subtask": "task__project__domain_id",
+}
+
+CHUNK_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    """
+    Index the existing items, then their comments, by chunks of primary keys,
+    as `pm.search.rebuild()` does with the current models.
+    """
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    SearchIndex = apps.get_model("pm", "SearchIndex")
+    Comment = apps.get_model("pm", "Comment")
+    db = schema_editor.connection.alias
+
+    for model_name, domain_field in ITEM_DOMAINS.items():
+        model = apps.get_model("pm", model_name)
+        content_type, _ = ContentType.objects.db_manager(db).get_or_create(app_label="pm", model=model_name)
+        rows = (
+            model._base_manager.using(db)
+            .filter(is_archived=False)
+            .order_by("pk")
+            .values_list("pk", "title", "description", domain_field)
+        )
+
+        last_pk = 0
+        while chunk := list(rows.filter(pk__gt=last_pk)[:CHUNK_SIZE]):
+            SearchIndex.objects.using(db).bulk_create(
+                [
+                    SearchIndex(
+                        content_type=content_type,
+                        object_id=pk,
+                        domain_id=domain_id,
+                        title=(title or "")[:128],
+                        body=description or "",
+                    )
+                    for pk, title, description, domain_id in chunk
+                ]
+            )
+            last_pk = chunk[-1][0]
+
+    # Only the comments of indexed items are, in the domain of their item
+    rows = Comment._base_manager.using(db).order_by("pk").values_list("pk", "content_type_id", "object_id", "text")
+    comment_type, _ = ContentType.objects.db_manager(db).get_or_create(app_label="pm", model="comment")
+
+    last_pk = 0
+    while chunk := list(rows.filter(pk__gt=last_pk)[:CHUNK_SIZE]):
+        items = SearchIndex.objects.using(db).filter(
+            content_type_id__in={row[1] for row in chunk}, object_id__in={row[2] for row in chunk}
+        )
+        domain_ids = {
+            (content_type_id, object_id): domain_id
+            for content_type_id, object_id, domain_id in items.values_list("content_type_id", "object_id", "domain_id")
+        }
+        SearchIndex.objects.using(db).bulk_create(
+            [
+                SearchIndex(
+                    content_type=comment_type,
+                    object_id=pk,
+                    domain_id=domain_ids[content_type_id, object_id],
+                    body=text or "",
+                )
+                for pk, content_type_id, object_id, text in chunk
+                if (content_type_id, object_id) in domain_ids
+            ]
+        )
+        last_pk = chunk[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('pm', '0007_project_attachment_count_project_comment_count_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(blank=True, max_length=128)),
+                ('body', models.TextField(blank=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pm.domain')),
+            ],
+            options={
+                'verbose_name': 'search index entry',
+                'verbose_name_plural': 'search index entries',
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id'), name='unique_search_index_object')],
+            },
+        ),
+        migrations.RunPython(run_statements("forward"), run_statements("backward")),
+        # After the full-text index, which SQLite triggers fill on insert
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+from core.utils import normalize_label
+
+
+def fill_labels(apps, schema_editor):
+    # The `__str__()` of each model
+    labels = {
+        "Domain": lambda domain: domain.title,
+        "Project": lambda item: item.title.title(),
+        "Task": lambda item: item.title.title(),
+        "Subtask": lambda item: item.title.title(),
+    }
+    for name, get_label in labels.items():
+        model = apps.get_model("pm", name)
+        last_pk = 0
+        while rows := list(model.objects.filter(pk__gt=last_pk).order_by("pk").only("title")[:1000]):
+            for row in rows:
+                row.label = get_label(row)[:255]
+                row.normalized_label = normalize_label(row.label)[:255]
+            model.objects.bulk_update(rows, ["label", "normalized_label"])
+            last_pk = rows[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pm', '0008_searchindex'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='domain',
+            name='label',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='domain',
+            name='normalized_label',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='label',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='normalized_label',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='label',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='normalized_label',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='label',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='normalized_label',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='domain',
+            index=models.Index(fields=['normalized_label'], name='pm_domain_label_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['normalized_label'], name='pm_project_label_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='subtask',
+            index=models.Index(fields=['normalized_label'], name='pm_subtask_label_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['normalized_label'], name='pm_task_label_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(fill_labels, migrations.RunPython.noop),
+    ]
@@ -3,15 +3,22 @@ from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import get_user_model
 from django.forms.models import model_to_dict
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.apps import apps
 from django.utils import timezone
 
-from core.mixins import TimestampMixin
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from core.pagination import ItemPagination
+from core.mixins import TimestampMixin, LabelMixin, ConditionalListMixin
 from core.utils import get_timesince, get_local_time
 
+from .membership import get_domain_ids, get_domain_namespace
+from .membership import get_stored_domain_ids, invalidate_domains
 from .utils import get_change_message
+from . import counters
 
 from uuid import uuid4
 
@@ -19,7 +26,7 @@ from uuid import uuid4
 User = get_user_model()
 
 
-class BaseItemMixin(TimestampMixin):
+class BaseItemMixin(LabelMixin, TimestampMixin):
     """
     Common fields for projects, tasks, and subtasks models
     """
@@ -60,12 +67,23 @@ class BaseItemMixin(TimestampMixin):
     )
     attachments = GenericRelation("pm.attachment")
     comments = GenericRelation("pm.comment")
+    # Maintained by `pm.counters`
+    comment_count = models.PositiveIntegerField(verbose_name="comment count", default=0, editable=False)
+    attachment_count = models.PositiveIntegerField(verbose_name="attachment count", default=0, editable=False)
 
     all_objects = models.Manager()
 
     class Meta:
         abstract = True
         ordering = ["-status__pk", models.F("end_date").asc(nulls_last=True), "-priority__pk"]
+        indexes = [
+            # Rows changed since the cursor of the sync endpoint
+            models.Index(fields=["updated_at"], name="%(app_label)s_%(class)s_updated_idx"),
+            # Typeahead of the dropdowns
+            models.Index(
+                fields=["normalized_label"], name="%(app_label)s_%(class)s_label_idx", opclasses=["varchar_pattern_ops"]
+            ),
+        ]
 
     def __str__(self):
         return self.title.title()
@@ -93,12 +111,15 @@ class BaseItemMixin(TimestampMixin):
 
     @property
     def is_overdue(self):
-        try:
-            Status = apps.get_model("pm", "status")
-            done = Status.objects.get(title="Done")
-        except:
+        # Use the value annotated by the list query, if any
+        if hasattr(self, "overdue"):
+            return self.overdue
+
+        Status = apps.get_model("pm", "status")
+        done = Status.objects.get_done()
+        if done is None:
             return None
-        if self.status == done or self.end_date is None:
+        if self.status_id == done.id or self.end_date is None:
             return False
         return timezone.localdate() > self.end_date
 
@@ -108,9 +129,86 @@ class BaseItemMixin(TimestampMixin):
         # Archive instead of delete
         self.archive()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.set_loaded_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self.set_loaded_values(fields)
+
+    def get_tracked_fields(self):
+        """
+        Return the parent, domain and archive flag fields of the item, whose
+        changes are counted or invalidate the lists of its domains.
+        """
+        parent_field, _ = counters.CHILD_COUNTERS.get(self._meta.model_name, (None, None))
+        domain_field = self.__class__.objects.get_queryset().domain_field.split("__")[0]
+        return [self._meta.get_field(name) for name in {parent_field, domain_field, "is_archived"} if name]
+
+    def set_loaded_values(self, field_names=None):
+        # Values of the stored row, compared by `save()` to only read the parents and domains of moved items
+        loaded = getattr(self, "_loaded_values", {})
+        deferred = self.get_deferred_fields()
+        for field in self.get_tracked_fields():
+            if field.attname not in deferred and (field_names is None or field.name in field_names):
+                loaded[field.attname] = getattr(self, field.attname)
+        self._loaded_values = loaded
+
+    def get_unchanged_fields(self):
+        """
+        Return the names of the tracked fields loaded with the same value as the instance.
+        """
+        loaded = getattr(self, "_loaded_values", {})
+        return {
+            field.name
+            for field in self.get_tracked_fields()
+            if field.attname in loaded and getattr(self, field.attname) == loaded[field.attname]
+        }
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or kwargs.get("force_insert"):
+            # New items are counted by `pm.signals`
+            super().save(*args, **kwargs)
+            self.set_loaded_values()
+            return
+
+        # The counters of an outdated instance must not overwrite the ones updated in the meantime, nor its
+        # unchanged parent, domain and archive flag the ones of an item moved or archived in the meantime
+        if kwargs.get("update_fields") is None:
+            excluded = {*counters.COUNTER_FIELDS, *self.get_unchanged_fields()}
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in excluded
+            ]
+
+        # Moving, archiving or restoring an item changes the counters of its parents
+        parent_field, _ = counters.CHILD_COUNTERS.get(self._meta.model_name, (None, None))
+        counted = parent_field is not None and not {parent_field, f"{parent_field}_id", "is_archived"}.isdisjoint(
+            kwargs["update_fields"]
+        )
+
+        # Moving an item to another domain changes the lists of both, the new one is invalidated by `pm.signals`
+        domain_field = self.__class__.objects.get_queryset().domain_field.split("__")[0]
+        moved = not {domain_field, f"{domain_field}_id"}.isdisjoint(kwargs["update_fields"])
+
+        with transaction.atomic():
+            counted_parent_id = counters.get_counted_parent(self) if counted else None
+            previous_domain_ids = get_stored_domain_ids(self.__class__, [self.pk]) if moved else ()
+            super().save(*args, **kwargs)
+            if counted:
+                counters.move_in_parents(self, counted_parent_id)
+            invalidate_domains(previous_domain_ids)
+        self.set_loaded_values(kwargs["update_fields"])
+
     def archive(self):
-        self.is_archived = True
-        self.save()
+        with transaction.atomic():
+            self.is_archived = True
+            # Uncounted from the parent by `save()`
+            self.save()
 
     def get_verbose_name(self):
         return self._meta.verbose_name
@@ -158,7 +256,10 @@ class BaseGenericMixin(TimestampMixin):
 
     class Meta:
         abstract = True
-        indexes = [models.Index(fields=["content_type", "object_id"])]
+        indexes = [
+            models.Index(fields=["content_type", "object_id"]),
+            models.Index(fields=["updated_at"], name="%(app_label)s_%(class)s_updated_idx"),
+        ]
         ordering = ["created_at"]
 
     @property
@@ -184,11 +285,19 @@ class LoggingMixin:
     A mixin for Django REST Framework ViewSets that automatically logs changes
     made during update operations. It tracks which fields were modified and
     creates an Activity for each update.
+
+    The domains of the user are read from the database for the requests
+    changing data, so that their scoping does not rely on a stale cache.
     """
 
     MAIN_CLASSES = ("Project", "Task", "Subtask")
     GENERIC_CLASSES = ("Comment", "Attachment")
 
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS:
+            get_domain_ids(request.user, fresh=True)
+
     def get_activity_model(self):
         return apps.get_model("pm", "activity")
 
@@ -216,8 +325,7 @@ class LoggingMixin:
 
         assigned_users.add(request.user)
 
-        for user in assigned_users:
-            Notification.objects.create(user=user, content_object=activity)
+        Notification.objects.notify(assigned_users, activity)
 
     def log_change(self, request, instance, change_message):
 
@@ -240,8 +348,7 @@ class LoggingMixin:
 
         assigned_users.add(instance.created_by)
 
-        for user in assigned_users:
-            Notification.objects.create(user=user, content_object=activity)
+        Notification.objects.notify(assigned_users, activity)
 
     def log_deletion(self, request, instance):
 
@@ -338,3 +445,44 @@ class LoggingMixin:
             self.log_change(self.request, related_instance, change_message)
             # Delete for other types of instances
             instance.delete()
+
+
+class ItemListMixin(ConditionalListMixin):
+    """
+    Paginate the item lists returned by the extra actions of a viewset,
+    and answer conditional requests to all the item lists.
+
+    Lists returned with `always_paginate=False` keep their original shape, a
+    plain list, unless a page is asked for with `?page=` or `?page_size=`.
+    """
+
+    item_pagination_class = ItemPagination
+    # Item rows include the titles of these models
+    conditional_namespaces = ("pm.status", "pm.priority")
+
+    def get_conditional_namespaces(self):
+        # The counts, parents and assignees of the rows change with the items of the user's domains only
+        domain_ids = sorted(get_domain_ids(self.request.user))
+        return (*self.conditional_namespaces, *map(get_domain_namespace, domain_ids))
+
+    def is_page_requested(self):
+        params = (self.item_pagination_class.page_query_param, self.item_pagination_class.page_size_query_param)
+        return any(param in self.request.query_params for param in params)
+
+    def get_item_list_response(self, queryset, serializer_class=None, always_paginate=True):
+        if not queryset.ordered:
+            # Pages must be taken from a stable order
+            queryset = queryset.order_by("pk")
+        serializer_class = serializer_class or self.get_serializer_class()
+
+        def get_response():
+            if not always_paginate and not self.is_page_requested():
+                serializer = serializer_class(queryset, many=True, context=self.get_serializer_context())
+                return Response(serializer.data)
+
+            paginator = self.item_pagination_class()
+            page = paginator.paginate_queryset(queryset, self.request, view=self)
+            serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+            return paginator.get_paginated_response(serializer.data)
+
+        return self.get_conditional_list_response(queryset, get_response)
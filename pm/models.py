@@ -1,11 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import get_user_model
 from django.conf import settings
 
 
-from core.mixins import TimestampMixin
+from core.mixins import TimestampMixin, LabelMixin
 
 from notifications.mixins import NotificationMixin
 
@@ -13,6 +13,7 @@ from .mixins import BaseItemMixin, BaseGenericMixin
 from .utils import attachment_upload_path
 
 from .managers import ProjectManager, TaskManager, SubtaskManager
+from .managers import LookupManager, StatusManager
 
 from uuid import uuid4
 import os
@@ -82,7 +83,11 @@ class Activity(NotificationMixin):
     class Meta(NotificationMixin.Meta):
         verbose_name = "activity"
         verbose_name_plural = "activities"
-        indexes = [models.Index(fields=["content_type", "object_id"])]
+        indexes = [
+            # Keyset pagination of the feed and of the history of an item
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["content_type", "object_id", "created_at"]),
+        ]
 
     def __str__(self):
         return f"{self.get_action_display()} {self.content_type} object: {self.object_id} at {self.created_at}"
@@ -130,7 +135,42 @@ class Activity(NotificationMixin):
             }
 
 
-class Domain(TimestampMixin):
+class ActivityArchive(models.Model):
+    """
+    Compressed NDJSON file of activities moved out of `pm_activity` by the
+    `archive_activities` command, see `pm.archive`.
+    """
+
+    file = models.FileField(upload_to="activity-archives/")
+    count = models.PositiveIntegerField()
+    oldest = models.DateTimeField()
+    newest = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "activity archive"
+        verbose_name_plural = "activity archives"
+        ordering = ["-newest"]
+
+    def __str__(self):
+        return f"{self.count} activities from {self.oldest:%Y-%m-%d} to {self.newest:%Y-%m-%d}"
+
+
+class ActivityArchiveEntry(models.Model):
+    """
+    Number of activities of an item in an archive, to find the archives of an item.
+    """
+
+    archive = models.ForeignKey(ActivityArchive, related_name="entries", on_delete=models.CASCADE)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["content_type", "object_id"])]
+
+
+class Domain(LabelMixin, TimestampMixin):
 
     uuid = models.UUIDField(unique=True, editable=False, default=uuid4)
     title = models.CharField(max_length=128, unique=True)
@@ -140,6 +180,12 @@ class Domain(TimestampMixin):
         User, blank=True, null=True, related_name="%(class)s_created_by", on_delete=models.SET_NULL
     )
 
+    class Meta:
+        # Typeahead of the domain dropdown
+        indexes = [
+            models.Index(fields=["normalized_label"], name="pm_domain_label_idx", opclasses=["varchar_pattern_ops"])
+        ]
+
     def __str__(self):
         return self.title
 
@@ -151,6 +197,8 @@ class Priority(TimestampMixin):
 
     title = models.CharField(max_length=32, unique=True)
 
+    objects = LookupManager()
+
     class Meta:
         verbose_name = "priority"
         verbose_name_plural = "priorities"
@@ -166,6 +214,8 @@ class Status(TimestampMixin):
 
     title = models.CharField(max_length=32, unique=True)
 
+    objects = StatusManager()
+
     class Meta:
         verbose_name = "status"
         verbose_name_plural = "statuses"
@@ -185,6 +235,8 @@ class Project(BaseItemMixin):
         on_delete=models.CASCADE,
         related_name="%(class)ss",
     )
+    # Non-archived tasks, maintained by `pm.counters`
+    task_count = models.PositiveIntegerField(verbose_name="task count", default=0, editable=False)
 
     objects = ProjectManager()
 
@@ -198,9 +250,13 @@ class Project(BaseItemMixin):
         ]
 
     def archive(self):
-        super().archive()
-        self.tasks.update(is_archived=True)
-        Subtask.objects.filter(task__project=self).update(is_archived=True)
+        with transaction.atomic():
+            super().archive()
+            # `update()` does not set `updated_at`, which the sync endpoint relies on
+            self.tasks.update(is_archived=True, subtask_count=0, updated_at=self.updated_at)
+            Subtask.objects.filter(task__project=self).update(is_archived=True, updated_at=self.updated_at)
+            Project.all_objects.filter(pk=self.pk).update(task_count=0)
+            self.task_count = 0
 
 
 class Task(BaseItemMixin):
@@ -214,6 +270,8 @@ class Task(BaseItemMixin):
         on_delete=models.CASCADE,
         related_name="%(class)ss",
     )
+    # Non-archived subtasks, maintained by `pm.counters`
+    subtask_count = models.PositiveIntegerField(verbose_name="subtask count", default=0, editable=False)
 
     objects = TaskManager()
 
@@ -221,8 +279,11 @@ class Task(BaseItemMixin):
         constraints = [models.UniqueConstraint(fields=["project", "title"], name="unique_project_title")]
 
     def archive(self):
-        super().archive()
-        self.subtasks.update(is_archived=True)
+        with transaction.atomic():
+            super().archive()
+            self.subtasks.update(is_archived=True, updated_at=self.updated_at)
+            Task.all_objects.filter(pk=self.pk).update(subtask_count=0)
+            self.subtask_count = 0
 
 
 class Subtask(BaseItemMixin):
@@ -241,3 +302,31 @@ class Subtask(BaseItemMixin):
 
     class Meta(BaseItemMixin.Meta):
         constraints = [models.UniqueConstraint(fields=["task", "title"], name="unique_task_title")]
+
+
+class SearchIndex(models.Model):
+    """
+    Searchable text of a project, task, subtask or comment, see `pm.search`.
+
+    The full-text index itself is maintained by the database from `title` and
+    `body`: a `tsvector` column with a GIN index on PostgreSQL, an FTS5 table
+    kept current by triggers on SQLite.
+    """
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey("content_type", "object_id")
+    domain = models.ForeignKey(Domain, on_delete=models.CASCADE)
+    title = models.CharField(max_length=128, blank=True)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "search index entry"
+        verbose_name_plural = "search index entries"
+        constraints = [
+            models.UniqueConstraint(fields=["content_type", "object_id"], name="unique_search_index_object")
+        ]
+
+    def __str__(self):
+        return f"{self.content_type} {self.object_id}"
+
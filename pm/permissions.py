@@ -1,6 +1,8 @@
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.permissions import SAFE_METHODS
 
+from .membership import get_domain_ids, get_domain_id
+
 
 class IsOwnerOrReadOnly(IsAuthenticated):
     """
@@ -15,3 +17,13 @@ class IsOwnerOrReadOnly(IsAuthenticated):
 
         # Allow write access only if the user is the object owner
         return obj.created_by == request.user
+
+
+class IsDomainMember(IsAuthenticated):
+    """
+    Custom permission to allow access to an object only to the members of the domain it belongs to.
+    The membership is read from the database, not from the cache, so that it is revoked at once.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        return get_domain_id(obj) in get_domain_ids(request.user, fresh=True)
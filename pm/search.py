@@ -0,0 +1,285 @@
+"""
+Full-text search of the projects, tasks, subtasks and comments.
+
+Each searchable row has a `SearchIndex` entry holding its text and the domain it
+belongs to, kept current by `pm.signals` on save, delete and archive. The
+database indexes the entries itself (see the `0008_searchindex` migration):
+
+- PostgreSQL: a generated `tsvector` column, `document`, with a GIN index,
+- SQLite: an FTS5 table, `pm_searchindex_fts`, kept current by triggers.
+
+Queries only read the full-text index and the entries of the matching rows, so
+their cost depends on the number of matches rather than on the size of the
+tables. Each word of a query must match the start of a word of the entry.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.expressions import RawSQL
+from django.db.models import BooleanField, FloatField
+from django.db import connection
+
+from rest_framework.filters import BaseFilterBackend
+
+from .membership import get_domain_id, get_domain_ids
+from .models import Project, Task, Subtask, Comment, SearchIndex
+
+import re
+
+
+# Searchable models, and the fields of their title and body
+INDEXED_FIELDS = {
+    Project: ("title", "description"),
+    Task: ("title", "description"),
+    Subtask: ("title", "description"),
+    Comment: (None, "text"),
+}
+
+# Parent items of the searchable items: model -> (child model, parent field)
+CHILDREN = {
+    Project: [(Task, "project"), (Subtask, "task__project")],
+    Task: [(Subtask, "task")],
+    Subtask: [],
+}
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+CHUNK_SIZE = 1000
+
+
+def get_words(query):
+    return re.findall(r"\w+", query)
+
+
+def get_tsquery(words):
+    # PostgreSQL `to_tsquery()` syntax
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def get_fts_query(words):
+    # SQLite FTS5 syntax
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def filter_entries(query, entries):
+    """
+    Return the entries matching `query`, for the database in use.
+    """
+    words = get_words(query)
+    if not words:
+        return entries.none()
+
+    if connection.vendor == "postgresql":
+        match = RawSQL("document @@ to_tsquery('simple', %s)", [get_tsquery(words)], output_field=BooleanField())
+        return entries.alias(match=match).filter(match=True)
+
+    return entries.filter(
+        id__in=RawSQL("SELECT rowid FROM pm_searchindex_fts WHERE pm_searchindex_fts MATCH %s", [get_fts_query(words)])
+    )
+
+
+def search_entries(query, entries):
+    """
+    Return the entries matching `query`, annotated with their `rank`, best first.
+    """
+    words = get_words(query)
+    entries = filter_entries(query, entries)
+
+    if connection.vendor == "postgresql":
+        rank = RawSQL("ts_rank(document, to_tsquery('simple', %s))", [get_tsquery(words)], output_field=FloatField())
+    else:
+        # `bm25()` is lower for better matches, the title weighs more than the body
+        rank = RawSQL(
+            "(SELECT -bm25(pm_searchindex_fts, 10.0, 1.0) FROM pm_searchindex_fts "
+            "WHERE pm_searchindex_fts MATCH %s AND rowid = pm_searchindex.id)",
+            [get_fts_query(words)],
+            output_field=FloatField(),
+        )
+
+    return entries.annotate(rank=rank).order_by("-rank", "id")
+
+
+def search(user, query, models=None, limit=DEFAULT_LIMIT):
+    """
+    Return the entries of the user's domains best matching `query`, limited to
+    the given searchable models.
+    """
+    entries = SearchIndex.objects.filter(domain__in=get_domain_ids(user)).select_related("content_type")
+    if models is not None:
+        entries = entries.filter(content_type__in=ContentType.objects.get_for_models(*models).values())
+    return list(search_entries(query, entries)[:limit])
+
+
+def get_entry_values(instance, domain_id=None):
+    """
+    Return the fields of the entry of a searchable row, or `None` if it should
+    not be searchable. Archived items and their comments are not.
+    """
+    title_field, body_field = INDEXED_FIELDS[instance.__class__]
+    if domain_id is None:
+        if getattr(instance, "is_archived", False):
+            return None
+        if isinstance(instance, Comment) and getattr(instance.content_object, "is_archived", True):
+            return None
+        domain_id = get_domain_id(instance)
+
+    if domain_id is None:
+        return None
+
+    return {
+        "domain_id": domain_id,
+        "title": (getattr(instance, title_field) or "")[:128] if title_field else "",
+        "body": getattr(instance, body_field) or "",
+    }
+
+
+def index(instance):
+    """
+    Create, update or delete the entry of a searchable row. When the domain of an
+    item changes, the entries of its children and comments follow it.
+    """
+    content_type = ContentType.objects.get_for_model(instance)
+    values = get_entry_values(instance)
+
+    if values is None:
+        unindex(instance.__class__, [instance.pk])
+        return
+
+    previous = SearchIndex.objects.filter(content_type=content_type, object_id=instance.pk).first()
+    SearchIndex.objects.update_or_create(content_type=content_type, object_id=instance.pk, defaults=values)
+
+    if previous is not None and previous.domain_id != values["domain_id"]:
+        for queryset in get_related_querysets(instance.__class__, [instance.pk]):
+            SearchIndex.objects.filter(
+                content_type=ContentType.objects.get_for_model(queryset.model),
+                object_id__in=queryset.values("pk"),
+            ).update(domain_id=values["domain_id"])
+
+
+def index_items(model, items):
+    """
+    Same as `index()` for several rows of `model`, with a fixed number of queries.
+    The parents of the rows should be loaded, to find their domain.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    values = {instance.pk: get_entry_values(instance) for instance in items}
+    entries = SearchIndex.objects.filter(content_type=content_type, object_id__in=values)
+    previous = dict(entries.values_list("object_id", "domain_id"))
+
+    archived = [pk for pk, fields in values.items() if fields is None]
+    if archived:
+        unindex(model, archived)
+    entries.delete()
+    SearchIndex.objects.bulk_create(
+        [
+            SearchIndex(content_type=content_type, object_id=pk, **fields)
+            for pk, fields in values.items()
+            if fields is not None
+        ],
+        batch_size=CHUNK_SIZE,
+    )
+
+    moved = {}
+    for pk, fields in values.items():
+        if fields is not None and pk in previous and previous[pk] != fields["domain_id"]:
+            moved.setdefault(fields["domain_id"], []).append(pk)
+
+    for domain_id, pks in moved.items():
+        for queryset in get_related_querysets(model, pks):
+            SearchIndex.objects.filter(
+                content_type=ContentType.objects.get_for_model(queryset.model),
+                object_id__in=queryset.values("pk"),
+            ).update(domain_id=domain_id)
+
+
+def get_related_querysets(model, pks):
+    """
+    Return the querysets of the items under the given items, and of the comments
+    of all of them, including the given items.
+    """
+    items = [model._base_manager.filter(pk__in=pks)] + [
+        child._base_manager.filter(**{f"{parent_field}__in": pks}) for child, parent_field in CHILDREN.get(model, [])
+    ]
+    comments = [
+        Comment.objects.filter(
+            content_type=ContentType.objects.get_for_model(queryset.model), object_id__in=queryset.values("pk")
+        )
+        for queryset in items
+    ]
+    return items + comments
+
+
+def unindex(model, pks):
+    """
+    Delete the entries of the given rows, and of the items and comments under them.
+    """
+    SearchIndex.objects.filter(content_type=ContentType.objects.get_for_model(model), object_id__in=pks).delete()
+    if model is Comment:
+        return
+
+    for related in get_related_querysets(model, pks):
+        SearchIndex.objects.filter(
+            content_type=ContentType.objects.get_for_model(related.model), object_id__in=related.values("pk")
+        ).delete()
+
+
+def rebuild(chunk_size=CHUNK_SIZE):
+    """
+    Recreate all the entries, yielding `(model, number of rows indexed)` for each chunk.
+    """
+    SearchIndex.objects.all().delete()
+
+    for model in INDEXED_FIELDS:
+        content_type = ContentType.objects.get_for_model(model)
+        rows = model._base_manager.order_by("pk")
+        if model is not Comment:
+            # The parents walked to find the domain
+            parents = model.objects.get_queryset().domain_field.split("__")[:-1]
+            rows = rows.filter(is_archived=False).select_related(*(["__".join(parents)] if parents else []))
+
+        last_pk = 0
+        while True:
+            chunk = list(rows.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+
+            if model is Comment:
+                # The items are indexed first, only the comments of indexed items are
+                items = SearchIndex.objects.filter(
+                    content_type_id__in={comment.content_type_id for comment in chunk},
+                    object_id__in={comment.object_id for comment in chunk},
+                ).values_list("content_type_id", "object_id", "domain_id")
+                domain_ids = {(row[0], row[1]): row[2] for row in items}
+                values = [
+                    (comment, get_entry_values(comment, domain_ids[comment.content_type_id, comment.object_id]))
+                    for comment in chunk
+                    if (comment.content_type_id, comment.object_id) in domain_ids
+                ]
+            else:
+                values = [(instance, get_entry_values(instance)) for instance in chunk]
+
+            entries = [
+                SearchIndex(content_type=content_type, object_id=instance.pk, **fields)
+                for instance, fields in values
+                if fields is not None
+            ]
+            SearchIndex.objects.bulk_create(entries)
+            last_pk = chunk[-1].pk
+            yield model, len(entries)
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Filter the items on the `fulltext` query parameter with the full-text index,
+    matching the start of words without scanning every row, unlike the
+    substrings of `SearchFilter` and `?search=`.
+    """
+
+    search_param = "fulltext"
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+
+        entries = SearchIndex.objects.filter(content_type=ContentType.objects.get_for_model(queryset.model))
+        return queryset.filter(pk__in=filter_entries(query, entries).values("object_id"))
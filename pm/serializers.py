@@ -1,14 +1,15 @@
-from django.template.defaultfilters import filesizeformat
+from django.template.defaultfilters import filesizeformat, truncatechars
+from django.db import models
 
-from rest_framework.serializers import ModelSerializer, SerializerMethodField
+from rest_framework.serializers import ModelSerializer, SerializerMethodField, PrimaryKeyRelatedField
 
 from rest_framework import serializers
 from core.mixins import DropdownModelSerializer
 
 from .models import Domain, Priority, Status, Project, Task, Subtask
-from .models import Comment, Attachment, Activity
+from .models import Comment, Attachment, Activity, SearchIndex
 
-from .utils import get_activity_description, file_type_validator
+from .utils import get_activity_description, get_object_labels, file_type_validator
 
 
 class DomainSerializer(ModelSerializer):
@@ -19,38 +20,59 @@ class DomainSerializer(ModelSerializer):
 
 
 class DomainDropdownSerializer(DropdownModelSerializer):
+    label_expression = "label"
 
     class Meta:
         model = Domain
 
 
 class PriorityDropdownSerializer(DropdownModelSerializer):
+    label_expression = "title"
 
     class Meta:
         model = Priority
 
 
 class StatusDropdownSerializer(DropdownModelSerializer):
+    label_expression = "title"
 
     class Meta:
         model = Status
 
 
+class PreloadedPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+    Primary key field looking up the rows preloaded in the `related_objects` of
+    the context, by field name, instead of querying them one by one. Set by the
+    bulk endpoints, see `pm.bulk`.
+    """
+
+    def to_internal_value(self, data):
+        # The child of a many-to-many field has no name
+        name = self.field_name or self.parent.field_name
+        preloaded = self.context.get("related_objects", {}).get(name)
+        if preloaded is None:
+            return super().to_internal_value(data)
+
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return preloaded[int(data)]
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
 class BaseItemSerializerMixin(ModelSerializer):
     """
     Mixin to provide common fields and methods for Project, Task, and Subtask
     """
 
+    serializer_related_field = PreloadedPrimaryKeyRelatedField
+
     status_title = serializers.CharField(source="status.title", read_only=True)
     priority_title = serializers.CharField(source="priority.title", read_only=True)
-    comment_count = SerializerMethodField()
-    attachment_count = SerializerMethodField()
-
-    def get_comment_count(self, instance):
-        return instance.get_comment_count()
-
-    def get_attachment_count(self, instance):
-        return instance.get_attachment_count()
 
     class Meta:
         fields = [
@@ -76,18 +98,20 @@ class BaseItemSerializerMixin(ModelSerializer):
 
         read_only_fields = ["uuid", "created_by", "content_type"]
 
+    def get_validators(self):
+        # The bulk endpoints check the unique constraints of the whole list at once
+        if "related_objects" in self.context:
+            return []
+        return super().get_validators()
+
 
 class ProjectSerializer(BaseItemSerializerMixin):
 
     domain_title = SerializerMethodField()
-    task_count = SerializerMethodField()
 
     def get_domain_title(self, instance):
         return instance.domain.title
 
-    def get_task_count(self, instance):
-        return instance.tasks.count()
-
     class Meta(BaseItemSerializerMixin.Meta):
         model = Project
         fields = BaseItemSerializerMixin.Meta.fields + [
@@ -99,11 +123,6 @@ class ProjectSerializer(BaseItemSerializerMixin):
 
 class TaskSerializer(BaseItemSerializerMixin):
 
-    subtask_count = SerializerMethodField()
-
-    def get_subtask_count(self, instance):
-        return instance.subtasks.count()
-
     class Meta(BaseItemSerializerMixin.Meta):
         model = Task
         fields = BaseItemSerializerMixin.Meta.fields + ["project", "subtask_count"]
@@ -166,6 +185,18 @@ class AttachmentSerializer(ModelSerializer):
         ]
 
 
+class ActivityListSerializer(serializers.ListSerializer):
+    """
+    Resolve the objects referenced by all the activities of a page at once,
+    instead of once per activity.
+    """
+
+    def to_representation(self, data):
+        activities = data.all() if isinstance(data, models.manager.BaseManager) else data
+        self.context["object_labels"] = get_object_labels(activities)
+        return super().to_representation(activities)
+
+
 class ActivitySerializer(ModelSerializer):
     content_type = SerializerMethodField()
     description = SerializerMethodField()
@@ -175,13 +206,14 @@ class ActivitySerializer(ModelSerializer):
         return obj.content_type.model if obj.content_type else None
 
     def get_description(self, obj):
-        return get_activity_description(obj)
+        return get_activity_description(obj, self.context.get("object_labels"))
 
     def get_url(self, obj):
         return obj.get_related_url()
 
     class Meta:
         model = Activity
+        list_serializer_class = ActivityListSerializer
         fields = [
             "id",
             "get_action_display",
@@ -192,3 +224,42 @@ class ActivitySerializer(ModelSerializer):
             "created_by",
             "time_since_creation",
         ]
+
+
+class SearchIndexListSerializer(serializers.ListSerializer):
+    """
+    Resolve the items of all the comments found at once.
+    """
+
+    def to_representation(self, data):
+        entries = list(data)
+        comment_ids = [entry.object_id for entry in entries if entry.content_type.model == "comment"]
+        comments = Comment.objects.filter(pk__in=comment_ids).values_list("pk", "content_type__model", "object_id")
+        self.context["comment_items"] = {pk: {"type": model, "id": object_id} for pk, model, object_id in comments}
+        return super().to_representation(entries)
+
+
+class SearchIndexSerializer(ModelSerializer):
+    """
+    Row found by the search, see `pm.search`.
+    """
+
+    type = serializers.CharField(source="content_type.model")
+    id = serializers.IntegerField(source="object_id")
+    text = SerializerMethodField()
+    rank = serializers.FloatField()
+    item = SerializerMethodField()
+
+    def get_text(self, entry):
+        return truncatechars(entry.body, 200)
+
+    def get_item(self, entry):
+        # The item of a comment
+        if entry.content_type.model != "comment":
+            return None
+        return self.context.get("comment_items", {}).get(entry.object_id)
+
+    class Meta:
+        model = SearchIndex
+        list_serializer_class = SearchIndexListSerializer
+        fields = ["type", "id", "domain", "title", "text", "rank", "item"]
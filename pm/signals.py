@@ -0,0 +1,140 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from core.cache import invalidate_on_change
+
+from .models import Domain, Priority, Status, Project, Task, Subtask, Comment, Attachment, ActivityArchive
+from .membership import invalidate_domain_ids, invalidate_domains
+from .membership import get_item_domain_id, get_stored_domain_ids
+from .utils import object_labels
+from . import counters, search
+
+
+User = get_user_model()
+
+# Cached by the `options/*` endpoints and the lookup managers, or validating the conditional requests to the item lists
+invalidate_on_change(Domain, Project, Task, Subtask, Priority, Status, Comment, Attachment)
+# Users are saved on every login, see `UPDATE_LAST_LOGIN`
+invalidate_on_change(User, ignored_fields=["last_login"])
+# Archived activities read by `pm.archive`
+invalidate_on_change(ActivityArchive)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def clear_user_label(sender, instance, **kwargs):
+    # User labels are cached for activity descriptions
+    object_labels.delete((sender._meta.label_lower, instance.pk))
+
+
+@receiver(post_save, sender=User)
+def clear_new_user_membership(sender, instance, created, **kwargs):
+    # The id of a deleted user may be reused
+    if created:
+        invalidate_domain_ids([instance.pk])
+
+
+@receiver(m2m_changed, sender=Domain.members.through)
+def clear_domain_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    # Domain ids are cached for each user
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if reverse:
+        # `instance` is the user
+        instance.__dict__.pop("_domain_ids", None)
+        invalidate_domain_ids([instance.pk])
+    elif pk_set is not None:
+        invalidate_domain_ids(pk_set)
+    else:
+        # The members are unknown once cleared
+        invalidate_domain_ids(instance.members.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Domain)
+def clear_deleted_domain_membership(sender, instance, **kwargs):
+    invalidate_domain_ids(instance.members.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+def clear_domain_items(sender, instance, **kwargs):
+    invalidate_domains([instance.pk])
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Subtask)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Attachment)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Subtask)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Attachment)
+def clear_item_domain(sender, instance, **kwargs):
+    # Validates the conditional requests to the item lists of the domain
+    invalidate_domains([get_item_domain_id(instance)])
+
+
+@receiver(m2m_changed, sender=Project.assigned_to.through)
+@receiver(m2m_changed, sender=Task.assigned_to.through)
+@receiver(m2m_changed, sender=Subtask.assigned_to.through)
+def clear_assigned_item_domain(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if not reverse:
+        invalidate_domains([get_item_domain_id(instance)])
+    elif pk_set is not None:
+        # `instance` is the user
+        invalidate_domains(get_stored_domain_ids(model, pk_set))
+    else:
+        invalidate_domains(get_stored_domain_ids(model, model._base_manager.filter(assigned_to=instance).values("pk")))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Attachment)
+def count_new_generic(sender, instance, created, **kwargs):
+    if created:
+        counters.add_to_item(instance, 1)
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Attachment)
+def count_deleted_generic(sender, instance, **kwargs):
+    counters.add_to_item(instance, -1)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Subtask)
+def count_new_child(sender, instance, created, **kwargs):
+    # Moving, archiving and restoring are counted by `BaseItemMixin.save()`
+    if created and not instance.is_archived:
+        counters.add_to_parent(instance, 1)
+
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Subtask)
+def count_deleted_child(sender, instance, **kwargs):
+    # `delete()` archives items, rows are only deleted in bulk or by cascade
+    if not instance.is_archived:
+        counters.add_to_parent(instance, -1)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Subtask)
+@receiver(post_save, sender=Comment)
+def index_searchable(sender, instance, **kwargs):
+    # Archived items are removed from the index along with their children
+    search.index(instance)
+
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Subtask)
+@receiver(post_delete, sender=Comment)
+def unindex_searchable(sender, instance, **kwargs):
+    search.unindex(sender, [instance.pk])
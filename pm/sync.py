@@ -0,0 +1,145 @@
+"""
+Incremental synchronization of the items of the domains of a user.
+
+A client first requests `/api/sync/` without a cursor to get every row, then
+passes the returned cursor as `since` to get only the projects, tasks, subtasks,
+comments and attachments created, updated or archived since, using the indexes
+on `updated_at`.
+
+At most `limit` rows of each model are returned at once. When rows were left
+out (`has_more`), the cursor continues the same pass after the last row returned
+for each model, on `(updated_at, id)`. Once a pass is complete, the next one
+starts `COMMIT_WINDOW` before the time the pass started: a row saved by a
+transaction committing late has an `updated_at` older than its commit, so rows
+updated within that window are returned again by the next pass. Clients must
+therefore apply the rows idempotently, by id.
+
+Deleted comments and attachments are not reported, items are only ever archived.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from django.db.models import Q
+
+from .models import Project, Task, Subtask, Comment, Attachment
+from .serializers import ProjectSerializer, TaskSerializer, SubtaskSerializer
+from .serializers import CommentSerializer, AttachmentSerializer
+
+from datetime import timedelta
+import base64
+import json
+
+
+COMMIT_WINDOW = timedelta(seconds=5)
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+
+def parse_timestamp(value):
+    timestamp = parse_datetime(value)
+    if timestamp is None:
+        raise ValueError(f"Invalid timestamp: {value}")
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def encode_cursor(since=None, pass_start=None, positions=None):
+    """
+    Return a cursor for the rows changed since `since` (all rows if `None`).
+    `pass_start` and `positions` (`(updated_at, id)` of the last row returned,
+    keyed by model) continue an incomplete pass.
+    """
+    data = {}
+    if since is not None:
+        data["since"] = since.isoformat()
+    if pass_start is not None:
+        data["pass_start"] = pass_start.isoformat()
+        data["positions"] = {name: [ts.isoformat(), id] for name, (ts, id) in (positions or {}).items()}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(value):
+    """
+    Return `(since, pass_start, positions)` from a cursor, or from an ISO 8601
+    timestamp. Raise `ValueError` if `value` is neither.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(value.encode()))
+    except ValueError:
+        return parse_timestamp(value), None, {}
+
+    try:
+        since = parse_timestamp(data["since"]) if "since" in data else None
+        pass_start = parse_timestamp(data["pass_start"]) if "pass_start" in data else None
+        positions = {name: (parse_timestamp(ts), int(id)) for name, (ts, id) in data.get("positions", {}).items()}
+    except (TypeError, AttributeError):
+        raise ValueError(f"Invalid cursor: {value}")
+
+    return since, pass_start, positions
+
+
+def get_sources(user):
+    """
+    Return `(name, queryset, serializer class)` for every synchronized model,
+    limited to the user's domains and including the archived items.
+    """
+    items = [
+        ("projects", Project.objects.with_archived().for_user(user), ProjectSerializer),
+        ("tasks", Task.objects.with_archived().for_user(user), TaskSerializer),
+        ("subtasks", Subtask.objects.with_archived().for_user(user), SubtaskSerializer),
+    ]
+
+    # Comments and attachments of the items above
+    of_items = Q()
+    for _, queryset, serializer_class in items:
+        content_type = ContentType.objects.get_for_model(serializer_class.Meta.model)
+        of_items |= Q(content_type=content_type, object_id__in=queryset.values("id"))
+
+    return [(name, queryset.for_serializer(), serializer_class) for name, queryset, serializer_class in items] + [
+        ("comments", Comment.objects.filter(of_items), CommentSerializer),
+        ("attachments", Attachment.objects.filter(of_items), AttachmentSerializer),
+    ]
+
+
+def get_changes(user, cursor=None, limit=DEFAULT_LIMIT, context=None):
+    """
+    Return the rows changed since the `cursor` returned by `decode_cursor()`
+    (all rows if `None`), at most `limit` per model, along with the next cursor.
+
+    `has_more` tells whether some rows were left out, in which case the client
+    should request the next cursor right away.
+    """
+    since, pass_start, positions = cursor or (None, None, {})
+    if pass_start is None:
+        pass_start = timezone.now() - COMMIT_WINDOW
+
+    changes = {"has_more": False, "archived": {}}
+    next_positions = dict(positions)
+
+    for name, queryset, serializer_class in get_sources(user):
+        if since is not None:
+            queryset = queryset.filter(updated_at__gte=since)
+        if name in positions:
+            updated_at, id = positions[name]
+            queryset = queryset.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=id))
+
+        rows = list(queryset.order_by("updated_at", "id")[: limit + 1])
+        if len(rows) > limit:
+            rows = rows[:limit]
+            changes["has_more"] = True
+        if rows:
+            next_positions[name] = (rows[-1].updated_at, rows[-1].id)
+
+        active = [row for row in rows if not getattr(row, "is_archived", False)]
+        changes[name] = serializer_class(active, many=True, context=context).data
+        if hasattr(serializer_class.Meta.model, "is_archived"):
+            changes["archived"][name] = [row.id for row in rows if row.is_archived]
+
+    if changes["has_more"]:
+        # Continue the same pass after the last rows returned
+        changes["cursor"] = encode_cursor(since, pass_start, next_positions)
+    else:
+        changes["cursor"] = encode_cursor(pass_start)
+    return changes
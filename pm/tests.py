@@ -1,7 +1,29 @@
-from django.test import TestCase
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth.models import update_last_login
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache as django_cache
+from django.db import connection
+from django.utils import timezone
+
+from rest_framework.test import APITestCase
 
 from accounts.models import User
-from pm.models import Domain, Project
+from core import cache
+from pm.models import Domain, Priority, Status, Project, Task, Subtask, Comment, Activity, ActivityArchive
+from pm.models import SearchIndex
+from pm.serializers import DomainDropdownSerializer
+from notifications.models import Notification, UnreadCounter
+from pm.membership import get_domain_ids
+from pm.sync import encode_cursor
+from pm.utils import object_labels
+from pm.benchmarks import generate_dataset, run_benchmarks
+
+from datetime import timedelta
+from io import StringIO
+import json
+import csv
 
 
 class TestCase(TestCase):
@@ -31,3 +53,913 @@ class TestCase(TestCase):
         project_two = Project.objects.get(title="project 2")
         self.assertEqual(project_one.description, "test project one")
         self.assertEqual(project_two.description, "test project two")
+
+
+class ItemCountTestCase(APITestCase):
+    def setUp(self):
+
+        self.user = User.objects.create_user(email="count_user@test.com", password="12345")
+        self.domain = Domain.objects.create(title="count domain")
+        self.domain.members.add(self.user)
+
+        self.project = Project.objects.create(domain=self.domain, title="count project", created_by=self.user)
+        self.task = Task.objects.create(project=self.project, title="count task", created_by=self.user)
+        Task.objects.create(project=self.project, title="archived task", is_archived=True)
+        Subtask.objects.create(task=self.task, title="count subtask")
+
+        Comment.objects.create(content_object=self.project, text="first")
+        Comment.objects.create(content_object=self.project, text="second")
+        Comment.objects.create(content_object=self.task, text="third")
+
+        self.client.force_authenticate(self.user)
+
+    def test_stored_counts(self):
+        """Counters stored on the items match the per-instance counts"""
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertEqual(project.comment_count, self.project.get_comment_count())
+        self.assertEqual(project.attachment_count, 0)
+        self.assertEqual(project.task_count, 1)
+
+        task = Task.objects.get(pk=self.task.pk)
+        self.assertEqual(task.comment_count, 1)
+        self.assertEqual(task.subtask_count, 1)
+
+    def test_counts_follow_changes(self):
+        """Counters are updated on delete and archive, and an outdated save keeps them"""
+        outdated = Project.objects.get(pk=self.project.pk)
+        Comment.objects.filter(text="first").first().delete()
+        outdated.title = "renamed project"
+        outdated.save()
+        self.assertEqual(Project.objects.get(pk=self.project.pk).comment_count, 1)
+
+        Subtask.objects.get(task=self.task).delete()
+        self.assertEqual(Task.objects.get(pk=self.task.pk).subtask_count, 0)
+
+        Subtask.objects.create(task=self.task, title="second subtask")
+        self.project.archive()
+        self.assertEqual(Project.all_objects.get(pk=self.project.pk).task_count, 0)
+        self.assertEqual(Task.all_objects.get(pk=self.task.pk).subtask_count, 0)
+
+    def test_counts_follow_moves(self):
+        """Moving an item to another parent, or restoring it, updates the counters of the parents"""
+        other = Project.objects.create(domain=self.domain, title="other project")
+        response = self.client.patch(f"/api/tasks/{self.task.id}/", {"project": other.id}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).task_count, 0)
+        self.assertEqual(Project.objects.get(pk=other.pk).task_count, 1)
+
+        archived = Task.all_objects.get(title="archived task")
+        archived.is_archived = False
+        archived.save()
+        self.assertEqual(Project.objects.get(pk=self.project.pk).task_count, 1)
+
+        archived.archive()
+        archived.archive()
+        self.assertEqual(Project.objects.get(pk=self.project.pk).task_count, 0)
+
+    def test_unmoved_save(self):
+        """Saving an item without moving it reads no stored parent, and keeps a move made in the meantime"""
+        other = Project.objects.create(domain=self.domain, title="other project")
+        task = Task.objects.get(pk=self.task.pk)
+        task.title = "renamed task"
+        with CaptureQueriesContext(connection) as queries:
+            task.save()
+        self.assertFalse([q for q in queries if q["sql"].startswith("SELECT") and '"pm_task"' in q["sql"]])
+
+        self.client.patch(f"/api/tasks/{self.task.id}/", {"project": other.id}, format="json")
+        task.save()
+        self.assertEqual(Task.objects.get(pk=self.task.pk).project_id, other.id)
+        self.assertEqual(Project.objects.get(pk=other.pk).task_count, 1)
+
+    def test_rebuild(self):
+        Project.all_objects.update(comment_count=9, task_count=9)
+        call_command("rebuild_item_counters", stdout=StringIO())
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertEqual((project.comment_count, project.task_count), (2, 1))
+
+    def test_sort_and_filter_by_counts(self):
+        other = Project.objects.create(domain=self.domain, title="quiet project")
+        response = self.client.get("/api/projects/", {"ordering": "-comment_count"})
+        self.assertEqual([row["id"] for row in response.data], [self.project.id, other.id])
+        response = self.client.get("/api/projects/", {"min_task_count": 1})
+        self.assertEqual([row["id"] for row in response.data], [self.project.id])
+
+    def test_project_list_counts(self):
+        """Project list returns counts without a per-row fallback"""
+        response = self.client.get("/api/projects/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["comment_count"], 2)
+        self.assertEqual(response.data[0]["task_count"], 1)
+
+    def test_assigned_task_counts(self):
+        """Tasks assigned to the current user include annotated counts"""
+        self.task.assigned_to.add(self.user)
+        response = self.client.get("/api/tasks/me/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["comment_count"], 1)
+        self.assertEqual(response.data[0]["subtask_count"], 1)
+
+
+class ItemScopeTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="scope_user@test.com", password="12345")
+        self.other = User.objects.create_user(email="scope_other@test.com", password="12345")
+
+        domain = Domain.objects.create(title="member domain")
+        domain.members.add(self.user)
+        project = Project.objects.create(domain=domain, title="member project")
+        Task.objects.bulk_create([Task(project=project, title=f"task {i}") for i in range(60)])
+        self.task = Task.objects.filter(project=project).first()
+        Subtask.objects.create(task=self.task, title="member subtask")
+
+        foreign_project = Project.objects.create(domain=Domain.objects.create(title="other domain"), title="other")
+        self.foreign_task = Task.objects.create(project=foreign_project, title="foreign task")
+        self.foreign_task.assigned_to.add(self.other)
+        Subtask.objects.create(task=self.foreign_task, title="foreign subtask")
+
+        self.client.force_authenticate(self.user)
+
+    def test_task_list_scope_and_pagination(self):
+        """Task list only includes the tasks of the user's domains, one page at a time"""
+        response = self.client.get("/api/tasks/")
+        self.assertEqual(response.data["count"], 60)
+        self.assertEqual(len(response.data["results"]), 50)
+        self.assertEqual(len(self.client.get("/api/tasks/", {"page": 2}).data["results"]), 10)
+        self.assertEqual(len(self.client.get("/api/tasks/", {"page_size": 1000}).data["results"]), 60)
+        self.assertEqual(self.client.get(f"/api/tasks/{self.foreign_task.id}/").status_code, 404)
+
+    def test_subtask_list_scope(self):
+        """Subtask list only includes the subtasks of the user's domains"""
+        response = self.client.get("/api/subtasks/")
+        self.assertEqual([row["title"] for row in response.data["results"]], ["member subtask"])
+
+    def test_current_user_domain_assigned_to(self):
+        """Filtering by assignee does not leak tasks from other domains"""
+        response = self.client.get("/api/tasks/current_user_domain/", {"assigned_to": self.other.id})
+        self.assertEqual(response.data["count"], 0)
+
+    def test_assigned_tasks_optional_pagination(self):
+        """Tasks assigned to the user are a plain list, unless a page is asked for"""
+        for task in Task.objects.filter(project=self.task.project)[:3]:
+            task.assigned_to.add(self.user)
+        self.assertEqual(len(self.client.get("/api/tasks/me/").data), 3)
+        response = self.client.get("/api/tasks/me/", {"page_size": 2})
+        self.assertEqual((response.data["count"], len(response.data["results"])), (3, 2))
+
+
+class OverdueTestCase(APITestCase):
+    def setUp(self):
+
+        Status.objects.clear_cache()
+
+        self.user = User.objects.create_user(email="overdue_user@test.com", password="12345")
+        self.domain = Domain.objects.create(title="overdue domain")
+        self.domain.members.add(self.user)
+
+        self.done = Status.objects.create(title="Done")
+        self.ready = Status.objects.create(title="Ready")
+
+        yesterday = timezone.localdate() - timedelta(days=1)
+        self.late = Project.objects.create(domain=self.domain, title="late", end_date=yesterday, status=self.ready)
+        self.closed = Project.objects.create(domain=self.domain, title="closed", end_date=yesterday, status=self.done)
+        self.open = Project.objects.create(domain=self.domain, title="open")
+
+        self.client.force_authenticate(self.user)
+
+    def test_annotated_overdue(self):
+        """Overdue annotation matches the `is_overdue` property"""
+        for project in Project.objects.with_overdue():
+            self.assertEqual(project.overdue, Project.objects.get(pk=project.pk).is_overdue)
+        self.assertTrue(self.late.is_overdue)
+        self.assertFalse(self.closed.is_overdue)
+        self.assertFalse(self.open.is_overdue)
+
+    def test_status_registry_invalidation(self):
+        """Renaming the done status is picked up by the registry"""
+        self.assertEqual(Status.objects.get_done(), self.done)
+        self.done.title = "Finished"
+        self.done.save()
+        self.assertIsNone(Status.objects.get_done())
+        self.assertIsNone(self.late.is_overdue)
+
+    def test_status_registry_shared_cache(self):
+        """The registry is read from the shared cache, and cleared for every process"""
+        self.assertEqual(Status.objects.get_done(), self.done)
+        Status.objects.filter(pk=self.done.pk).update(title="Finished")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Status.objects.get_done(), self.done)
+        self.assertEqual(len(queries), 0)
+
+        Status.objects.clear_cache()
+        self.assertIsNone(Status.objects.get_done())
+
+    def test_project_list_query_count(self):
+        """Project list issues the same number of queries regardless of size"""
+        self.client.get("/api/projects/")
+        with CaptureQueriesContext(connection) as small:
+            self.client.get("/api/projects/")
+
+        for i in range(10):
+            project = Project.objects.create(domain=self.domain, title=f"extra {i}", status=self.ready)
+            project.assigned_to.add(self.user)
+            Comment.objects.create(content_object=project, text="comment")
+
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get("/api/projects/")
+
+        self.assertEqual(len(response.data), 13)
+        self.assertEqual(len(small), len(large))
+
+
+class DomainMembershipTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="member@test.com", password="12345")
+        self.domain = Domain.objects.create(title="member domain")
+        self.other_domain = Domain.objects.create(title="other domain")
+        self.domain.members.add(self.user)
+
+    def get_domain_ids(self):
+        # A fresh instance, as for a new request
+        return get_domain_ids(User.objects.get(pk=self.user.pk))
+
+    def test_cached_domain_ids(self):
+        """Domain ids are read from the cache after the first lookup"""
+        self.assertEqual(self.get_domain_ids(), {self.domain.id})
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            get_domain_ids(user)
+            get_domain_ids(user)
+        self.assertEqual(len(queries), 0)
+
+    def test_membership_invalidation(self):
+        """Membership changes from either side are picked up"""
+        self.assertEqual(self.get_domain_ids(), {self.domain.id})
+
+        self.other_domain.members.add(self.user)
+        self.assertEqual(self.get_domain_ids(), {self.domain.id, self.other_domain.id})
+
+        self.user.domain_membership.remove(self.domain)
+        self.assertEqual(self.get_domain_ids(), {self.other_domain.id})
+
+        self.other_domain.members.clear()
+        self.assertEqual(self.get_domain_ids(), set())
+
+        self.domain.members.add(self.user)
+        self.domain.delete()
+        self.assertEqual(self.get_domain_ids(), set())
+
+    def test_comment_permission(self):
+        """Comments of the items of other domains cannot be read"""
+        project = Project.objects.create(domain=self.other_domain, title="other project")
+        task = Task.objects.create(project=project, title="other task")
+        comment = Comment.objects.create(content_object=Subtask.objects.create(task=task, title="s"), text="c")
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(f"/api/comments/{comment.id}/").status_code, 403)
+        self.other_domain.members.add(self.user)
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        self.assertEqual(self.client.get(f"/api/comments/{comment.id}/").status_code, 200)
+
+    def test_stale_cache(self):
+        """A revoked membership grants neither writes nor permission checks while cached"""
+        project = Project.objects.create(domain=self.domain, title="member project")
+        comment = Comment.objects.create(content_object=project, text="c", created_by=self.user)
+        self.assertEqual(self.get_domain_ids(), {self.domain.id})
+
+        # As on another host, the membership is removed without invalidating the cache
+        Domain.members.through.objects.filter(user=self.user).delete()
+        self.assertEqual(self.get_domain_ids(), {self.domain.id})
+
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        self.assertEqual(self.client.get(f"/api/comments/{comment.id}/").status_code, 403)
+        response = self.client.patch(f"/api/projects/{project.id}/", {"title": "changed"})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.get_domain_ids(), set())
+
+
+class ConditionalRequestTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="etag@test.com", password="12345")
+        self.domain = Domain.objects.create(title="etag domain")
+        self.domain.members.add(self.user)
+        self.project = Project.objects.create(domain=self.domain, title="etag project")
+        self.client.force_authenticate(self.user)
+
+    def test_not_modified(self):
+        """Unchanged lists are answered with 304 in a single query"""
+        response = self.client.get("/api/projects/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/projects/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+        response = self.client.get("/api/projects/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_modified(self):
+        """Changes to the rows or to their related rows change the ETag"""
+        etag = self.client.get("/api/projects/")["ETag"]
+
+        Comment.objects.create(content_object=self.project, text="comment")
+        response = self.client.get("/api/projects/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["comment_count"], 1)
+
+        self.project.assigned_to.add(self.user)
+        self.assertEqual(self.client.get("/api/projects/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+    def test_deleted_comment(self):
+        """Deleting a comment moves the last modification time of the comment list"""
+        Comment.objects.create(content_object=self.project, text="kept", created_by=self.user)
+        comment = Comment.objects.create(content_object=self.project, text="deleted", created_by=self.user)
+        # As if the comments were older than the start of the day
+        old = timezone.now() - timedelta(days=2)
+        Comment.objects.update(updated_at=old)
+        django_cache.set(cache.get_version_key("pm.comment"), int(old.timestamp() * 1e9), timeout=None)
+
+        params = {"content_type": self.project.content_type, "object_id": self.project.id}
+        last_modified = self.client.get("/api/comments/", params)["Last-Modified"]
+        self.assertEqual(self.client.delete(f"/api/comments/{comment.id}/").status_code, 204)
+
+        response = self.client.get("/api/comments/", params, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+    def test_other_domains(self):
+        """Changes in other domains keep the ETag, moves out of the domain change it"""
+        other_project = Project.objects.create(domain=Domain.objects.create(title="other domain"), title="other")
+        task = Task.objects.create(project=self.project, title="moving task")
+        etag = self.client.get("/api/projects/")["ETag"]
+
+        Comment.objects.create(content_object=other_project, text="comment")
+        Task.objects.create(project=other_project, title="other task")
+        self.assertEqual(self.client.get("/api/projects/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        task.project = other_project
+        task.save()
+        response = self.client.get("/api/projects/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["task_count"], 0)
+
+    def test_item_actions(self):
+        """Item list actions are answered with 304 too"""
+        task = Task.objects.create(project=self.project, title="etag task")
+        task.assigned_to.add(self.user)
+        etag = self.client.get("/api/tasks/me/")["ETag"]
+        self.assertEqual(self.client.get("/api/tasks/me/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Task.objects.filter(pk=task.pk).delete()
+        self.assertEqual(self.client.get("/api/tasks/me/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SyncTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="sync@test.com", password="12345")
+        domain = Domain.objects.create(title="sync domain")
+        domain.members.add(self.user)
+        self.project = Project.objects.create(domain=domain, title="sync project")
+        self.task = Task.objects.create(project=self.project, title="sync task")
+        Comment.objects.create(content_object=self.task, text="sync comment")
+        Project.objects.create(domain=Domain.objects.create(title="other"), title="other project")
+        self.client.force_authenticate(self.user)
+
+    def test_full_sync(self):
+        """Without a cursor, every row of the user's domains is returned"""
+        response = self.client.get("/api/sync/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["title"] for row in response.data["projects"]], ["sync project"])
+        self.assertEqual(len(response.data["tasks"]), 1)
+        self.assertEqual(len(response.data["comments"]), 1)
+        self.assertFalse(response.data["has_more"])
+
+    def test_incremental_sync(self):
+        """With a cursor, only the rows changed since are returned"""
+        since = encode_cursor(timezone.now())
+        self.assertEqual(self.client.get("/api/sync/", {"since": timezone.now().isoformat()}).data["tasks"], [])
+        response = self.client.get("/api/sync/", {"since": since})
+        self.assertEqual(response.data["projects"], [])
+        self.assertEqual(response.data["comments"], [])
+
+        self.task.delete()
+        response = self.client.get("/api/sync/", {"since": since})
+        self.assertEqual(response.data["tasks"], [])
+        self.assertEqual(response.data["archived"]["tasks"], [self.task.id])
+
+        self.project.delete()
+        response = self.client.get("/api/sync/", {"since": since})
+        self.assertEqual(response.data["archived"]["projects"], [self.project.id])
+
+    def test_has_more(self):
+        """Rows beyond the limit are returned by the next request"""
+        Task.objects.create(project=self.project, title="second task")
+        response = self.client.get("/api/sync/", {"limit": 1})
+        self.assertTrue(response.data["has_more"])
+        self.assertEqual(len(response.data["tasks"]), 1)
+
+        response = self.client.get("/api/sync/", {"limit": 1, "since": response.data["cursor"]})
+        self.assertEqual([row["title"] for row in response.data["tasks"]], ["second task"])
+        self.assertEqual(response.data["projects"], [])
+        self.assertFalse(response.data["has_more"])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/sync/", {"since": "nope"}).status_code, 400)
+
+
+class OptionsCacheTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="options@test.com", password="12345")
+        Priority.objects.create(title="Low")
+        self.client.force_authenticate(self.user)
+
+    def test_cached_options(self):
+        """Options are served from the cache until their rows change"""
+        self.client.get("/api/options/priority/")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/options/priority/")
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([option["label"] for option in response.data], ["Low"])
+
+        Priority.objects.create(title="High")
+        response = self.client.get("/api/options/priority/")
+        self.assertEqual(sorted(option["label"] for option in response.data), ["High", "Low"])
+
+        Priority.objects.filter(title="High").get().delete()
+        response = self.client.get("/api/options/priority/")
+        self.assertEqual([option["label"] for option in response.data], ["Low"])
+
+    def test_login_keeps_user_options(self):
+        """Logging in saves the last login of the user without invalidating the user options"""
+        self.client.get("/api/options/user/")
+        # As the token views do with `UPDATE_LAST_LOGIN`
+        update_last_login(None, self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/options/user/")
+        self.assertEqual(len(queries), 0)
+
+        User.objects.create_user(email="new@test.com", password="12345")
+        self.assertEqual(len(self.client.get("/api/options/user/").data), 2)
+
+
+class TypeaheadTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="typeahead@test.com", password="12345")
+        self.domain = Domain.objects.create(title="Typeahead")
+        self.other_domain = Domain.objects.create(title="Other")
+        self.project = Project.objects.create(domain=self.domain, title="Écoles", created_by=self.user)
+        for title in ["École primaire", "Ecole maternelle", "Collège"]:
+            Task.objects.create(project=self.project, title=title, created_by=self.user)
+        other_project = Project.objects.create(domain=self.other_domain, title="Ecologie", created_by=self.user)
+        Task.objects.create(project=other_project, title="Écologie", created_by=self.user)
+        self.client.force_authenticate(self.user)
+
+    def get_labels(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [option["label"] for option in response.data]
+
+    def test_stored_labels(self):
+        """Labels are stored with their normalized form on save"""
+        task = Task.objects.get(title="École primaire")
+        self.assertEqual((task.label, task.normalized_label), ("École Primaire", "ecole primaire"))
+
+        task.title = "École  Secondaire"
+        task.save(update_fields=["title"])
+        task.refresh_from_db()
+        self.assertEqual(task.normalized_label, "ecole secondaire")
+
+    def test_prefix(self):
+        """Options start with the query, regardless of case and accents, in label order"""
+        self.assertEqual(self.get_labels("/api/options/task/?q=ECOLE"), ["Ecole Maternelle", "École Primaire"])
+        self.assertEqual(self.get_labels("/api/options/task/?q=eco&limit=1"), ["Ecole Maternelle"])
+        self.assertEqual(self.get_labels("/api/options/task/?q=ole"), [])
+        self.assertEqual(self.get_labels("/api/options/project/?q=éco"), ["Écoles", "Ecologie"])
+
+    def test_scope(self):
+        """Options are scoped to the given domain or project"""
+        self.assertEqual(self.get_labels(f"/api/options/task/?q=eco&domain={self.other_domain.pk}"), ["Écologie"])
+        self.assertEqual(len(self.get_labels(f"/api/options/task/?project={self.project.pk}")), 3)
+        self.assertEqual(self.get_labels(f"/api/options/project/?domain={self.domain.pk}"), ["Écoles"])
+
+        self.assertEqual(self.get_labels(f"/api/options/user/?domain={self.domain.pk}"), [])
+        self.domain.members.add(self.user)
+        self.assertEqual(self.get_labels(f"/api/options/user/?domain={self.domain.pk}"), ["typeahead@test.com"])
+
+        response = self.client.get("/api/options/task/?domain=first")
+        self.assertEqual(response.status_code, 400)
+
+    def test_moved_project(self):
+        """Task options scoped to a domain follow the projects moving to another domain"""
+        url = f"/api/options/task/?domain={self.other_domain.pk}"
+        self.assertEqual(self.get_labels(url), ["Écologie"])
+        self.project.domain = self.other_domain
+        self.project.save()
+        self.assertEqual(len(self.get_labels(url)), 4)
+
+    def test_values_fast_path(self):
+        """Option lists read the value and label columns only, instances keep their hooks"""
+        queryset = Task.objects.order_by("normalized_label")
+        with CaptureQueriesContext(connection) as queries:
+            data = DomainDropdownSerializer(queryset, many=True).data
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"pm_task"."label"', queries[0]["sql"])
+        self.assertNotIn('"pm_task"."title"', queries[0]["sql"])
+        self.assertEqual(data[0], {"value": Task.objects.get(title="Collège").pk, "label": "Collège"})
+
+        task = Task.objects.get(title="Collège")
+        self.assertEqual(DomainDropdownSerializer(task).data, {"value": task.pk, "label": "Collège"})
+        self.assertEqual(DomainDropdownSerializer([task], many=True).data, [{"value": task.pk, "label": "Collège"}])
+        # The subclass Meta is left untouched
+        self.assertFalse(hasattr(DomainDropdownSerializer.Meta, "fields"))
+
+
+class ActivityLabelTestCase(APITestCase):
+    def setUp(self):
+        object_labels.clear()
+        self.user = User.objects.create_user(email="labels@test.com", password="12345")
+        self.others = [User.objects.create_user(email=f"other_{i}@test.com", password="12345") for i in range(5)]
+        self.project = Project.objects.create(domain=Domain.objects.create(title="domain"), title="project")
+        self.client.force_authenticate(self.user)
+
+    def create_activity(self, old_user, new_user):
+        return Activity.objects.create(
+            content_object=self.project,
+            action=Activity.Action_Choices.UPDATE,
+            content=[
+                {
+                    "field": "assigned_to",
+                    "verbose_name": "assigned to",
+                    "old_value": [old_user.id],
+                    "new_value": [new_user.id],
+                    "model": "accounts.user",
+                }
+            ],
+        )
+
+    def get_descriptions(self):
+        response = self.client.get("/api/activities/")
+        self.assertEqual(response.status_code, 200)
+        return [row["description"][0] for row in response.data["results"]]
+
+    def test_activity_list_query_count(self):
+        """Activity list resolves the referenced users in a fixed number of queries"""
+        self.create_activity(self.user, self.others[0])
+        with CaptureQueriesContext(connection) as small:
+            self.get_descriptions()
+
+        object_labels.clear()
+        for old_user, new_user in zip(self.others, self.others[1:]):
+            self.create_activity(old_user, new_user)
+        with CaptureQueriesContext(connection) as large:
+            descriptions = self.get_descriptions()
+
+        self.assertEqual(len(descriptions), 5)
+        self.assertEqual(len(small), len(large))
+
+    def test_user_label_invalidation(self):
+        """Renaming a user is reflected in the cached activity descriptions"""
+        self.create_activity(self.others[0], self.others[1])
+        self.assertEqual(self.get_descriptions()[0]["old_value"], [str(self.others[0])])
+
+        self.others[0].first_name = "Renamed"
+        self.others[0].save()
+        self.assertEqual(self.get_descriptions()[0]["old_value"], [str(self.others[0])])
+        self.assertIn("Renamed", str(self.others[0]))
+
+
+class ActivityPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="feed@test.com", password="12345")
+        self.project = Project.objects.create(domain=Domain.objects.create(title="domain"), title="project")
+        Activity.objects.bulk_create(
+            [Activity(content_object=self.project, content=[{"field": "title", "new_value": i}]) for i in range(25)]
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pagination(self):
+        """Activities are paginated by cursor, without gaps or duplicates"""
+        seen = []
+        url = "/api/activities/"
+        while url:
+            response = self.client.get(url)
+            self.assertNotIn("count", response.data)
+            seen += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+
+        expected = list(Activity.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_number_pagination(self):
+        """The page number contract is kept behind the `page` parameter"""
+        response = self.client.get("/api/activities/", {"page": 2})
+        self.assertEqual(response.data["count"], 25)
+        self.assertEqual(response.data["num_pages"], 3)
+        self.assertEqual(response.data["number"], 2)
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_item_history_pagination(self):
+        """The history of an item is paginated too"""
+        params = {"content_type": self.project.content_type, "object_id": self.project.id}
+        response = self.client.get("/api/activities/", params)
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertIsNotNone(response.data["next"])
+
+
+@override_settings(STORAGES={"default": {"BACKEND": "django.core.files.storage.InMemoryStorage"}})
+class ActivityArchiveTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="archive@test.com", password="12345")
+        self.project = Project.objects.create(domain=Domain.objects.create(title="domain"), title="project")
+        self.project.domain.members.add(self.user)
+        other = Project.objects.create(domain=self.project.domain, title="other")
+        Activity.objects.bulk_create(
+            [Activity(content_object=self.project, content=[{"field": "title", "new_value": i}]) for i in range(5)]
+            + [Activity(content_object=other, content=[]) for i in range(3)]
+        )
+        self.recent = Activity.objects.create(content_object=self.project, content=[])
+        Activity.objects.exclude(pk=self.recent.pk).update(created_at=timezone.now() - timedelta(days=400))
+        self.archived_ids = list(
+            Activity.objects.exclude(pk=self.recent.pk)
+            .filter(object_id=self.project.id, content_type=self.project.content_type)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_archive(self):
+        """Old activities are moved to archive files and still readable for an item"""
+        call_command("archive_activities", "--file-size=3", "--chunk-size=2", stdout=StringIO())
+
+        self.assertEqual(list(Activity.objects.values_list("id", flat=True)), [self.recent.id])
+        self.assertEqual(ActivityArchive.objects.count(), 3)
+        self.assertEqual(sum(ActivityArchive.objects.values_list("count", flat=True)), 8)
+
+        params = {"content_type": self.project.content_type, "object_id": self.project.id}
+        response = self.client.get("/api/activities/archived/", params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["id"] for row in response.data["results"]], self.archived_ids)
+        self.assertEqual(response.data["results"][-1]["description"][0]["new_value"], 0)
+
+        response = self.client.get("/api/activities/archived/", {**params, "page_size": 2, "page": 3})
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual([row["id"] for row in response.data["results"]], self.archived_ids[4:])
+
+    def test_other_domain(self):
+        """The archived history of the items of other domains is not found"""
+        call_command("archive_activities", stdout=StringIO())
+        self.project.domain.members.remove(self.user)
+        params = {"content_type": self.project.content_type, "object_id": self.project.id}
+        self.assertEqual(self.client.get("/api/activities/archived/", params).status_code, 404)
+        params["content_type"] = ContentType.objects.get_for_model(User).id
+        self.assertEqual(self.client.get("/api/activities/archived/", params).status_code, 404)
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command("archive_activities", "--dry-run", stdout=out)
+        self.assertIn("Found 8 activities", out.getvalue())
+        self.assertEqual(Activity.objects.count(), 9)
+
+    def test_missing_item(self):
+        response = self.client.get("/api/activities/archived/")
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="search@test.com", password="12345")
+        domain = Domain.objects.create(title="search domain")
+        domain.members.add(self.user)
+        self.project = Project.objects.create(domain=domain, title="Migration plan", description="Move the servers")
+        self.task = Task.objects.create(project=self.project, title="Backup", description="Backup before migrating")
+        self.subtask = Subtask.objects.create(task=self.task, title="Check disks")
+        self.comment = Comment.objects.create(content_object=self.task, text="The migration starts on monday")
+
+        other = Project.objects.create(domain=Domain.objects.create(title="other domain"), title="Migration elsewhere")
+        Task.objects.create(project=other, title="Migration task")
+
+        self.client.force_authenticate(self.user)
+
+    def search(self, **params):
+        response = self.client.get("/api/search/", params)
+        self.assertEqual(response.status_code, 200)
+        return [(row["type"], row["id"]) for row in response.data]
+
+    def test_search(self):
+        """Items and comments of the user's domains are found by word prefix, titles first"""
+        results = self.search(q="migrat")
+        self.assertEqual(results[0], ("project", self.project.id))
+        expected = {("project", self.project.id), ("task", self.task.id), ("comment", self.comment.id)}
+        self.assertEqual(set(results), expected)
+
+        response = self.client.get("/api/search/", {"q": "monday"})
+        self.assertEqual(response.data[0]["item"], {"type": "task", "id": self.task.id})
+
+        self.assertEqual(self.search(q="migration", type="comment"), [("comment", self.comment.id)])
+        self.assertEqual(self.client.get("/api/search/").status_code, 400)
+
+    def test_index_follows_changes(self):
+        self.subtask.title = "Check tapes"
+        self.subtask.save()
+        self.assertEqual(self.search(q="disks"), [])
+        self.assertEqual(self.search(q="tapes"), [("subtask", self.subtask.id)])
+
+        self.comment.delete()
+        self.assertEqual(self.search(q="monday"), [])
+
+        # Archiving removes the children too
+        self.task.archive()
+        self.assertEqual(self.search(q="backup tapes"), [])
+        self.assertEqual(self.search(q="migration"), [("project", self.project.id)])
+
+    def test_item_search_filter(self):
+        """`?search=` keeps matching substrings, `?fulltext=` uses the index"""
+        response = self.client.get("/api/tasks/", {"search": "ackup"})
+        self.assertEqual([row["id"] for row in response.data["results"]], [self.task.id])
+        response = self.client.get("/api/tasks/", {"fulltext": "backup"})
+        self.assertEqual([row["id"] for row in response.data["results"]], [self.task.id])
+        self.assertEqual(self.client.get("/api/tasks/", {"fulltext": "ackup"}).data["count"], 0)
+
+    def test_rebuild(self):
+        SearchIndex.objects.all().delete()
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(SearchIndex.objects.count(), 6)
+        self.assertEqual(self.search(q="monday"), [("comment", self.comment.id)])
+
+
+class BulkItemTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="bulk@test.com", password="12345")
+        self.other = User.objects.create_user(email="bulk_other@test.com", password="12345")
+        self.domain = Domain.objects.create(title="bulk domain")
+        self.domain.members.add(self.user)
+        self.project = Project.objects.create(domain=self.domain, title="bulk project", created_by=self.user)
+        self.other_project = Project.objects.create(domain=self.domain, title="second project")
+        self.foreign_project = Project.objects.create(domain=Domain.objects.create(title="foreign"), title="foreign")
+        self.client.force_authenticate(self.user)
+
+    def create_tasks(self, count, prefix="Task"):
+        rows = [
+            {"project": self.project.id, "title": f"{prefix} {i}", "assigned_to": [self.other.id]} for i in range(count)
+        ]
+        response = self.client.post("/api/tasks/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        return [row["id"] for row in response.data]
+
+    def test_create(self):
+        """Created items keep their side effects, with a number of queries independent of their count"""
+        self.create_tasks(1, "Warm")
+        with CaptureQueriesContext(connection) as small:
+            self.create_tasks(2, "Small")
+        with CaptureQueriesContext(connection) as large:
+            ids = self.create_tasks(30)
+        self.assertEqual(len(large), len(small))
+
+        task = Task.objects.get(pk=ids[0])
+        self.assertEqual((task.label, task.created_by), ("Task 0", self.user))
+        self.assertEqual(list(task.assigned_to.all()), [self.other])
+        self.assertEqual(Project.objects.get(pk=self.project.pk).task_count, 33)
+        self.assertEqual(Activity.objects.filter(action=Activity.Action_Choices.CREATE, object_id__in=ids).count(), 30)
+        self.assertEqual(Notification.objects.filter(user=self.other).count(), 33)
+        self.assertEqual(UnreadCounter.objects.get_count(self.other), 33)
+        self.assertEqual(SearchIndex.objects.filter(title="Task 7").count(), 1)
+
+    def test_create_validation(self):
+        """Nothing is written unless every item is valid"""
+        rows = [
+            {"project": self.project.id, "title": "Valid"},
+            {"project": self.foreign_project.id, "title": "Foreign"},
+            {"project": self.project.id, "title": "Valid"},
+        ]
+        response = self.client.post("/api/tasks/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("project", response.data[1])
+        self.assertFalse(Task.objects.exists())
+
+        response = self.client.post("/api/tasks/bulk/", [rows[0], rows[2]], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("title", response.data[1])
+        self.assertEqual(self.client.post("/api/tasks/bulk/", [], format="json").status_code, 400)
+
+    def test_update(self):
+        ids = self.create_tasks(3)
+        rows = [
+            {"id": ids[0], "title": "Renamed"},
+            {"id": ids[1], "project": self.other_project.id, "assigned_to": []},
+            {"id": ids[2], "description": ""},
+        ]
+        response = self.client.patch("/api/tasks/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([row["id"] for row in response.data], ids)
+        self.assertEqual(response.data[0]["title"], "Renamed")
+
+        self.assertEqual(Task.objects.get(pk=ids[0]).label, "Renamed")
+        self.assertEqual(list(Task.objects.get(pk=ids[1]).assigned_to.all()), [])
+        self.assertEqual(Project.objects.get(pk=self.project.pk).task_count, 2)
+        self.assertEqual(Project.objects.get(pk=self.other_project.pk).task_count, 1)
+        self.assertEqual(Activity.objects.filter(action=Activity.Action_Choices.UPDATE, object_id__in=ids).count(), 3)
+
+        response = self.client.patch("/api/tasks/bulk/", [{"id": ids[0], "title": "Task 2"}], format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_archive(self):
+        ids = self.create_tasks(2)
+        Subtask.objects.create(task_id=ids[0], title="bulk subtask")
+        response = self.client.post("/api/tasks/bulk/archive/", {"ids": ids}, format="json")
+        self.assertEqual(response.status_code, 204)
+
+        self.assertFalse(Task.objects.filter(pk__in=ids).exists())
+        self.assertFalse(Subtask.objects.exists())
+        self.assertEqual(Project.objects.get(pk=self.project.pk).task_count, 0)
+        self.assertEqual(Activity.objects.filter(action=Activity.Action_Choices.DELETE, object_id__in=ids).count(), 2)
+        self.assertFalse(SearchIndex.objects.filter(title__startswith="Task").exists())
+        self.assertEqual(self.client.post("/api/tasks/bulk/archive/", {"ids": ids}, format="json").status_code, 400)
+
+
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="export@test.com", password="12345", first_name="Ada")
+        domain = Domain.objects.create(title="export domain")
+        domain.members.add(self.user)
+        self.status = Status.objects.create(title="Open")
+        self.project = Project.objects.create(domain=domain, title="export project")
+        self.task = Task.objects.create(project=self.project, title="first", status=self.status)
+        self.task.assigned_to.add(self.user)
+        Task.objects.create(project=self.project, title="second")
+        foreign_project = Project.objects.create(domain=Domain.objects.create(title="foreign"), title="foreign")
+        Task.objects.create(project=foreign_project, title="foreign")
+        self.client.force_authenticate(self.user)
+
+    def export(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+            content = b"".join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, 200)
+        return content, len(queries)
+
+    def test_csv(self):
+        """Tasks of the user's domains are exported with the labels of their relations"""
+        content, _ = self.export("/api/tasks/export/", ordering="title")
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual([row["title"] for row in rows], ["first", "second"])
+        self.assertEqual(
+            (rows[0]["status"], rows[0]["project"], rows[0]["domain"], rows[0]["assigned_to"]),
+            ("Open", "export project", "export domain", "Ada"),
+        )
+
+    def test_ndjson_and_filters(self):
+        """Exports accept the filters of the lists, with a number of queries independent of the rows"""
+        self.export("/api/tasks/export/")
+        content, queries = self.export("/api/tasks/export/", output="ndjson", status=self.status.id)
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(row["title"], row["assigned_to"]) for row in rows], [("first", ["Ada"])])
+
+        Task.objects.bulk_create([Task(project=self.project, title=f"more {i}", status=self.status) for i in range(20)])
+        self.assertEqual(self.export("/api/tasks/export/", output="ndjson", status=self.status.id)[1], queries)
+        self.assertEqual(self.client.get("/api/tasks/export/", {"output": "xml"}).status_code, 400)
+
+    def test_scope_and_escaping(self):
+        """Activities of other domains are not exported, nor formulas evaluated"""
+        Task.objects.filter(pk=self.task.pk).update(title="=HYPERLINK(1)")
+        content, _ = self.export("/api/tasks/export/", ordering="title")
+        self.assertEqual(list(csv.DictReader(StringIO(content)))[0]["title"], "'=HYPERLINK(1)")
+
+        Activity.objects.create(content_object=self.task, action=Activity.Action_Choices.UPDATE, content=[])
+        Activity.objects.create(
+            content_object=Task.objects.get(title="foreign"), action=Activity.Action_Choices.UPDATE, content=[]
+        )
+        content, _ = self.export("/api/activities/export/", output="ndjson")
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(row["type"], row["object_id"]) for row in rows], [("task", self.task.id)])
+
+    def test_command(self):
+        output = StringIO()
+        call_command("export", "task", "--output", "ndjson", "--filter", "title=second", stdout=output)
+        self.assertEqual([json.loads(line)["title"] for line in output.getvalue().splitlines()], ["second"])
+
+        output = StringIO()
+        call_command("export", "task", "--user", "export@test.com", stdout=output)
+        self.assertEqual(len(list(csv.DictReader(StringIO(output.getvalue())))), 2)
+
+
+class QueryBudgetTestCase(APITestCase):
+    """
+    Request every GET route of the API router against a generated dataset and
+    fail when an endpoint runs more queries than its budget in `pm.benchmarks`.
+    """
+
+    def setUp(self):
+        Status.objects.clear_cache()
+        self.dataset = generate_dataset("small")
+
+    def test_query_budgets(self):
+        results = run_benchmarks(self.dataset)
+        self.assertIn("project-list", results)
+
+        for name, result in results.items():
+            with self.subTest(endpoint=name):
+                self.assertEqual(result["status_code"], 200)
+                self.assertLessEqual(result["queries"], result["budget"])
+                self.assertLessEqual(result["cold_queries"], result["budget"])
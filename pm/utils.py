@@ -6,6 +6,8 @@ from django.apps import apps
 
 from rest_framework.serializers import ValidationError
 
+from core.utils import LRUCache
+
 from datetime import date
 from uuid import uuid4
 import mimetypes
@@ -58,7 +60,7 @@ def get_change_message(instance, data_before_update):
                 }
 
                 # Use difflib for the description field
-                diff = list(difflib.unified_diff(old_value.splitlines(), new_value.splitlines()))
+                diff = list(difflib.unified_diff((old_value or "").splitlines(), (new_value or "").splitlines()))
                 if diff:
 
                     # Skip the metadata
@@ -109,7 +111,7 @@ def get_change_message(instance, data_before_update):
     return change_message or False
 
 
-def get_activity_description(instance):
+def get_activity_description(instance, labels=None):
     """
     Generate string representations of items in the content field of an activity instance,
     if the item includes a `model` key.
@@ -135,6 +137,8 @@ def get_activity_description(instance):
         >>> "new_value": ["test Twe (test_2@example.com)"],
             "model": "accounts.user",
         }
+
+    Pass the `labels` returned by `get_object_labels()` to avoid a query per item.
     """
     description = []
     for item in instance.content:
@@ -143,8 +147,8 @@ def get_activity_description(instance):
                 {
                     "field": item["field"],
                     "verbose_name": item["verbose_name"],
-                    "old_value": get_object_details(item.get("model"), item.get("old_value", [])),
-                    "new_value": get_object_details(item.get("model"), item.get("new_value", [])),
+                    "old_value": get_object_details(item.get("model"), item.get("old_value", []), labels),
+                    "new_value": get_object_details(item.get("model"), item.get("new_value", []), labels),
                 }
             )
         else:
@@ -152,10 +156,57 @@ def get_activity_description(instance):
     return description
 
 
-def get_object_details(model, instance_ids):
+# Labels of the models referenced by activities which rarely change, keyed by `(model, id)`.
+# Entries are removed by `pm.signals` when an instance is saved or deleted.
+CACHED_LABEL_MODELS = ("accounts.user",)
+object_labels = LRUCache(maxsize=4096)
+
+
+def get_object_labels(activities):
+    """
+    Return the string representations of all the objects referenced in the content
+    of the given activities, keyed by `(model, id)`, with one query per model.
+    """
+    ids_by_model = {}
+    for activity in activities:
+        for item in activity.content:
+            if isinstance(item, dict) and "model" in item:
+                ids = ids_by_model.setdefault(item["model"], set())
+                ids.update(item.get("old_value", []))
+                ids.update(item.get("new_value", []))
+
+    labels = {}
+    for model_name, ids in ids_by_model.items():
+        try:
+            model = apps.get_model(model_name)
+        except LookupError:
+            continue
+
+        cached = model_name in CACHED_LABEL_MODELS
+        if cached:
+            labels.update(object_labels.get_many([(model_name, id) for id in ids]))
+            ids = [id for id in ids if (model_name, id) not in labels]
+            if not ids:
+                continue
+
+        found = {(model_name, obj.id): str(obj) for obj in model.objects.filter(id__in=ids)}
+        if cached:
+            object_labels.set_many(found)
+        labels.update(found)
+    return labels
+
+
+def get_object_details(model, instance_ids, labels=None):
     """
     Return string representations of instances based on their model and IDs.
     """
+    if labels is not None:
+        try:
+            apps.get_model(model)
+        except LookupError:
+            return f"Unknown objects of type {model}"
+        return [labels[(model, id)] for id in instance_ids if (model, id) in labels]
+
     try:
         model = apps.get_model(model)
         objects = model.objects.filter(id__in=instance_ids)
@@ -1,52 +1,71 @@
 from django.contrib.auth import get_user_model
+from django.db.models import prefetch_related_objects
 
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.decorators import action
-from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet, ViewSet
+from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.response import Response
 from django_filters import rest_framework as filters
 
-from .mixins import LoggingMixin
+from core.pagination import FeedPagination, FeedPageNumberPagination, ItemPagination
+from core.mixins import CachedListMixin, ConditionalListMixin, TypeaheadMixin
+
+from .mixins import LoggingMixin, ItemListMixin
 from .models import Domain, Priority, Status, Project, Task, Subtask
 from .models import Comment, Attachment, Activity
 
-from .permissions import IsOwnerOrReadOnly
+from .permissions import IsOwnerOrReadOnly, IsDomainMember
+from .sync import get_changes, decode_cursor, DEFAULT_LIMIT, MAX_LIMIT
+from .membership import filter_by_item_domains, has_item
+from .archive import get_archived_activities
+from .bulk import BulkItemMixin
+from .export import ExportMixin
+from .search import FullTextSearchFilter
+from . import search
 
 from .serializers import DomainDropdownSerializer, PriorityDropdownSerializer, StatusDropdownSerializer
 from .serializers import ProjectSerializer, TaskSerializer, SubtaskSerializer
-from .serializers import CommentSerializer, AttachmentSerializer, ActivitySerializer
+from .serializers import CommentSerializer, AttachmentSerializer, ActivitySerializer, SearchIndexSerializer
+
+
+# `?search=` matches substrings, `?fulltext=` words through the full-text index of `pm.search`
+ITEM_FILTER_BACKENDS = [filters.DjangoFilterBackend, SearchFilter, FullTextSearchFilter, OrderingFilter]
 
 
-class DomainDropdownViewSet(ReadOnlyModelViewSet):
+class DomainDropdownViewSet(CachedListMixin, TypeaheadMixin, ReadOnlyModelViewSet):
 
-    queryset = Domain.objects.all()
+    queryset = Domain.objects.only("id", "label")
     serializer_class = DomainDropdownSerializer
     permission_classes = [IsAuthenticated]
 
 
-class ProjectDropdownViewSet(ReadOnlyModelViewSet):
+class ProjectDropdownViewSet(CachedListMixin, TypeaheadMixin, ReadOnlyModelViewSet):
 
-    queryset = Project.objects.all()
+    queryset = Project.objects.only("id", "label")
     serializer_class = DomainDropdownSerializer
     permission_classes = [IsAuthenticated]
+    typeahead_filters = {"domain": "domain"}
 
 
-class TaskDropdownViewSet(ReadOnlyModelViewSet):
+class TaskDropdownViewSet(CachedListMixin, TypeaheadMixin, ReadOnlyModelViewSet):
 
-    queryset = Task.objects.all()
+    queryset = Task.objects.only("id", "label")
     serializer_class = DomainDropdownSerializer
     permission_classes = [IsAuthenticated]
+    typeahead_filters = {"domain": "project__domain", "project": "project"}
+    cached_list_dependencies = (Project,)
 
 
-class PriorityDropdownViewSet(ReadOnlyModelViewSet):
+class PriorityDropdownViewSet(CachedListMixin, ReadOnlyModelViewSet):
 
     queryset = Priority.objects.all()
     serializer_class = PriorityDropdownSerializer
     permission_classes = [IsAuthenticated]
 
 
-class StatusDropdownViewSet(ReadOnlyModelViewSet):
+class StatusDropdownViewSet(CachedListMixin, ReadOnlyModelViewSet):
 
     queryset = Status.objects.all()
     serializer_class = StatusDropdownSerializer
@@ -58,12 +77,15 @@ class ProjectFilter(filters.FilterSet):
     FilterSet for Project model
     """
 
+    min_task_count = filters.NumberFilter(field_name="task_count", lookup_expr="gte")
+    min_comment_count = filters.NumberFilter(field_name="comment_count", lookup_expr="gte")
+
     class Meta:
         model = Project
         fields = ["title", "start_date", "end_date", "status", "priority"]
 
 
-class ProjectViewSet(LoggingMixin, ModelViewSet):
+class ProjectViewSet(LoggingMixin, ItemListMixin, ExportMixin, ModelViewSet):
     """
     ViewSet for handling CRUD operations on Project model instances.
     Incorporates automatic logging of changes during updates via LoggingMixin,
@@ -75,6 +97,7 @@ class ProjectViewSet(LoggingMixin, ModelViewSet):
 
     # lookup_field = "uuid"
 
+    filter_backends = ITEM_FILTER_BACKENDS
     filterset_class = ProjectFilter
     # Fields that can be searched using ?search=query
     search_fields = ["title", "description"]
@@ -82,27 +105,23 @@ class ProjectViewSet(LoggingMixin, ModelViewSet):
     ordering = ["-priority", "end_date", "status"]
 
     def get_queryset(self):
-        current_user = self.request.user
-        queryset = Project.objects.filter(domain__in=current_user.domain_membership.all())
-        return queryset
+        return Project.objects.for_user(self.request.user).for_serializer()
 
     @action(detail=True, methods=["get"])
     def tasks(self, request, pk=None):
         project = self.get_object()
-        tasks = Task.objects.filter(project=project)
-        serializer = TaskSerializer(tasks, many=True)
-        return Response(serializer.data)
+        tasks = Task.objects.filter(project=project).for_serializer()
+        return self.get_item_list_response(tasks, TaskSerializer)
 
     @action(detail=False, methods=["get"], url_path="priority/choices")
     def priority_choices(self, request):
-        choices = Project._meta.get_field("priority").choices
-        formatted_choices = [{"value": choice[0], "label": choice[1]} for choice in choices]
+        # Priority is a foreign key, so its choices are the rows of the lookup table
+        formatted_choices = [{"value": priority.id, "label": priority.title} for priority in Priority.objects.all()]
         return Response(formatted_choices)
 
     @action(detail=False, methods=["get"], url_path="status/choices")
     def status_choices(self, request):
-        choices = Project._meta.get_field("status").choices
-        formatted_choices = [{"value": choice[0], "label": choice[1]} for choice in choices]
+        formatted_choices = [{"value": status.id, "label": status.title} for status in Status.objects.all()]
         return Response(formatted_choices)
 
 
@@ -117,73 +136,91 @@ class TaskFilter(filters.FilterSet):
         queryset=User.objects.all(),
         null_label="Unassigned",  # Allows filtering for null values
     )
+    min_subtask_count = filters.NumberFilter(field_name="subtask_count", lookup_expr="gte")
+    min_comment_count = filters.NumberFilter(field_name="comment_count", lookup_expr="gte")
 
     class Meta:
         model = Task
         fields = ["title", "description", "assigned_to", "status", "priority"]
 
 
-class TaskViewSet(LoggingMixin, ModelViewSet):
+class TaskViewSet(LoggingMixin, ItemListMixin, BulkItemMixin, ExportMixin, ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ItemPagination
 
+    filter_backends = ITEM_FILTER_BACKENDS
     filterset_class = TaskFilter
     search_fields = ["title", "description"]
-    ordering_fields = ["title", "start_date", "end_date", "status", "priority"]
-    ordering = ["-priority", "end_date", "status"]
+    ordering_fields = [
+        "title",
+        "start_date",
+        "end_date",
+        "status",
+        "priority",
+        "comment_count",
+        "attachment_count",
+        "subtask_count",
+    ]
+    ordering = ["-priority", "end_date", "status", "id"]
+
+    def get_queryset(self):
+        # Only the tasks of the current user's domains
+        return Task.objects.for_user(self.request.user).for_serializer()
 
     @action(detail=False, methods=["get"])
     def current_user_domain(self, request):
         # Get all tasks that belong to any of the current user's domains
-        user = request.user
+        tasks = Task.objects.for_user(request.user)
 
         # Get the 'assigned_to' parameter from the URL
         assigned_to = request.query_params.get("assigned_to")
-        tasks = Task.objects.filter(project__domain__in=user.domain_membership.all())
 
         # Further filter by 'assigned_to' of task and subtasks if provided
         if assigned_to:
-            tasks = Task.objects.assigned_to_user(assigned_to)
+            tasks = tasks.assigned_to_user(assigned_to)
 
-        serializer = self.get_serializer(tasks, many=True)
-        return Response(serializer.data)
+        return self.get_item_list_response(tasks.for_serializer())
 
     @action(detail=False, methods=["get"])
     def me(self, request):
-        # Get tasks assigned to the current user
+        # Get tasks assigned to the current user, paginated only when a page is asked for
         user = request.user
-        queryset = Task.objects.assigned_to_user(user.id)
-        filtered_queryset = self.filter_queryset(queryset)
-        serializer = self.get_serializer(filtered_queryset, many=True)
-        return Response(serializer.data)
+        queryset = Task.objects.for_user(user).assigned_to_user(user.id).for_serializer()
+        return self.get_item_list_response(self.filter_queryset(queryset), always_paginate=False)
 
     @action(detail=True, methods=["get"])
     def subtasks(self, request, pk=None):
         task = self.get_object()
-        subtasks = Subtask.objects.filter(task=task)
-        serializer = SubtaskSerializer(subtasks, many=True)
-        return Response(serializer.data)
+        subtasks = Subtask.objects.filter(task=task).for_serializer()
+        return self.get_item_list_response(subtasks, SubtaskSerializer)
 
 
-class SubtaskViewSet(LoggingMixin, ModelViewSet):
+class SubtaskViewSet(LoggingMixin, ItemListMixin, BulkItemMixin, ExportMixin, ModelViewSet):
     queryset = Subtask.objects.all()
     serializer_class = SubtaskSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ItemPagination
+    filter_backends = ITEM_FILTER_BACKENDS
+
+    def get_queryset(self):
+        # Only the subtasks of the current user's domains
+        return Subtask.objects.for_user(self.request.user).for_serializer()
 
     @action(detail=False, methods=["get"])
     def current_user(self, request):
         # Get subtasks assigned to the current user
-        user = request.user
-        subtasks = Subtask.objects.filter(assigned_to=user)
-        serializer = self.get_serializer(subtasks, many=True)
-        return Response(serializer.data)
+        subtasks = self.get_queryset().filter(assigned_to=request.user)
+        return self.get_item_list_response(subtasks)
 
 
-class CommentViewSet(LoggingMixin, ModelViewSet):
+class CommentViewSet(LoggingMixin, ConditionalListMixin, ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
-    permission_classes = [IsOwnerOrReadOnly]
+    permission_classes = [IsOwnerOrReadOnly, IsDomainMember]
+    # Deleted rows do not move the last modification time of the rows left
+    conditional_namespaces = ("pm.comment",)
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -199,10 +236,12 @@ class CommentViewSet(LoggingMixin, ModelViewSet):
         return queryset
 
 
-class AttachmentViewSet(LoggingMixin, ModelViewSet):
+class AttachmentViewSet(LoggingMixin, ConditionalListMixin, ModelViewSet):
     queryset = Attachment.objects.all()
     serializer_class = AttachmentSerializer
-    permission_classes = [IsOwnerOrReadOnly]
+    permission_classes = [IsOwnerOrReadOnly, IsDomainMember]
+    # Deleted rows do not move the last modification time of the rows left
+    conditional_namespaces = ("pm.attachment",)
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -218,29 +257,13 @@ class AttachmentViewSet(LoggingMixin, ModelViewSet):
         return queryset
 
 
-class ActivityPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = "page_size"
-    max_page_size = 100
-
-    def get_paginated_response(self, data):
-        return Response(
-            {
-                "count": self.page.paginator.count,
-                "num_pages": self.page.paginator.num_pages,
-                "number": self.page.number,
-                "next": self.page.next_page_number() if self.page.has_next() else None,
-                "previous": self.page.previous_page_number() if self.page.has_previous() else None,
-                "results": data,
-            }
-        )
-
-
-class ActivityViewSet(ReadOnlyModelViewSet):
-    queryset = Activity.objects.all()
+class ActivityViewSet(ConditionalListMixin, ExportMixin, ReadOnlyModelViewSet):
+    queryset = Activity.objects.select_related("content_type").prefetch_related("content_object")
     serializer_class = ActivitySerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = ActivityPagination
+    pagination_class = FeedPagination
+    # Activities are never modified
+    last_modified_field = "created_at"
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -250,13 +273,81 @@ class ActivityViewSet(ReadOnlyModelViewSet):
             queryset = queryset.filter(content_type=content_type, object_id=object_id)
         return queryset
 
-    def paginate_queryset(self, queryset):
-        content_type = self.request.query_params.get("content_type")
-        object_id = self.request.query_params.get("object_id")
+    def get_export_queryset(self):
+        # The export is not paginated, only the history of the items of the user's domains is exported
+        return filter_by_item_domains(super().get_export_queryset(), self.request.user)
 
-        # Skip pagination if content_type and object_id are present
-        if content_type and object_id:
-            return None
+    @action(detail=False, methods=["get"])
+    def archived(self, request):
+        """
+        Activities of the item given by `content_type` and `object_id` moved to
+        the archive files by the `archive_activities` command, newest first, by
+        pages (`?page=`) since an item may have a long history.
+        """
+        try:
+            content_type = int(request.query_params["content_type"])
+            object_id = int(request.query_params["object_id"])
+        except (KeyError, ValueError):
+            raise ValidationError({"detail": "Integer content_type and object_id are required."})
+
+        if not has_item(request.user, content_type, object_id):
+            raise NotFound()
+
+        paginator = FeedPageNumberPagination()
+        activities = paginator.paginate_queryset(get_archived_activities(content_type, object_id), request, view=self)
+        prefetch_related_objects(activities, "content_type", "content_object")
+        return paginator.get_paginated_response(self.get_serializer(activities, many=True).data)
+
+
+class SyncViewSet(ViewSet):
+    """
+    Items of the current user's domains changed since the `since` cursor, see `pm.sync`.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        since = request.query_params.get("since")
+        try:
+            cursor = decode_cursor(since) if since else None
+        except ValueError:
+            raise ValidationError({"since": "Invalid cursor."})
+
+        try:
+            limit = min(max(int(request.query_params.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({"limit": "A valid integer is required."})
+
+        return Response(get_changes(request.user, cursor, limit, context={"request": request}))
+
+
+class SearchViewSet(ViewSet):
+    """
+    Projects, tasks, subtasks and comments of the current user's domains matching
+    the `q` query, best first, see `pm.search`. `type` limits the results to some
+    of these types, separated by commas.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "This parameter is required."})
+
+        models = None
+        if request.query_params.get("type"):
+            types = {model._meta.model_name: model for model in search.INDEXED_FIELDS}
+            try:
+                models = [types[name] for name in request.query_params["type"].split(",")]
+            except KeyError:
+                raise ValidationError({"type": f"Expected some of {', '.join(types)}."})
+
+        try:
+            limit = min(max(int(request.query_params.get("limit", search.DEFAULT_LIMIT)), 1), search.MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({"limit": "A valid integer is required."})
+
+        entries = search.search(request.user, query, models, limit)
+        return Response(SearchIndexSerializer(entries, many=True).data)
 
-        # Otherwise, paginate as usual
-        return super().paginate_queryset(queryset)